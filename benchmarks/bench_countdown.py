@@ -0,0 +1,58 @@
+"""
+Teleport countdown message cost, building every message with the server handler versus filling a cached command
+
+Usage: python benchmarks/bench_countdown.py [--players 100] [--seconds 5] [--version 1.21.5]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcdreforged.api.rtext import RText, RTextList, RColor, RAction
+from mcdreforged.handler.impl.vanilla_handler import VanillaHandler
+from mcdreforged.info_reactor.server_information import ServerInformation
+
+from lazybing_thb.message_cache import MessageTemplateCache, SENTINEL_FORMAT, PLAYER_SENTINEL
+
+
+def build_countdown(value) -> RTextList:
+    # Same shape as the tpa.countdown message
+    return RTextList(
+        RText('Teleporting in '),
+        RText(value, RColor.gold).h('Click to cancel').c(RAction.run_command, '!!tpc'),
+        RText(' seconds')
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=100)
+    parser.add_argument('--seconds', type=int, default=5)
+    parser.add_argument('--version', default='1.21.5', help='Minecraft version reported to the server handler')
+    args = parser.parse_args()
+
+    handler = VanillaHandler()
+    info = ServerInformation()
+    info.version = args.version
+    players = [f'Player{index}' for index in range(args.players)]
+    sends = [(player, value) for value in range(args.seconds, 0, -1) for player in players]
+
+    started = time.perf_counter()
+    built = [handler.get_send_message_command(player, build_countdown(str(value)), info) for player, value in sends]
+    uncached = time.perf_counter() - started
+
+    started = time.perf_counter()
+    template = handler.get_send_message_command(PLAYER_SENTINEL, build_countdown(SENTINEL_FORMAT.format(0)), info)
+    filled = [MessageTemplateCache.fill(template, player, value) for player, value in sends]
+    cached = time.perf_counter() - started
+
+    assert filled == built, 'Cached commands differ from commands built by the server handler'
+    print(f'{len(sends)} countdown messages ({args.players} players x {args.seconds} seconds)')
+    print(f'server handler: {uncached * 1e6 / len(sends):.1f} us/message')
+    print(f'cached command: {cached * 1e6 / len(sends):.1f} us/message ({uncached / cached:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
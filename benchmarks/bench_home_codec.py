@@ -0,0 +1,99 @@
+"""
+Loading home files with the generic MCDR serializer versus the schema-specialised codec, and building the home index
+
+Usage: python benchmarks/bench_home_codec.py [--files 10000] [--homes 3]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcdreforged.api.utils import deserialize
+
+from lazybing_thb.location import Location
+from lazybing_thb.storage import codec
+from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
+from lazybing_thb.storage.home_index import HomeIndex
+from lazybing_thb.storage.record import LocationRecord
+from lazybing_thb.storage.schema import HOME_SCHEMA
+
+
+class BenchHomeStorage(AbstractPlayerStorage):
+    root = None
+
+    @classmethod
+    def get_folder_name(cls):
+        return 'home'
+
+    @classmethod
+    def get_storage_root(cls):
+        return cls.root
+
+
+def write_files(folder: str, file_count: int, home_count: int) -> None:
+    rnd = random.Random(0)
+    for index in range(file_count):
+        homes = {
+            f'home{number}': Location(
+                x=rnd.uniform(-30000, 30000), y=rnd.uniform(-64, 320), z=rnd.uniform(-30000, 30000),
+                dim=rnd.choice([0, -1, 1, 'minecraft:overworld', 'minecraft:the_nether'])
+            ) for number in range(home_count)
+        }
+        with open(os.path.join(folder, f'Player{index}.json'), 'w', encoding='utf8') as f:
+            records = {name: LocationRecord.from_location(location) for name, location in homes.items()}
+            f.write(codec.dumps(HOME_SCHEMA.wrap(codec.encode_home_records(records))))
+
+
+def load_all(folder: str, decode) -> float:
+    started = time.perf_counter()
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.endswith('.json'):
+                with open(entry.path, 'r', encoding='utf8') as f:
+                    decode(HOME_SCHEMA.unwrap(json.load(f))[0])
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--homes', type=int, default=3, help='Homes per file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        BenchHomeStorage.root = root
+        folder = BenchHomeStorage.get_folder_path()
+        os.makedirs(folder)
+        write_files(folder, args.files, args.homes)
+
+        # Warm up the page cache, so that both paths read from memory
+        load_all(folder, lambda data: data)
+        generic = load_all(folder, lambda data: deserialize(data, Dict[str, Location]))
+        specialised = load_all(folder, codec.decode_home_records)
+
+        index = HomeIndex()
+        started = time.perf_counter()
+        # Run the scan on this thread instead of the builder thread
+        HomeIndex.build.original(index, BenchHomeStorage)
+        indexed = time.perf_counter() - started
+        players, homes = index.get_summary()
+
+        with open(os.path.join(folder, 'Player0.json'), 'r', encoding='utf8') as f:
+            sample = json.load(f)
+        compact, indented = len(codec.dumps(sample)), len(codec.dumps(sample, indent=4))
+
+    print(f'{args.files} home files, {args.homes} homes each')
+    print(f'generic serializer: {generic:.3f} s ({generic * 1e6 / args.files:.1f} us/file)')
+    print(f'specialised codec:  {specialised:.3f} s ({specialised * 1e6 / args.files:.1f} us/file, {generic / specialised:.1f}x)')
+    print(f'home index build:   {indexed:.3f} s, {players} players, {homes} homes')
+    print(f'one home file: {compact} bytes compact, {indented} bytes with indent=4')
+
+
+if __name__ == '__main__':
+    main()
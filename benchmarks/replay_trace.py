@@ -0,0 +1,343 @@
+"""
+Replaying a recorded command trace against the plugin outside MCDR, at a multiple of its recorded speed
+
+The server and minecraft data api are stubbed, every query and command is answered after a simulated latency.
+The plugin runs in this process only, with its own MDA gateway, event bus and request queues,
+on a temporary data folder, so replays never reach a live server, its players or its files
+
+Usage: python benchmarks/replay_trace.py <trace file> [--speed 1] [--latency 0.005] [--data-folder <folder>]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+from typing import Optional, List, Dict, Iterable, Iterator, NamedTuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def stub_minecraft_data_api():
+    # The stub transport answers every query, the plugin only needs the module to be importable
+    try:
+        import minecraft_data_api
+    except ImportError:
+        module = types.ModuleType('minecraft_data_api')
+        module.get_player_coordinate = module.get_player_dimension = module.get_server_player_list = None
+        sys.modules['minecraft_data_api'] = module
+
+
+stub_minecraft_data_api()
+
+from mcdreforged.api.rtext import RTextMCDRTranslation
+from mcdreforged.info_reactor.server_information import ServerInformation
+
+import lazybing_thb
+from lazybing_thb.async_loop import PluginEventLoop
+from lazybing_thb.command_trace import get_handler
+from lazybing_thb.event_bus import ThbEvents, EventBus
+from lazybing_thb.mda_gateway import MDAGateway
+from lazybing_thb.player_list import PlayerOnlineList
+from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
+from lazybing_thb.storage.config import Configuration
+from lazybing_thb.transport import Transport, Coordinate, Dimension, PlayerList, set_transport_override
+from lazybing_thb.utils import logger
+
+DRAIN_TIMEOUT = 30  # seconds
+
+
+class TraceRecord(NamedTuple):
+    offset: float
+    command: str
+    player: str
+    args: list
+    kwargs: dict
+
+
+class ReplayMetadata:
+    id = 'lazybing_thb'
+    name = 'LazyBing THB'
+    version = 'replay'
+
+
+class ReplayServer:
+    """
+    Stand-in of the plugin server interface, messages sent to players are counted instead of sent
+    """
+    def __init__(self, data_folder: str):
+        self.data_folder = data_folder
+        self.logger = logging.getLogger('lazybing_thb.replay')
+        self.__lock = threading.Lock()
+        self.told = 0
+
+    def count_message(self):
+        with self.__lock:
+            self.told += 1
+
+    def get_data_folder(self) -> str:
+        return self.data_folder
+
+    def get_self_metadata(self) -> ReplayMetadata:
+        return ReplayMetadata()
+
+    def get_mcdr_language(self) -> str:
+        return 'en_us'
+
+    def get_mcdr_config(self) -> dict:
+        return {}
+
+    def get_server_information(self) -> ServerInformation:
+        return ServerInformation()
+
+    def is_server_startup(self) -> bool:
+        return True
+
+    def is_on_executor_thread(self) -> bool:
+        return False
+
+    def rtr(self, translation_key: str, *args, **kwargs) -> RTextMCDRTranslation:
+        return RTextMCDRTranslation(translation_key, *args, **kwargs)
+
+    def tr(self, translation_key: str, *args, **kwargs) -> str:
+        return translation_key
+
+    def tell(self, player: str, message) -> None:
+        self.count_message()
+
+    def register_command(self, *args, **kwargs) -> None:
+        pass
+
+    def register_help_message(self, *args, **kwargs) -> None:
+        pass
+
+    def register_event_listener(self, *args, **kwargs) -> None:
+        pass
+
+    def dispatch_event(self, *args, **kwargs) -> None:
+        pass
+
+
+class StubTransport(Transport):
+    """
+    Answers every query with a fixed position per player and accepts every command, after a simulated latency
+    Queries still pass the MDA gateway, so its admission and queueing behave as with a real server
+    """
+    def __init__(self, players: Iterable[str], latency: float):
+        self.__players = list(players)
+        self.__latency = latency
+        self.__lock = threading.Lock()
+        self.__command_count = 0
+
+    @property
+    def command_count(self) -> int:
+        return self.__command_count
+
+    def __respond(self, value, *, timeout: Optional[float] = None):
+        time.sleep(self.__latency if timeout is None else min(self.__latency, timeout))
+        return value
+
+    def get_coordinate(self, player: str) -> Coordinate:
+        seed = hashlib.md5(player.encode('utf8')).digest()
+        coordinate = (float(seed[0] * 16), 64.0, float(seed[1] * 16))
+        return MDAGateway.get_instance().query(self.__respond, coordinate)
+
+    def get_dimension(self, player: str) -> Dimension:
+        return MDAGateway.get_instance().query(self.__respond, 0)
+
+    def get_player_list(self) -> PlayerList:
+        return MDAGateway.get_instance().query(self.__respond, (len(self.__players), 20, list(self.__players)))
+
+    def execute(self, command: str) -> None:
+        self.__respond(None)
+        with self.__lock:
+            self.__command_count += 1
+
+
+class ReplaySource:
+    """
+    Stand-in of the player command source, replies are counted instead of sent
+    """
+    def __init__(self, player: str, server: ReplayServer):
+        self.player = player
+        self.__server = server
+
+    @property
+    def is_player(self) -> bool:
+        return True
+
+    def has_permission(self, level: int) -> bool:
+        return True
+
+    def reply(self, message, **kwargs):
+        self.__server.count_message()
+
+
+class ReplayReport(NamedTuple):
+    records: int
+    skipped: int
+    duration: float
+    # Percentiles in milliseconds
+    handler_latency: Dict[str, float]
+    teleport_latency: Dict[str, float]
+    schedule_lag: Dict[str, float]
+    peak_flows: int
+    peak_mda_waiting: int
+    commands: int
+    messages: int
+    io: Dict[str, int]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if len(values) == 0:
+        return {}
+    values = sorted(values)
+    result = {}
+    for name, ratio in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        result[name] = round(values[min(int(len(values) * ratio), len(values) - 1)] * 1000, 2)
+    result['max'] = round(values[-1] * 1000, 2)
+    return result
+
+
+def read_trace(path: str) -> Iterator[TraceRecord]:
+    with open(path, 'r', encoding='utf8') as f:
+        for line in f:
+            if line.strip() == '':
+                continue
+            item = json.loads(line)
+            yield TraceRecord(
+                float(item['t']), item['cmd'], item['player'], list(item.get('args', [])), dict(item.get('kwargs', {}))
+            )
+
+
+def install(server: ReplayServer, config: Configuration):
+    # Plugin modules bind the server interface and configuration when imported, both are None outside MCDR
+    for name, module in list(sys.modules.items()):
+        if name == 'lazybing_thb' or name.startswith('lazybing_thb.'):
+            if hasattr(module, 'psi'):
+                module.psi = server
+            if hasattr(module, 'config'):
+                module.config = config
+
+
+class TraceReplayer:
+    def __init__(self, server: ReplayServer, transport: StubTransport, config: Configuration):
+        self.__server = server
+        self.__transport = transport
+        self.__config = config
+        self.__lock = threading.Lock()
+        self.__teleport_started: Dict[str, float] = {}
+        self.__teleport_latencies: List[float] = []
+
+    def __on_pre_teleport(self, player: str, destination):
+        with self.__lock:
+            self.__teleport_started[player] = time.monotonic()
+
+    def __on_post_teleport(self, player: str, destination):
+        with self.__lock:
+            started = self.__teleport_started.pop(player, None)
+            if started is not None:
+                self.__teleport_latencies.append(time.monotonic() - started)
+
+    def run(self, records: List[TraceRecord], speed: float) -> ReplayReport:
+        bus = EventBus.get_instance()
+        bus.subscribe(ThbEvents.PRE_TELEPORT, self.__on_pre_teleport)
+        bus.subscribe(ThbEvents.POST_TELEPORT, self.__on_post_teleport)
+        io_before = AbstractPlayerStorage.get_io_statistics()
+        handler_latencies, schedule_lags = [], []
+        skipped, peak_flows, peak_waiting = 0, 0, 0
+        started = time.monotonic()
+        for record in records:
+            handler = get_handler(record.command)
+            if handler is None:
+                skipped += 1
+                continue
+            scheduled = started + record.offset / speed
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            dispatched = time.monotonic()
+            schedule_lags.append(max(dispatched - scheduled, 0))
+            try:
+                handler(ReplaySource(record.player, self.__server), *record.args, **record.kwargs)
+            except Exception as exc:
+                logger.exception(f'Error replaying command {record.command}', exc_info=exc)
+            handler_latencies.append(time.monotonic() - dispatched)
+            peak_flows = max(peak_flows, PluginEventLoop.get_instance().flow_count)
+            peak_waiting = max(peak_waiting, MDAGateway.get_instance().waiting)
+        deadline = time.monotonic() + self.__config.teleport_delay + DRAIN_TIMEOUT
+        while PluginEventLoop.get_instance().flow_count > 0 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        duration = time.monotonic() - started
+        io_after = AbstractPlayerStorage.get_io_statistics()
+        with self.__lock:
+            teleport_latencies = list(self.__teleport_latencies)
+        return ReplayReport(
+            records=len(records), skipped=skipped, duration=round(duration, 2),
+            handler_latency=percentiles(handler_latencies),
+            teleport_latency=percentiles(teleport_latencies),
+            schedule_lag=percentiles(schedule_lags),
+            peak_flows=peak_flows, peak_mda_waiting=peak_waiting,
+            commands=self.__transport.command_count, messages=self.__server.told,
+            io={key: io_after[key] - io_before[key] for key in io_after.keys()}
+        )
+
+
+def format_percentiles(values: Dict[str, float]) -> str:
+    if len(values) == 0:
+        return '-'
+    return ' / '.join(f'{name} {value}ms' for name, value in values.items())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trace', help='Trace file recorded with "!!home trace start"')
+    parser.add_argument('--speed', type=float, default=1.0, help='Multiple of the recorded speed')
+    parser.add_argument('--latency', type=float, default=0.005, help='Simulated server latency in seconds')
+    parser.add_argument('--data-folder', help='Plugin data folder to start from, it is copied and left untouched')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    # One line per teleport would bury the report
+    logger.setLevel(logging.WARNING)
+
+    records = list(read_trace(args.trace))
+    players = list(dict.fromkeys(record.player for record in records))
+    temp_folder = tempfile.mkdtemp(prefix='thb-replay-')
+    data_folder = os.path.join(temp_folder, 'data')
+    if args.data_folder is not None:
+        shutil.copytree(args.data_folder, data_folder)
+    server = ReplayServer(data_folder)
+    config = Configuration.get_default()
+    # No server handler outside MCDR to render message templates with
+    config.message_cache = False
+    install(server, config)
+
+    transport = StubTransport(players, args.latency)
+    set_transport_override(transport)
+    try:
+        lazybing_thb.on_load(server, None)
+        PlayerOnlineList.get_instance().add(*players)
+        report = TraceReplayer(server, transport, config).run(records, args.speed)
+    finally:
+        lazybing_thb.on_unload(server)
+        set_transport_override(None)
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+    print(f'{report.records} records ({report.skipped} skipped) of {len(players)} players '
+          f'replayed at {args.speed}x in {report.duration}s')
+    print(f'handler latency:  {format_percentiles(report.handler_latency)}')
+    print(f'teleport latency: {format_percentiles(report.teleport_latency)}')
+    print(f'scheduling lag:   {format_percentiles(report.schedule_lag)}')
+    print(f'peak running flows {report.peak_flows}, peak queued server queries {report.peak_mda_waiting}')
+    print(f"storage read {report.io['read_files']} files ({report.io['read_bytes']} bytes), "
+          f"written {report.io['written_files']} files ({report.io['written_bytes']} bytes)")
+    print(f'{report.commands} server commands, {report.messages} messages to players')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,21 +6,58 @@ from lazybing_thb.core import register_command
 from lazybing_thb.storage.impl.request import TeleportRequest
 from lazybing_thb.storage.impl.history import TeleportHistory
 from lazybing_thb.storage.impl.home import PlayerHomeStorage
-from lazybing_thb.timer import RequestTimer
+from lazybing_thb.storage.impl.warp import WarpStorage
+from lazybing_thb.storage.home_index import HomeIndex
+from lazybing_thb.timer import RequestQueue
 from lazybing_thb.player_list import PlayerOnlineList
-
-
-PlayerOnlineList.get_instance().register_event_listeners()
+from lazybing_thb.command_batcher import CommandBatcher
+from lazybing_thb.transport import close_transport
+from lazybing_thb.storage.sweeper import HistorySweeper
+from lazybing_thb.storage.history_writer import HistoryWriter
+from lazybing_thb.storage.migrator import SchemaMigrator
+from lazybing_thb.storage.layout_migrator import LayoutMigrator
+from lazybing_thb.event_bus import EventBus
+from lazybing_thb.profiler import StackSampler
+from lazybing_thb.census import ResourceCensus
+from lazybing_thb.command_trace import TraceRecorder
+from lazybing_thb.async_loop import PluginEventLoop
+# Public API, exposed via PluginServerInterface.get_plugin_instance
+from lazybing_thb.api import *
 
 
 def on_unload(server: PluginServerInterface):
-    RequestTimer.remove_all()
+    RequestQueue.remove_all()
+    PluginEventLoop.get_instance().stop()
+    HistoryWriter.get_instance().stop()
+    CommandBatcher.get_instance().stop()
+    close_transport()
+    HistorySweeper.get_instance().stop()
+    SchemaMigrator.get_instance().stop()
+    LayoutMigrator.get_instance().stop()
+    PlayerOnlineList.get_instance().stop_reconciler()
+    EventBus.get_instance().clear()
+    StackSampler.get_instance().stop()
+    ResourceCensus.get_instance().stop()
+    TraceRecorder.get_instance().stop()
 
 
 def on_load(server: PluginServerInterface, prev_module):
     TeleportRequest.remove_all_files()
     TeleportHistory.resolve_dir()
     PlayerHomeStorage.resolve_dir()
+    WarpStorage.resolve_dir()
+    HomeIndex.get_instance().build(PlayerHomeStorage)
+    WarpStorage.get_storage().preload()
+
+    PlayerOnlineList.get_instance().register_event_listeners(server)
+    PlayerOnlineList.get_instance().init_player_list()
+    HistorySweeper.get_instance().start()
+    ResourceCensus.get_instance().start()
+    SchemaMigrator.get_instance().start()
+    LayoutMigrator.get_instance().start()
+    PlayerOnlineList.get_instance().start_reconciler()
+    if config.trace.enabled:
+        TraceRecorder.get_instance().start()
 
     register_command()
     server.register_help_message(config.command_prefix.help_message_prefix, rtr('help.mcdr'))
@@ -0,0 +1,129 @@
+"""
+Public in-process API for other MCDR plugins
+
+Usage:
+    thb = server.get_plugin_instance('lazybing_thb')
+    thb.subscribe(thb.ThbEvents.POST_TELEPORT, lambda player, destination: ...)
+    thb.teleport_player_to_location_async('Steve', thb.Location(x=0, y=64, z=0, dim=0))
+
+Blocking functions must not be called from the MCDR task executor thread or from the plugin event loop thread,
+use the *_async variants there, or wrap the call with run_async
+PRE_TELEPORT and POST_TELEPORT listeners are called on a plugin worker thread, never on the event loop thread
+"""
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from lazybing_thb.async_loop import PluginEventLoop
+from lazybing_thb.event_bus import ThbEvents, EventBus
+from lazybing_thb.location import Location, History
+from lazybing_thb.storage.config import config
+from lazybing_thb.storage.impl.history import TeleportHistory
+from lazybing_thb.storage.impl.home import PlayerHomeStorage
+from lazybing_thb.teleport import teleport_to_location, teleport_to_player
+from lazybing_thb.utils import named_thread, psi
+
+__all__ = [
+    'ThbEvents', 'Location', 'History',
+    'subscribe', 'unsubscribe', 'run_async',
+    'teleport_player_to_location', 'teleport_player_to_location_async',
+    'teleport_player_to_player', 'teleport_player_to_player_async',
+    'get_homes', 'get_home', 'set_home', 'remove_home', 'get_history'
+]
+
+
+def _ensure_blocking_allowed():
+    if psi.is_on_executor_thread():
+        raise RuntimeError('Blocking API is not allowed on the task executor thread, use the async variant instead')
+    if PluginEventLoop.get_instance().is_loop_thread():
+        # The teleport is scheduled on this very thread, waiting for it here never returns
+        raise RuntimeError('Blocking API is not allowed on the plugin event loop thread, use the async variant instead')
+
+
+def subscribe(event: str, callback: Callable) -> None:
+    """
+    Register a listener of a ThbEvents event, the listener is called on the thread dispatching the event
+    Teleport events are dispatched on a plugin worker thread, so listeners may block without stalling other teleports
+    """
+    EventBus.get_instance().subscribe(event, callback)
+
+
+def unsubscribe(event: str, callback: Callable) -> bool:
+    return EventBus.get_instance().unsubscribe(event, callback)
+
+
+def run_async(func: Callable, *args, **kwargs) -> Future:
+    """
+    Run a callable in a plugin thread, the returned Future holds its result or exception
+    """
+    future = Future()
+
+    @named_thread('Api')
+    def __run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    __run()
+    return future
+
+
+def teleport_player_to_location_async(player: str, location: Location, record_history: bool = True) -> Future:
+    """
+    :return: Future resolved with whether the teleport was executed, cancelled if a player involved leaves
+    """
+    return teleport_to_location(player, location, record_history=record_history)
+
+
+def teleport_player_to_player_async(player: str, target: str, record_history: bool = True) -> Future:
+    """
+    :return: Future resolved with whether the teleport was executed, cancelled if a player involved leaves
+    """
+    return teleport_to_player(player, target, record_history=record_history)
+
+
+def teleport_player_to_location(
+        player: str, location: Location, record_history: bool = True, timeout: Optional[float] = None
+) -> bool:
+    _ensure_blocking_allowed()
+    return teleport_player_to_location_async(player, location, record_history).result(timeout)
+
+
+def teleport_player_to_player(
+        player: str, target: str, record_history: bool = True, timeout: Optional[float] = None
+) -> bool:
+    _ensure_blocking_allowed()
+    return teleport_player_to_player_async(player, target, record_history).result(timeout)
+
+
+def get_homes(player: str) -> Dict[str, Location]:
+    return PlayerHomeStorage.get_instance(player).get_homes()
+
+
+def get_home(player: str, home_name: str) -> Optional[Location]:
+    return PlayerHomeStorage.get_instance(player).get_home(home_name)
+
+
+def set_home(player: str, home_name: str, location: Location) -> bool:
+    """
+    Limited by max_home_count in the config, the same as "!!home add"
+    :return: False if a home with the same name already exists, or the player already has max_home_count homes
+    """
+    home = PlayerHomeStorage.get_instance(player)
+    with home.transaction():
+        if config.is_reached_max_home_amount(len(home.get_data())):
+            return False
+        return home.set_home(home_name, location)
+
+
+def remove_home(player: str, home_name: str) -> bool:
+    """
+    :return: False if the home doesn't exist
+    """
+    return PlayerHomeStorage.get_instance(player).remove_home(home_name)
+
+
+def get_history(player: str) -> Optional[History]:
+    return TeleportHistory.get_instance(player).get_history()
@@ -0,0 +1,137 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict, FrozenSet, Coroutine, Callable, Any
+
+from lazybing_thb.storage.config import config
+from lazybing_thb.utils import logger, named_thread, get_thread_prefix
+
+
+class PluginEventLoop:
+    """
+    Plugin-owned asyncio loop running teleport flows as coroutines on a single thread
+    Flows are tracked by the players involved, so they can be cancelled when one of them leaves
+    Blocking calls (MDA queries, storage writes, console commands) are bridged to a small worker pool by run_blocking
+    """
+    __inst: Optional["PluginEventLoop"] = None
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__thread: Optional[threading.Thread] = None
+        self.__flows: Dict[Future, FrozenSet[str]] = {}
+        self.__stopped = False
+
+    @classmethod
+    def get_instance(cls) -> "PluginEventLoop":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    @property
+    def is_running(self) -> bool:
+        return self.__loop is not None
+
+    @property
+    def flow_count(self) -> int:
+        return len(self.__flows)
+
+    def is_loop_thread(self) -> bool:
+        return self.__thread is not None and threading.current_thread() is self.__thread
+
+    @named_thread('AsyncLoop')
+    def __run(self, loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """
+        :raise RuntimeError: The loop has been stopped, it is not started again once the plugin is unloading
+        """
+        with self.__lock:
+            if self.__stopped:
+                raise RuntimeError('Plugin event loop is stopped')
+            if self.__loop is not None:
+                return self.__loop
+            # Blocking calls are mostly MDA queries, which the gateway admits at most max_in_flight at a time
+            self.__executor = ThreadPoolExecutor(
+                max_workers=max(config.mda_gateway.max_in_flight, 1) + 1,
+                thread_name_prefix=get_thread_prefix() + 'AsyncWorker'
+            )
+            self.__loop = asyncio.new_event_loop()
+            self.__thread = self.__run(self.__loop)
+            return self.__loop
+
+    def stop(self) -> None:
+        with self.__lock:
+            self.__stopped = True
+            loop, thread, executor = self.__loop, self.__thread, self.__executor
+            self.__loop, self.__thread, self.__executor = None, None, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.__shutdown(), loop)
+        thread.join()
+        executor.shutdown(wait=False)
+
+    @staticmethod
+    async def __shutdown():
+        # Let cancelled flows run their cleanup before the loop is closed
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        asyncio.get_running_loop().stop()
+
+    async def run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Await a blocking call executed in the worker pool
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, functools.partial(func, *args, **kwargs))
+
+    def __on_flow_done(self, future: Future):
+        with self.__lock:
+            self.__flows.pop(future, None)
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None:
+            logger.exception('Error running async flow', exc_info=exc)
+
+    def submit(self, coro: Coroutine, *players: str) -> Future:
+        """
+        Schedule a coroutine on the loop from any thread
+        :param players: Players involved in this flow, see cancel
+        :return: Future of the coroutine result, cancelled if the flow is cancelled
+        :raise RuntimeError: The loop has been stopped
+        """
+        try:
+            loop = self.start()
+        except RuntimeError:
+            coro.close()
+            raise
+        # Cancelling this future cancels the task running on the loop as well
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        with self.__lock:
+            self.__flows[future] = frozenset(players)
+        future.add_done_callback(self.__on_flow_done)
+        return future
+
+    def cancel(self, *players: str) -> int:
+        """
+        Cancel running flows involving all given players
+        :return: Amount of cancelled flows
+        """
+        with self.__lock:
+            flows = [future for future, involved in self.__flows.items() if involved.issuperset(players)]
+        return len([future for future in flows if future.cancel()])
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    return await PluginEventLoop.get_instance().run_blocking(func, *args, **kwargs)
+
@@ -0,0 +1,110 @@
+import os
+import threading
+from typing import Dict, Optional
+
+from lazybing_thb.command_batcher import CommandBatcher
+from lazybing_thb.message_cache import MessageTemplateCache
+from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
+from lazybing_thb.storage.background_job import BackgroundJob
+from lazybing_thb.storage.config import config
+from lazybing_thb.storage.history_writer import HistoryWriter
+from lazybing_thb.storage.record import DimensionTable
+from lazybing_thb.timer import RequestQueue
+from lazybing_thb.utils import logger, get_thread_prefix
+
+
+class ResourceCensus(BackgroundJob):
+    """
+    Periodically counts plugin-owned objects, threads and open files, and measures approximate sizes of caches and queues
+    Warns when a count passes its threshold
+    A warning is logged once per crossing, it is logged again only after the count has dropped below the threshold
+    """
+    __inst: Optional["ResourceCensus"] = None
+    thread_name = 'ResourceCensus'
+
+    def __init__(self):
+        super().__init__()
+        self.__exceeded: Dict[str, bool] = {}
+
+    @classmethod
+    def get_instance(cls) -> "ResourceCensus":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    @staticmethod
+    def count_open_files() -> Optional[int]:
+        for fd_folder in ('/proc/self/fd', '/dev/fd'):
+            if os.path.isdir(fd_folder):
+                return len(os.listdir(fd_folder))
+        return None
+
+    @staticmethod
+    def take() -> Dict[str, int]:
+        """
+        :return: Resource name -> live count or approximate size, open files are missing on platforms without a fd folder
+        """
+        result: Dict[str, int] = {}
+        for storage_cls in AbstractPlayerStorage.get_storage_classes():
+            result[f'storage.{storage_cls.__name__}'] = len(storage_cls.get_cached_players())
+            result[f'records.{storage_cls.__name__}'] = storage_cls.count_cached_records()
+        # Interned dimensions are never released, custom dimensions keep adding to it
+        result['interned_dimensions'] = DimensionTable.get_size()
+        queues = RequestQueue.get_queues()
+        result['request_queues'] = len(queues)
+        result['pending_requests'] = sum(len(queue) for queue in queues)
+        result['queued_histories'] = HistoryWriter.get_instance().pending_count
+        result['queued_commands'] = CommandBatcher.get_instance().pending_count
+        result['message_templates'], result['message_template_bytes'] = MessageTemplateCache.get_instance().get_size()
+        prefix = get_thread_prefix()
+        result['threads'] = len([thread for thread in threading.enumerate() if thread.name.startswith(prefix)])
+        result['log_handlers'] = len(logger.handlers)
+        open_files = ResourceCensus.count_open_files()
+        if open_files is not None:
+            result['open_files'] = open_files
+        return result
+
+    @staticmethod
+    def get_threshold(name: str) -> int:
+        thresholds = config.census
+        if name.startswith('storage.'):
+            return thresholds.storage_instances
+        if name.startswith('records.'):
+            return thresholds.records
+        return {
+            'interned_dimensions': thresholds.interned_dimensions,
+            'request_queues': thresholds.request_queues,
+            'pending_requests': thresholds.pending_requests,
+            'queued_histories': thresholds.queued_histories,
+            'queued_commands': thresholds.queued_commands,
+            'message_templates': thresholds.message_templates,
+            'message_template_bytes': thresholds.message_template_bytes,
+            'threads': thresholds.threads,
+            'log_handlers': thresholds.log_handlers,
+            'open_files': thresholds.open_files
+        }.get(name, 0)
+
+    def check(self, counts: Dict[str, int]) -> None:
+        for name, count in counts.items():
+            threshold = self.get_threshold(name)
+            exceeded = 0 < threshold < count
+            if exceeded and not self.__exceeded.get(name, False):
+                logger.warning(
+                    'Resource %s has grown to %d, exceeding threshold %d, this may be a leak', name, count, threshold
+                )
+            self.__exceeded[name] = exceeded
+
+    def is_exceeded(self, name: str) -> bool:
+        return self.__exceeded.get(name, False)
+
+    def is_enabled(self) -> bool:
+        return config.census.interval > 0
+
+    def run(self):
+        while not self.wait(config.census.interval * 60):
+            try:
+                counts = self.take()
+                logger.debug('Resource census: %s', counts)
+                self.check(counts)
+            except Exception as exc:
+                logger.exception('Error occurred while taking resource census', exc_info=exc)
@@ -0,0 +1,158 @@
+import collections
+import threading
+from concurrent.futures import Future
+from typing import Optional, List, Tuple, Dict, Union, Generic, TypeVar, Hashable
+
+from lazybing_thb.storage.config import config
+from lazybing_thb.utils import psi, logger, named_thread
+
+T = TypeVar('T', bound=Hashable)
+
+
+class BatchQueue(Generic[T]):
+    """
+    Items submitted within a short window are gathered by a background thread and flushed together in submission order
+    An item submitted again before being flushed is flushed only once, with a window of 0 items are flushed at once
+    """
+    thread_name: str = 'BatchQueue'
+
+    def __init__(self):
+        self.__condition = threading.Condition(threading.RLock())
+        # Insertion ordered
+        self.__pending: Dict[T, None] = {}
+        self.__running = False
+        self.__thread: Optional[threading.Thread] = None
+        # Cuts the window short when stopping
+        self.__stop_event = threading.Event()
+
+    def get_window(self) -> float:
+        raise NotImplementedError
+
+    def get_max_size(self) -> int:
+        raise NotImplementedError
+
+    def flush_batch(self, batch: List[T]) -> None:
+        raise NotImplementedError
+
+    @property
+    def pending_count(self) -> int:
+        return len(self.__pending)
+
+    def put(self, item: T) -> None:
+        if self.get_window() <= 0:
+            self.flush_batch([item])
+            return
+        with self.__condition:
+            self.__pending[item] = None
+            if not self.__running:
+                self.__running = True
+                self.__stop_event.clear()
+                self.__thread = named_thread(self.thread_name)(self.__flush_loop)()
+            self.__condition.notify_all()
+
+    def __take(self, max_size: Optional[int] = None) -> List[T]:
+        # Condition required
+        batch = list(self.__pending.keys())[:max_size]
+        for item in batch:
+            del self.__pending[item]
+        return batch
+
+    def __flush_loop(self):
+        while True:
+            with self.__condition:
+                while self.__running and len(self.__pending) == 0:
+                    self.__condition.wait()
+                if not self.__running and len(self.__pending) == 0:
+                    return
+            if self.__running:
+                # Gather items submitted during the window
+                self.__stop_event.wait(self.get_window())
+            with self.__condition:
+                batch = self.__take(max(self.get_max_size(), 1))
+            if len(batch) > 0:
+                self.flush_batch(batch)
+
+    def stop(self) -> None:
+        """
+        Flush all pending items and stop the flush thread
+        """
+        with self.__condition:
+            self.__running = False
+            thread, self.__thread = self.__thread, None
+            self.__stop_event.set()
+            self.__condition.notify_all()
+        # The loop drains what is pending, a batch it has already taken must be flushed before the rest
+        if thread is not None:
+            thread.join()
+        with self.__condition:
+            batch = self.__take()
+        if len(batch) > 0:
+            self.flush_batch(batch)
+
+
+class CommandBatcher(BatchQueue[Tuple[str, Future]]):
+    """
+    Output stage gathering console commands issued within a short window and writing them to server stdin together
+    Commands are flushed strictly in submission order, so commands of a single player are never reordered
+    """
+    __inst: Optional["CommandBatcher"] = None
+    thread_name = 'CommandBatcher'
+
+    def __init__(self):
+        super().__init__()
+        self.__statistics_lock = threading.Lock()
+        self.__batch_count = 0
+        self.__command_count = 0
+        self.__max_batch_size = 0
+        self.__size_histogram: Dict[int, int] = collections.Counter()
+
+    @classmethod
+    def get_instance(cls) -> "CommandBatcher":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    def get_window(self) -> float:
+        return config.command_batch.window
+
+    def get_max_size(self) -> int:
+        return config.command_batch.max_size
+
+    def submit(self, command: str) -> Future:
+        future = Future()
+        self.put((command, future))
+        return future
+
+    def execute(self, command: str, timeout: Optional[Union[int, float]] = None) -> None:
+        """
+        Submit a command and block until it is written to server
+        """
+        self.submit(command).result(timeout=timeout)
+
+    def flush_batch(self, batch: List[Tuple[str, Future]]) -> None:
+        try:
+            # MCDR writes the whole text to server stdin at once, one command per line
+            psi.execute('\n'.join(command for command, _ in batch))
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+        else:
+            for _, future in batch:
+                future.set_result(None)
+        with self.__statistics_lock:
+            size = len(batch)
+            self.__batch_count += 1
+            self.__command_count += size
+            self.__max_batch_size = max(self.__max_batch_size, size)
+            self.__size_histogram[size] += 1
+        logger.debug('Flushed %d commands to server', size)
+
+    def get_statistics(self) -> Dict[str, Union[int, float, Dict[int, int]]]:
+        with self.__statistics_lock:
+            return dict(
+                batches=self.__batch_count,
+                commands=self.__command_count,
+                max_batch_size=self.__max_batch_size,
+                mean_batch_size=self.__command_count / self.__batch_count if self.__batch_count > 0 else 0.0,
+                size_histogram=dict(self.__size_histogram)
+            )
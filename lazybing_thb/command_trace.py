@@ -0,0 +1,134 @@
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Optional, Dict, Callable, IO, Tuple
+
+from lazybing_thb.storage.config import config
+from lazybing_thb.utils import psi, logger, ensure_dir
+
+TRACE_FOLDER = 'trace'
+__handlers: Dict[str, Callable] = {}
+
+
+class TraceRecorder:
+    """
+    Opt-in recorder of player command invocations, written as json lines with time offsets since recording started
+    Player, home and warp names are replaced by salted hashes, the salt is never saved,
+    so traces can be shared while names stay consistent within a single trace
+    """
+    __inst: Optional["TraceRecorder"] = None
+    __TOKEN_PATTERN = re.compile(r'[^\s,]+')
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__file: Optional[IO[str]] = None
+        self.__file_name: Optional[str] = None
+        self.__salt = b''
+        self.__started_at = 0.0
+        self.__record_count = 0
+
+    @classmethod
+    def get_instance(cls) -> "TraceRecorder":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    @property
+    def is_recording(self) -> bool:
+        return self.__file is not None
+
+    def pseudonym(self, name: str) -> str:
+        # Kept within 16 characters, so pseudonyms are still valid player names
+        return 'p' + hashlib.blake2b(name.encode('utf8'), digest_size=6, key=self.__salt).hexdigest()
+
+    def anonymise(self, value):
+        if not isinstance(value, str):
+            return value
+        # Every token is hashed the same way, so players referred in arguments match the pseudonym of their source
+        return self.__TOKEN_PATTERN.sub(
+            lambda match: match.group() if match.group().startswith('@') else self.pseudonym(match.group()), value
+        )
+
+    def start(self) -> Optional[str]:
+        """
+        :return: Trace file name, None if the recorder is already running
+        """
+        with self.__lock:
+            if self.is_recording:
+                return None
+            folder = os.path.join(psi.get_data_folder(), TRACE_FOLDER)
+            ensure_dir(folder)
+            self.__salt = os.urandom(16)
+            self.__started_at = time.monotonic()
+            self.__record_count = 0
+            self.__file_name = f"trace-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+            self.__file = open(os.path.join(folder, self.__file_name), 'a', encoding='utf8')
+            logger.info('Command trace recording started, writing to %s', self.__file_name)
+            return self.__file_name
+
+    def stop(self) -> Optional[Tuple[str, int]]:
+        """
+        :return: Trace file name and amount of records, None if the recorder is not running
+        """
+        with self.__lock:
+            if not self.is_recording:
+                return None
+            self.__file.close()
+            self.__file = None
+            result = self.__file_name, self.__record_count
+        logger.info('Command trace recording stopped with %d records', result[1])
+        return result
+
+    def record(self, command: str, player: str, args: tuple, kwargs: dict) -> None:
+        if not self.is_recording:
+            return
+        item = {
+            't': round(time.monotonic() - self.__started_at, 4),
+            'cmd': command,
+            'player': self.pseudonym(player),
+            'args': [self.anonymise(arg) for arg in args]
+        }
+        if len(kwargs) > 0:
+            item['kwargs'] = {key: self.anonymise(value) for key, value in kwargs.items()}
+        line = json.dumps(item, ensure_ascii=False) + '\n'
+        reached_limit = False
+        with self.__lock:
+            if self.__file is None:
+                return
+            self.__file.write(line)
+            self.__record_count += 1
+            reached_limit = 0 < config.trace.max_records <= self.__record_count
+        if reached_limit:
+            self.stop()
+
+
+def traced(command: str) -> Callable:
+    """
+    Record invocations of a player command handler while the trace recorder is running
+    Decorated handlers are registered by command name, so that recorded traces can be replayed
+    :param command: Stable name of the command in trace files
+    """
+    def wrapper(func: Callable):
+        @functools.wraps(func)
+        def wrap(source, *args, **kwargs):
+            player = getattr(source, 'player', None)
+            if player is not None:
+                try:
+                    TraceRecorder.get_instance().record(command, player, args, kwargs)
+                except Exception as exc:
+                    logger.exception('Error recording command trace', exc_info=exc)
+            return func(source, *args, **kwargs)
+        __handlers[command] = func
+        return wrap
+    return wrapper
+
+
+def get_handler(command: str) -> Optional[Callable]:
+    """
+    Handler of a traced command, calling it does not record the invocation again
+    """
+    return __handlers.get(command)
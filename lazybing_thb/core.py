@@ -1,17 +1,32 @@
+import asyncio
+import tarfile
 import time
+import zlib
 from typing import Optional
 
 from mcdreforged.api.command import *
 from mcdreforged.api.rtext import *
 from mcdreforged.api.types import CommandSource, PlayerCommandSource
 
+from lazybing_thb.async_loop import PluginEventLoop
+from lazybing_thb.event_bus import ThbEvents, dispatch
 from lazybing_thb.location import Location
+from lazybing_thb.message_cache import tell_cached
+from lazybing_thb.mda_gateway import MDAGateway, MDAUnavailableError
 from lazybing_thb.storage.config import config
 from lazybing_thb.storage.impl.history import TeleportHistory
 from lazybing_thb.storage.impl.home import PlayerHomeStorage
-from lazybing_thb.teleport import teleport_to_player, teleport_to_location
-from lazybing_thb.timer import RequestTimer
-from lazybing_thb.utils import rtr, htr, psi, named_thread
+from lazybing_thb.storage.impl.warp import WarpStorage
+from lazybing_thb.storage.home_index import HomeIndex
+from lazybing_thb.storage import home_archive
+from lazybing_thb.profiler import StackSampler
+from lazybing_thb.census import ResourceCensus
+from lazybing_thb.storage.sweeper import HistorySweeper
+from lazybing_thb.command_batcher import CommandBatcher
+from lazybing_thb.command_trace import TraceRecorder, traced
+from lazybing_thb.teleport import teleport_to_location, group_teleport, execute_teleport
+from lazybing_thb.timer import RequestQueue
+from lazybing_thb.utils import rtr, htr, psi, named_thread, logger
 from lazybing_thb.player_list import PlayerOnlineList
 
 
@@ -25,6 +40,7 @@ def show_help(source: CommandSource):
             tpa_prefix=config.command_prefix.tpa_[0],
             tpc_prefix=config.command_prefix.tpc_[0],
             back_prefix=config.command_prefix.back_[0],
+            warp_prefix=config.command_prefix.warp_[0],
             name=meta.name,
             ver=str(meta.version)
         )
@@ -36,43 +52,53 @@ def reload_self(source: CommandSource):
     source.reply(rtr('msg.reloaded'))
 
 
-def get_current_requester(target: str):
-    timer = RequestTimer.get_timer(target)
-    with timer.lock():
-        if not timer.is_valid():
-            return None
-        requester = timer.get_requester()
-        timer.remove()
-    return requester
+def get_current_requester(target: str, requester: Optional[str] = None):
+    return RequestQueue.get_queue(target).pop(requester)
 
 
-# !!tpa
-@named_thread
-def accept_teleport_request(source: PlayerCommandSource):
-    requester: Optional[str] = get_current_requester(source.player)
+async def _accept_flow(requester: str, target: str) -> bool:
+    """
+    Countdown and teleport after a request is accepted, cancelled if either player leaves or the request is declined
+    """
+    try:
+        for count in range(config.teleport_delay, 0, -1):
+            tell_cached(requester, 'tpa.countdown', lambda value: rtr('tpa.countdown', value), count)
+            await asyncio.sleep(1)
+        return await execute_teleport(requester, target)
+    except asyncio.CancelledError:
+        psi.tell(requester, rtr('tpa.teleport_cancelled').set_color(RColor.red))
+        raise
+
+
+@traced('tpa.accept')
+# !!tpa / !!tpa accept <requester>
+def accept_teleport_request(source: PlayerCommandSource, requester: Optional[str] = None):
+    requester: Optional[str] = get_current_requester(source.player, requester)
     if requester is None:
         return source.reply(rtr('tpa.request_not_found').set_color(RColor.red))
     if not PlayerOnlineList.get_instance().is_online(requester):
         return source.reply(rtr('teleport.not_online', RText(requester).set_color(RColor.yellow)))
     source.reply(rtr("tpa.request_agree", RText(requester, RColor.yellow)))
-    if config.teleport_delay >= 1:
-        psi.tell(requester, rtr('tpa.countdown', str(config.teleport_delay)))
-        for count in range(1, config.teleport_delay):
-            time.sleep(1)
-            psi.tell(requester, rtr('tpa.countdown', str(config.teleport_delay - count)))
-        time.sleep(1)
-    teleport_to_player(requester, source.player)
-
-
-# !!tpc
-def decline_teleport_request(source: PlayerCommandSource):
-    requester: Optional[str] = get_current_requester(source.player)
-    if requester is None:
-        return source.reply(rtr('tpa.request_not_found').set_color(RColor.red))
+    dispatch(ThbEvents.REQUEST_ACCEPTED, requester, source.player)
+    PluginEventLoop.get_instance().submit(_accept_flow(requester, source.player), requester, source.player)
+
+
+@traced('tpc')
+# !!tpc / !!tpc <requester>
+def decline_teleport_request(source: PlayerCommandSource, requester: Optional[str] = None):
+    pending_requester: Optional[str] = get_current_requester(source.player, requester)
+    if pending_requester is None:
+        # Accepted request still counting down can be declined as well
+        if requester is None or PluginEventLoop.get_instance().cancel(requester, source.player) == 0:
+            return source.reply(rtr('tpa.request_not_found').set_color(RColor.red))
+        pending_requester = requester
+    requester = pending_requester
     source.reply(rtr("tpa.request_declined", RText(requester, RColor.yellow)))
+    dispatch(ThbEvents.REQUEST_DECLINED, requester, source.player)
     psi.tell(requester, rtr('tpa.request_declined_requester', RText(source.player, RColor.yellow)))
 
 
+@traced('tpa.request')
 # !!tpa <player>
 def request_teleport(source: PlayerCommandSource, target: str):
     if source.player == target:
@@ -81,29 +107,59 @@ def request_teleport(source: PlayerCommandSource, target: str):
     if not PlayerOnlineList.get_instance().is_online(target):
         return source.reply(rtr('teleport.not_online', player_component).set_color(RColor.red))
     requester: str = source.player
-    timer = RequestTimer.get_timer(target)
-    with timer.lock():
-        if timer.is_valid():
+    request = RequestQueue.get_queue(target).enqueue(requester)
+    if request is None:
+        if RequestQueue.get_queue(target).contains(requester):
+            return source.reply(rtr('tpa.request_already_exists', player_component).set_color(RColor.red))
+        return source.reply(rtr('tpa.request_queue_full', player_component).set_color(RColor.red))
+    pending_amount = len(request.queue)
+    dispatch(ThbEvents.REQUEST_CREATED, requester, target)
+
+    def _tr(key: str, *args, **kwargs):
+        return rtr(f"tpa.send_to_target.{key}", *args, **kwargs)
+
+    def _build(player: str):
+        return _tr(
+            'text',
+            player=player,
+            accept_comp=_tr('accept_comp').c(
+                RAction.run_command, f'{config.command_prefix.tpa_[0]} accept {player}'
+            ).h(_tr('accept_hover')),
+            decline_comp=_tr('decline_comp').c(
+                RAction.run_command, f'{config.command_prefix.tpc_[0]} {player}'
+            ).h(_tr('decline_hover'))
+        )
+    tell_cached(target, 'tpa.send_to_target', _build, requester)
+    if pending_amount > 1:
+        psi.tell(target, rtr('tpa.request_pending', pending_amount))
+    source.reply(rtr('tpa.request_create', player_component))
+
+
+@traced('tpa.pull')
+# !!tpa pull <players> / !!tpa pullhome <home_site> <players>
+def pull_players(source: PlayerCommandSource, players: str, home_site_name: Optional[str] = None):
+    online_list = PlayerOnlineList.get_instance()
+    player_list = list(dict.fromkeys(players.replace(',', ' ').split()))
+    use_selector = '@a' in player_list
+    if use_selector:
+        player_list = online_list.players
+    else:
+        offline_players = [player for player in player_list if not online_list.is_online(player)]
+        if len(offline_players) > 0:
             return source.reply(
-                rtr('tpa.request_already_exists', player_component).set_color(RColor.red)
-            )
-        timer.get_request().set_requester(requester)
-        timer.start()
-
-        def _tr(key: str, *args, **kwargs):
-            return rtr(f"tpa.send_to_target.{key}", *args, **kwargs)
-        psi.tell(
-            target,
-            _tr(
-                'text',
-                player=source.player,
-                accept_comp=_tr('accept_comp').c(RAction.run_command, config.command_prefix.tpa_[0]).h(_tr('accept_hover')),
-                decline_comp=_tr('decline_comp').c(RAction.run_command, config.command_prefix.tpc_[0]).h(_tr('decline_hover'))
+                rtr('teleport.not_online', RText(', '.join(offline_players), RColor.yellow)).set_color(RColor.red)
             )
-        )
-        source.reply(rtr('tpa.request_create', player_component))
+    destination = source.player
+    if home_site_name is not None:
+        home = PlayerHomeStorage.get_instance(source.player)
+        with home.lock():
+            destination = home.get_home(home_site_name)
+        if destination is None:
+            return source.reply(rtr('home.home_site_not_exists', home_site_name).set_color(RColor.red))
+    group_teleport(source.player, player_list, destination, use_selector=use_selector)
 
 
+@traced('home.list')
 # !!home list
 def list_home(source: PlayerCommandSource):
     home_list = PlayerHomeStorage.get_instance(source.player).get_data()
@@ -130,12 +186,16 @@ def list_home(source: PlayerCommandSource):
     source.reply(RTextBase.join('\n', component_list))
 
 
+@traced('home.add')
 @named_thread
 # !!home add <home_site>
 def add_home(source: PlayerCommandSource, home_site_name: str):
     home = PlayerHomeStorage.get_instance(source.player)
-    player_location = Location.get_location(source.player)
-    with home.lock():
+    try:
+        player_location = Location.get_location(source.player)
+    except MDAUnavailableError:
+        return source.reply(rtr('teleport.server_busy').set_color(RColor.red))
+    with home.transaction():
         home_list = home.get_data()
         amount = len(home_list)
         if config.is_reached_max_home_amount(amount):
@@ -146,6 +206,7 @@ def add_home(source: PlayerCommandSource, home_site_name: str):
     source.reply(rtr('home.added_home_site', home_site_name, len(home_list), config.max_home_count))
 
 
+@traced('home.remove')
 # !!home remove/rm <home_site>
 def remove_home(source: PlayerCommandSource, home_site_name: str):
     home = PlayerHomeStorage.get_instance(source.player)
@@ -157,6 +218,7 @@ def remove_home(source: PlayerCommandSource, home_site_name: str):
     source.reply(rtr('home.home_site_removed', home_site_name, amount, config.max_home_count))
 
 
+@traced('home.teleport')
 # !!home <home_site>
 def teleport_to_home(source: PlayerCommandSource, home_site_name: str):
     home = PlayerHomeStorage.get_instance(source.player)
@@ -167,11 +229,176 @@ def teleport_to_home(source: PlayerCommandSource, home_site_name: str):
     teleport_to_location(source.player, site_location)
 
 
+# !!home admin
+def show_home_index(source: CommandSource):
+    index = HomeIndex.get_instance()
+    if not index.is_ready:
+        return source.reply(rtr('home.admin.index_building').set_color(RColor.yellow))
+    player_amount, home_amount = index.get_summary()
+    component_list = [rtr('home.admin.summary', player_amount, home_amount)]
+    for dim, count in sorted(index.get_dimension_counts().items(), key=lambda item: -item[1]):
+        component_list.append(RTextList('  ', RText(dim, RColor.gray), f': §e{count}§r'))
+    source.reply(RTextBase.join('\n', component_list))
+
+
+# !!home admin player <player>
+def show_player_homes(source: CommandSource, player: str):
+    homes = HomeIndex.get_instance().get_player_homes(player)
+    source.reply(rtr('home.admin.player_homes', RText(player, RColor.yellow), len(homes), ', '.join(homes)))
+
+
+@named_thread
+# !!home admin export
+def export_homes(source: CommandSource):
+    source.reply(rtr('home.admin.export_started'))
+    file_name, amount = home_archive.export_homes()
+    source.reply(rtr('home.admin.exported', amount, file_name))
+
+
+@named_thread
+# !!home admin import <file>
+def import_homes(source: CommandSource, file_name: str):
+    try:
+        source.reply(rtr('home.admin.import_started', file_name))
+        imported, skipped = home_archive.import_homes(file_name)
+    except (ValueError, FileNotFoundError):
+        return source.reply(rtr('home.admin.archive_not_found', file_name).set_color(RColor.red))
+    except (tarfile.TarError, EOFError, zlib.error, OSError) as exc:
+        # Damaged or truncated archive, players read before the error are already imported
+        logger.warning('Failed to import homes from %s: %s', file_name, exc)
+        return source.reply(rtr('home.admin.import_failed', file_name, exc).set_color(RColor.red))
+    source.reply(rtr('home.admin.imported', imported, skipped))
+
+
+# !!home census
+def show_census(source: CommandSource):
+    census = ResourceCensus.get_instance()
+    counts = census.take()
+    census.check(counts)
+    component_list = [rtr('census.title')]
+    for name, count in counts.items():
+        threshold = census.get_threshold(name)
+        component_list.append(
+            RTextList(
+                '  ', RText(name, RColor.gray), ': ',
+                RText(count, RColor.red if census.is_exceeded(name) else RColor.yellow),
+                f' §7/ {threshold}§r' if threshold > 0 else ''
+            )
+        )
+    gateway = MDAGateway.get_instance()
+    component_list.append(
+        RTextList(
+            rtr('census.mda_gateway', gateway.in_flight, config.mda_gateway.max_in_flight, gateway.waiting,
+                round(gateway.get_timeout(), 2)),
+            rtr('census.breaker_open').set_color(RColor.red) if gateway.is_open else ''
+        )
+    )
+    batches = CommandBatcher.get_instance().get_statistics()
+    component_list.append(
+        rtr('census.command_batches', batches['batches'], batches['commands'],
+            round(batches['mean_batch_size'], 1), batches['max_batch_size'])
+    )
+    sweeper = HistorySweeper.get_instance()
+    if sweeper.last_swept_at is None:
+        component_list.append(rtr('census.history_sweeper_pending'))
+    else:
+        component_list.append(
+            rtr('census.history_sweeper', time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sweeper.last_swept_at)),
+                sweeper.last_reclaimed_files, round(sweeper.last_reclaimed_bytes / 1024, 1))
+        )
+    source.reply(RTextBase.join('\n', component_list))
+
+
+# !!home profile start [memory]
+def start_profiling(source: CommandSource, trace_memory: bool = False):
+    if not StackSampler.get_instance().start(trace_memory):
+        return source.reply(rtr('profile.already_running').set_color(RColor.red))
+    source.reply(rtr('profile.started'))
+
+
+@named_thread
+# !!home profile stop
+def stop_profiling(source: CommandSource):
+    result = StackSampler.get_instance().stop()
+    if result is None:
+        return source.reply(rtr('profile.not_running').set_color(RColor.red))
+    sample_count, files = result
+    source.reply(rtr('profile.stopped', sample_count, ', '.join(files)))
+
+
+# !!home trace start
+def start_tracing(source: CommandSource):
+    file_name = TraceRecorder.get_instance().start()
+    if file_name is None:
+        return source.reply(rtr('trace.already_running').set_color(RColor.red))
+    source.reply(rtr('trace.started', file_name))
+
+
+# !!home trace stop
+def stop_tracing(source: CommandSource):
+    result = TraceRecorder.get_instance().stop()
+    if result is None:
+        return source.reply(rtr('trace.not_running').set_color(RColor.red))
+    file_name, record_count = result
+    source.reply(rtr('trace.stopped', record_count, file_name))
+
+
+@traced('warp.list')
+# !!warp
+def list_warp(source: PlayerCommandSource):
+    warp_names = WarpStorage.get_storage().get_warp_names()
+    component_list = [rtr('warp.list_title', len(warp_names))]
+    for num, name in enumerate(warp_names, start=1):
+        component_list.append(
+            RTextList(
+                f'[§7{num}§r] ',
+                RText(
+                    name, RColor.dark_aqua if num % 2 == 0 else RColor.aqua, [RStyle.bold]
+                ).h(
+                    rtr('warp.list_warp.hover', name)
+                ).c(
+                    RAction.run_command, f'{config.command_prefix.warp_[0]} {name}'
+                )
+            )
+        )
+    source.reply(RTextBase.join('\n', component_list))
+
+
+@traced('warp.teleport')
+# !!warp <warp>
+def teleport_to_warp(source: PlayerCommandSource, warp_name: str):
+    warp_location = WarpStorage.get_storage().get_warp(warp_name)
+    if warp_location is None:
+        return source.reply(rtr('warp.not_exists', warp_name).set_color(RColor.red))
+    teleport_to_location(source.player, warp_location)
+
+
+@traced('warp.set')
+@named_thread
+# !!warp set <warp>
+def set_warp(source: PlayerCommandSource, warp_name: str):
+    try:
+        player_location = Location.get_location(source.player)
+    except MDAUnavailableError:
+        return source.reply(rtr('teleport.server_busy').set_color(RColor.red))
+    WarpStorage.get_storage().set_warp(warp_name, player_location, overwrite=True)
+    source.reply(rtr('warp.set', warp_name))
+
+
+@traced('warp.remove')
+# !!warp remove/rm <warp>
+def remove_warp(source: PlayerCommandSource, warp_name: str):
+    if not WarpStorage.get_storage().remove_warp(warp_name):
+        return source.reply(rtr('warp.not_exists', warp_name).set_color(RColor.red))
+    source.reply(rtr('warp.removed', warp_name))
+
+
+@traced('back')
 def undo_teleport(source: PlayerCommandSource):
     history = TeleportHistory.get_instance(source.player)
     history_location = history.get_history()
     if history_location is None:
-        source.reply(
+        return source.reply(
             rtr('back.no_history_found').set_color(RColor.red)
         )
     if config.is_history_expired(history_location.timestamp) and not history_location.warned:
@@ -192,10 +419,47 @@ def register_command():
     home_root = Literal(config.command_prefix.home_).runs(show_help)
     back_root = Literal(config.command_prefix.back_).runs(undo_teleport).requires(
         lambda src: src.has_permission(config.permission_requirements.back))
+    warp_root = Literal(config.command_prefix.warp_).runs(list_warp).requires(
+        lambda src: src.has_permission(config.permission_requirements.warp))
 
     # !!tpa
     player_node_name = "player"
+    players_node_name = "players"
+    requester_node_name = "requester"
+    home_site_name = "home_site"
+    warp_node_name = "warp"
+    archive_node_name = "archive"
+
+    def requester_node():
+        return QuotableText(requester_node_name).suggests(
+            lambda src: RequestQueue.get_queue(src.player).requesters if isinstance(src, PlayerCommandSource) else []
+        )
+
     tpa_root.then(
+        Literal('accept').then(
+            requester_node().runs(
+                lambda src, ctx: accept_teleport_request(src, ctx[requester_node_name])
+            )
+        )
+    ).then(
+        Literal('pull').requires(
+            lambda src: src.has_permission(config.permission_requirements.group_tpa)
+        ).then(
+            GreedyText(players_node_name).runs(
+                lambda src, ctx: pull_players(src, ctx[players_node_name])
+            )
+        )
+    ).then(
+        Literal('pullhome').requires(
+            lambda src: src.has_permission(config.permission_requirements.group_tpa)
+        ).then(
+            QuotableText(home_site_name).then(
+                GreedyText(players_node_name).runs(
+                    lambda src, ctx: pull_players(src, ctx[players_node_name], ctx[home_site_name])
+                )
+            )
+        )
+    ).then(
         QuotableText(player_node_name).requires(
             lambda src: src.has_permission(config.permission_requirements.tpa)
         ).runs(
@@ -203,8 +467,18 @@ def register_command():
         )
     )
 
+    # !!tpc
+    tpc_root.then(
+        requester_node().runs(
+            lambda src, ctx: decline_teleport_request(src, ctx[requester_node_name])
+        )
+    )
+
     # !!home
-    home_site_name = "home_site"
+    def player_only(node):
+        return node.requires(lambda src: isinstance(src, PlayerCommandSource))
+
+    # Management commands are available to console as well, home commands need a player
     home_root.then(
         Literal('reload').requires(
             lambda src: src.has_permission(config.permission_requirements.reload)
@@ -212,25 +486,97 @@ def register_command():
             lambda src: reload_self(src)
         )
     ).then(
-        Literal('list').runs(list_home)
+        Literal('admin').requires(
+            lambda src: src.has_permission(config.permission_requirements.home_admin)
+        ).runs(
+            show_home_index
+        ).then(
+            Literal('player').then(
+                QuotableText(player_node_name).runs(
+                    lambda src, ctx: show_player_homes(src, ctx[player_node_name])
+                )
+            )
+        ).then(
+            Literal('export').runs(export_homes)
+        ).then(
+            Literal('import').then(
+                QuotableText(archive_node_name).runs(
+                    lambda src, ctx: import_homes(src, ctx[archive_node_name])
+                )
+            )
+        )
+    ).then(
+        Literal('census').requires(
+            lambda src: src.has_permission(config.permission_requirements.home_admin)
+        ).runs(show_census)
+    ).then(
+        Literal('profile').requires(
+            lambda src: src.has_permission(config.permission_requirements.profile)
+        ).then(
+            Literal('start').runs(
+                lambda src: start_profiling(src)
+            ).then(
+                Literal('memory').runs(
+                    lambda src: start_profiling(src, trace_memory=True)
+                )
+            )
+        ).then(
+            Literal('stop').runs(stop_profiling)
+        )
     ).then(
-        Literal('add').then(
+        Literal('trace').requires(
+            lambda src: src.has_permission(config.permission_requirements.profile)
+        ).then(
+            Literal('start').runs(start_tracing)
+        ).then(
+            Literal('stop').runs(stop_tracing)
+        )
+    ).then(
+        player_only(Literal('list')).runs(list_home)
+    ).then(
+        player_only(Literal('add')).then(
             QuotableText(home_site_name).runs(
                 lambda src, ctx: add_home(src, ctx[home_site_name])
             )
         )
     ).then(
-        Literal(['rm', 'remove']).then(
+        player_only(Literal(['rm', 'remove'])).then(
             QuotableText(home_site_name).runs(
                 lambda src, ctx: remove_home(src, ctx[home_site_name])
             )
         )
     ).then(
-        QuotableText(home_site_name).runs(
+        player_only(QuotableText(home_site_name)).runs(
             lambda src, ctx: teleport_to_home(src, ctx[home_site_name])
         )
     )
 
-    for item in (tpa_root, tpc_root, home_root, back_root):
-        item.requires(lambda src: isinstance(src, PlayerCommandSource))
-        psi.register_command(item)
+    # !!warp
+    def warp_node():
+        return QuotableText(warp_node_name).suggests(lambda: WarpStorage.get_storage().get_warp_names())
+
+    warp_root.then(
+        Literal('set').requires(
+            lambda src: src.has_permission(config.permission_requirements.warp_manage)
+        ).then(
+            QuotableText(warp_node_name).runs(
+                lambda src, ctx: set_warp(src, ctx[warp_node_name])
+            )
+        )
+    ).then(
+        Literal(['rm', 'remove']).requires(
+            lambda src: src.has_permission(config.permission_requirements.warp_manage)
+        ).then(
+            warp_node().runs(
+                lambda src, ctx: remove_warp(src, ctx[warp_node_name])
+            )
+        )
+    ).then(
+        warp_node().runs(
+            lambda src, ctx: teleport_to_warp(src, ctx[warp_node_name])
+        )
+    )
+
+    for item in (tpa_root, tpc_root, back_root, warp_root):
+        psi.register_command(player_only(item))
+    psi.register_command(home_root)
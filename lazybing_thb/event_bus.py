@@ -0,0 +1,85 @@
+import threading
+from typing import Callable, Dict, Tuple, Optional
+
+from mcdreforged.api.event import LiteralEvent
+
+from lazybing_thb.async_loop import run_blocking
+from lazybing_thb.storage.config import config
+from lazybing_thb.utils import psi, logger
+
+
+class ThbEvents:
+    # (player: str, destination: Union[str, Location])
+    PRE_TELEPORT = 'lazybing_thb.pre_teleport'
+    POST_TELEPORT = 'lazybing_thb.post_teleport'
+    # (requester: str, target: str)
+    REQUEST_CREATED = 'lazybing_thb.request_created'
+    REQUEST_EXPIRED = 'lazybing_thb.request_expired'
+    REQUEST_ACCEPTED = 'lazybing_thb.request_accepted'
+    REQUEST_DECLINED = 'lazybing_thb.request_declined'
+
+
+class EventBus:
+    """
+    In-process event bus, listeners are called synchronously on the thread dispatching the event
+    Dispatching an event without listeners costs a single dict lookup
+    """
+    __inst: Optional["EventBus"] = None
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__listeners: Dict[str, Tuple[Callable, ...]] = {}
+
+    @classmethod
+    def get_instance(cls) -> "EventBus":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    def subscribe(self, event: str, callback: Callable) -> None:
+        with self.__lock:
+            # Listener tuples are replaced instead of mutated, so dispatching never needs the lock
+            self.__listeners[event] = self.__listeners.get(event, ()) + (callback,)
+
+    def unsubscribe(self, event: str, callback: Callable) -> bool:
+        with self.__lock:
+            listeners = self.__listeners.get(event, ())
+            if callback not in listeners:
+                return False
+            remaining = tuple(item for item in listeners if item != callback)
+            if len(remaining) == 0:
+                del self.__listeners[event]
+            else:
+                self.__listeners[event] = remaining
+            return True
+
+    def has_listeners(self, event: str) -> bool:
+        """
+        If dispatching the event reaches anything, either plugin listeners or MCDR event listeners
+        """
+        return event in self.__listeners or config.dispatch_mcdr_events
+
+    def dispatch(self, event: str, *args) -> None:
+        for callback in self.__listeners.get(event, ()):
+            try:
+                callback(*args)
+            except Exception as exc:
+                logger.exception(f'Error invoking listener {callback} of event {event}', exc_info=exc)
+        if config.dispatch_mcdr_events:
+            psi.dispatch_event(LiteralEvent(event), args)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__listeners.clear()
+
+
+def dispatch(event: str, *args) -> None:
+    EventBus.get_instance().dispatch(event, *args)
+
+
+async def dispatch_off_loop(event: str, *args) -> None:
+    """
+    Dispatch an event from a coroutine, listeners run in the worker pool so they can't stall the event loop
+    """
+    if EventBus.get_instance().has_listeners(event):
+        await run_blocking(dispatch, event, *args)
@@ -0,0 +1,72 @@
+import asyncio
+from typing import Optional, Dict, List
+
+from lazybing_thb.async_loop import run_blocking
+from lazybing_thb.location import Location
+from lazybing_thb.storage.impl.history import TeleportHistory
+
+
+class HistoryCapture:
+    """
+    Captures pre-teleport locations of concurrent teleport flows with batched lookups
+    Players requested while a lookup is running are gathered into the next one,
+    so a burst of teleports costs a few batched lookups instead of one lookup per player
+    Captured locations are staged as histories, visible to !!back at once and written to files by HistoryWriter
+    Only used on the plugin event loop thread, so no lock is needed
+    """
+    __inst: Optional["HistoryCapture"] = None
+
+    def __init__(self):
+        self.__pending: Dict[str, List[asyncio.Future]] = {}
+        self.__task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def get_instance(cls) -> "HistoryCapture":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    @staticmethod
+    def __lookup_and_stage(players: List[str]) -> Dict[str, Location]:
+        locations = Location.get_locations(players)
+        TeleportHistory.bulk_set_locations(locations)
+        return locations
+
+    async def __run(self):
+        try:
+            while len(self.__pending) > 0:
+                batch, self.__pending = self.__pending, {}
+                try:
+                    locations = await run_blocking(self.__lookup_and_stage, list(batch.keys()))
+                except Exception as exc:
+                    for futures in batch.values():
+                        for future in futures:
+                            if not future.done():
+                                future.set_exception(exc)
+                    continue
+                for player, futures in batch.items():
+                    for future in futures:
+                        if not future.done():
+                            future.set_result(locations.get(player))
+        finally:
+            self.__task = None
+            # Loop is shutting down if this task is cancelled, waiting flows are cancelled as well
+            for futures in self.__pending.values():
+                for future in futures:
+                    future.cancel()
+            self.__pending = {}
+
+    async def capture(self, player: str) -> Optional[Location]:
+        """
+        Query the location of a player and record it as the player's history
+        :return: Location of the player, None if it is not available
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.__pending.setdefault(player, []).append(future)
+        if self.__task is None:
+            self.__task = asyncio.ensure_future(self.__run())
+        return await future
+
+
+async def capture_history(player: str) -> Optional[Location]:
+    return await HistoryCapture.get_instance().capture(player)
@@ -1,8 +1,8 @@
-from typing import Union
+import time
+from typing import Union, Iterable, Dict
 
 from mcdreforged.utils.serializer import Serializable
-from minecraft_data_api import get_player_coordinate, get_player_dimension
-from lazybing_thb.storage.config import config
+from lazybing_thb.transport import get_transport
 from lazybing_thb.utils import psi, logger
 
 Number = Union[int, float]
@@ -27,18 +27,42 @@ class Location(Serializable):
 
     def get_dim_name(self):
         dim = dim_convert.get(self.dim, self.dim)
-        logger.debug(f"Location dimension converted: {dim}")
+        logger.debug("Location dimension converted: %s", dim)
         return dim
 
     @classmethod
     def get_location(cls, player: str):
         if psi.is_on_executor_thread():
             raise RuntimeError("Illegal call on Executor threads")
-        coordinate = get_player_coordinate(player, timeout=config.mda_timeout)
-        dimension = get_player_dimension(player, timeout=config.mda_timeout)
+        (x, y, z), dimension = get_transport().get_position(player)
         return cls.deserialize(
             dict(
-                x=coordinate.x, y=coordinate.y, z=coordinate.z,
+                x=x, y=y, z=z,
                 dim=dimension
             )
         )
+
+    @classmethod
+    def get_locations(cls, players: Iterable[str]) -> Dict[str, "Location"]:
+        """
+        Query locations of several players in one batch, players failed to query are left out of the result
+        """
+        if psi.is_on_executor_thread():
+            raise RuntimeError("Illegal call on Executor threads")
+        return {
+            player: cls.deserialize(dict(x=x, y=y, z=z, dim=dimension))
+            for player, ((x, y, z), dimension) in get_transport().get_positions(players).items()
+        }
+
+
+class History(Location):
+    timestamp: float
+    warned = False
+
+    @classmethod
+    def from_coordinates(cls, coordinates: Location):
+        data = coordinates.serialize()
+        data = data.copy()
+        if 'timestamp' not in data.keys():
+            data['timestamp'] = time.time()
+        return cls.deserialize(data)
@@ -0,0 +1,153 @@
+import threading
+import time
+from typing import Optional, Callable, TypeVar
+
+from lazybing_thb.storage.config import config
+from lazybing_thb.utils import logger
+
+T = TypeVar('T')
+
+
+class MDAUnavailableError(RuntimeError):
+    pass
+
+
+class MDAGateway:
+    """
+    Admission control for minecraft data api queries
+    Caps in-flight queries, queues callers with deadlines, adapts query timeout from observed latency
+    and opens a circuit breaker when server stops responding
+    """
+    __inst: Optional["MDAGateway"] = None
+
+    def __init__(self):
+        self.__condition = threading.Condition(threading.RLock())
+        self.__in_flight = 0
+        self.__waiting = 0
+        self.__latency_avg: Optional[float] = None
+        self.__latency_dev: float = 0.0
+        self.__failures = 0
+        self.__opened_at: Optional[float] = None
+        self.__probing = False
+
+    @classmethod
+    def get_instance(cls) -> "MDAGateway":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    @property
+    def in_flight(self) -> int:
+        return self.__in_flight
+
+    @property
+    def waiting(self) -> int:
+        return self.__waiting
+
+    @property
+    def is_open(self) -> bool:
+        return self.__opened_at is not None
+
+    def get_timeout(self) -> float:
+        max_timeout = config.mda_timeout
+        if self.__latency_avg is None:
+            return max_timeout
+        adaptive = self.__latency_avg + 4 * self.__latency_dev
+        return min(max_timeout, max(config.mda_gateway.min_timeout, adaptive))
+
+    def __record_latency(self, elapsed: float) -> None:
+        # Jacobson/Karels style smoothed latency estimation, same as TCP RTO computation
+        if self.__latency_avg is None:
+            self.__latency_avg, self.__latency_dev = elapsed, elapsed / 2
+            return
+        error = elapsed - self.__latency_avg
+        self.__latency_avg += error / 8
+        self.__latency_dev += (abs(error) - self.__latency_dev) / 4
+
+    def __check_breaker(self) -> bool:
+        """
+        Returns True if current caller is admitted as the half-open probe
+        """
+        if self.__opened_at is None:
+            return False
+        if self.__probing or time.monotonic() - self.__opened_at < config.mda_gateway.breaker_cooldown:
+            raise MDAUnavailableError('Circuit breaker is open')
+        self.__probing = True
+        return True
+
+    def __admit(self, deadline: float) -> bool:
+        options = config.mda_gateway
+        with self.__condition:
+            is_probe = self.__check_breaker()
+            try:
+                if self.__in_flight >= options.max_in_flight:
+                    if self.__waiting >= options.max_waiting:
+                        raise MDAUnavailableError('Too many queries waiting')
+                    self.__waiting += 1
+                    try:
+                        while self.__in_flight >= options.max_in_flight:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise MDAUnavailableError('Query deadline exceeded while waiting')
+                            self.__condition.wait(remaining)
+                            if not is_probe and self.__opened_at is not None:
+                                raise MDAUnavailableError('Circuit breaker is open')
+                    finally:
+                        self.__waiting -= 1
+            except MDAUnavailableError:
+                if is_probe:
+                    self.__probing = False
+                raise
+            self.__in_flight += 1
+            return is_probe
+
+    def __release(self, elapsed: float, responded: bool, is_probe: bool) -> None:
+        with self.__condition:
+            self.__in_flight -= 1
+            self.__record_latency(elapsed)
+            if is_probe:
+                self.__probing = False
+            if responded:
+                if self.__opened_at is not None:
+                    logger.info("Minecraft data api is responsive again, circuit breaker closed")
+                self.__failures, self.__opened_at = 0, None
+            else:
+                self.__failures += 1
+                if is_probe or (
+                        self.__opened_at is None and self.__failures >= config.mda_gateway.failure_threshold
+                ):
+                    if self.__opened_at is None:
+                        logger.warning(
+                            "Minecraft data api failed %d times in a row, circuit breaker opened", self.__failures
+                        )
+                    self.__opened_at = time.monotonic()
+            self.__condition.notify_all()
+
+    def query(self, func: Callable[..., Optional[T]], *args, deadline: Optional[float] = None, **kwargs) -> T:
+        """
+        Run a minecraft data api function with adaptive timeout
+        Only queries left unanswered until timeout count as breaker failures,
+        an empty or malformed answer, e.g. the player went offline during the query, still proves the server responsive
+        :param func: minecraft data api function accepting keyword argument timeout
+        :param deadline: time.monotonic() value before which the query must be admitted
+        :raise MDAUnavailableError: query rejected, timed out or failed
+        """
+        if deadline is None:
+            deadline = time.monotonic() + config.mda_gateway.queue_timeout
+        is_probe = self.__admit(deadline)
+        timeout = self.get_timeout()
+        start, responded = time.monotonic(), False
+        try:
+            try:
+                result = func(*args, timeout=timeout, **kwargs)
+            except (ValueError, TypeError) as exc:
+                responded = True
+                raise MDAUnavailableError(f'Query {func.__name__} failed') from exc
+            if result is None:
+                # Minecraft data api returns None on timeout as well as when the server refuses the query
+                responded = time.monotonic() - start < timeout
+                raise MDAUnavailableError(f'No response for query {func.__name__}')
+            responded = True
+            return result
+        finally:
+            self.__release(time.monotonic() - start, responded, is_probe)
@@ -0,0 +1,138 @@
+import json
+import threading
+from typing import Callable, Dict, Optional, Hashable, Tuple
+
+from mcdreforged.api.rtext import RTextBase, RTextMCDRTranslation
+
+from lazybing_thb.command_batcher import CommandBatcher
+from lazybing_thb.storage.config import config
+from lazybing_thb.utils import psi, logger
+
+# Private use characters, they never appear in translations or player names
+SENTINEL_FORMAT = '\ue000{}\ue001'
+PLAYER_SENTINEL = '\ue002'
+
+
+class MessageTemplateCache:
+    """
+    Cache of message sending commands, keyed by translation key, language, argument shape and server version
+    Commands are built by the server handler, the same way ServerInterface.tell builds them,
+    with the player and variable parts rendered as sentinels once, then filled into the cached command for every send
+    Filled commands are sent through the CommandBatcher, in order with teleport commands
+    """
+    __inst: Optional["MessageTemplateCache"] = None
+    MAX_SIZE = 512
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # None for messages that are not cacheable, they are sent uncached without trying again
+        self.__templates: Dict[Hashable, Optional[str]] = {}
+        self.__handler = None
+        self.__handler_resolved = False
+        self.__handler_missing_logged = False
+
+    @classmethod
+    def get_instance(cls) -> "MessageTemplateCache":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    @staticmethod
+    def get_language(player: str) -> str:
+        try:
+            return psi.get_preference(player).language
+        except Exception:
+            return psi.get_mcdr_language()
+
+    @staticmethod
+    def find_server_handler():
+        """
+        Handler used by ServerInterface.tell, it is not exposed by the plugin API
+        :return: None if this MCDR version keeps it elsewhere, messages are sent uncached then
+        """
+        manager = getattr(getattr(psi, '_mcdr_server', None), 'server_handler_manager', None)
+        get_current_handler = getattr(manager, 'get_current_handler', None)
+        if not callable(get_current_handler):
+            return None
+        handler = get_current_handler()
+        return handler if callable(getattr(handler, 'get_send_message_command', None)) else None
+
+    def get_server_handler(self):
+        """
+        Same as find_server_handler, looked up once while the plugin is loaded
+        """
+        if not self.__handler_resolved:
+            self.__handler, self.__handler_resolved = self.find_server_handler(), True
+        return self.__handler
+
+    def get_template(
+            self, handler, key: Hashable, language: str, builder: Callable[..., RTextBase], arg_count: int
+    ) -> Optional[str]:
+        """
+        :return: None if the message is not cacheable
+        """
+        info = psi.get_server_information()
+        cache_key = (key, language, arg_count, info.version)
+        try:
+            return self.__templates[cache_key]
+        except KeyError:
+            pass
+        sentinels = [SENTINEL_FORMAT.format(index) for index in range(arg_count)]
+        try:
+            with RTextMCDRTranslation.language_context(language):
+                template = handler.get_send_message_command(
+                    PLAYER_SENTINEL, builder(*sentinels), info
+                )
+            if template is None:
+                raise ValueError('Server handler does not send messages with commands')
+            if PLAYER_SENTINEL not in template or not all(sentinel in template for sentinel in sentinels):
+                raise ValueError('Arguments are not rendered as plain text')
+        except Exception as exc:
+            logger.debug('Message %s is not cacheable: %s', key, exc)
+            template = None
+        with self.__lock:
+            if len(self.__templates) >= self.MAX_SIZE:
+                self.__templates.clear()
+            self.__templates[cache_key] = template
+        return template
+
+    @staticmethod
+    def fill(template: str, player: str, *args) -> str:
+        for index, arg in enumerate(args):
+            template = template.replace(SENTINEL_FORMAT.format(index), json.dumps(str(arg), ensure_ascii=False)[1:-1])
+        return template.replace(PLAYER_SENTINEL, player)
+
+    def tell(self, player: str, key: Hashable, builder: Callable[..., RTextBase], *args):
+        """
+        Send a message built by builder to player
+        :param key: Identifies the message structure, usually the translation key plus anything changing the structure
+        :param builder: Builds the message from its arguments, arguments may only be used as plain text
+        """
+        if not config.message_cache:
+            return psi.tell(player, builder(*args))
+        handler = self.get_server_handler()
+        if handler is None:
+            if not self.__handler_missing_logged:
+                self.__handler_missing_logged = True
+                logger.warning('Server handler is not reachable in this MCDR version, messages are sent uncached')
+            return psi.tell(player, builder(*args))
+        template = self.get_template(handler, key, self.get_language(player), builder, len(args))
+        if template is None:
+            return psi.tell(player, builder(*args))
+        CommandBatcher.get_instance().submit(self.fill(template, player, *args))
+
+    def get_size(self) -> Tuple[int, int]:
+        """
+        :return: Amount of cached templates and their total size in bytes
+        """
+        with self.__lock:
+            templates = [template for template in self.__templates.values() if template is not None]
+        return len(templates), sum(len(template.encode('utf8')) for template in templates)
+
+    def clear(self):
+        with self.__lock:
+            self.__templates.clear()
+
+
+def tell_cached(player: str, key: Hashable, builder: Callable[..., RTextBase], *args):
+    MessageTemplateCache.get_instance().tell(player, key, builder, *args)
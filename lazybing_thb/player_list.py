@@ -1,11 +1,16 @@
 import threading
 import contextlib
+from concurrent.futures import Future
 from typing import Optional, Union
 from mcdreforged.api.event import MCDRPluginEvents
+from mcdreforged.api.types import PluginServerInterface
 
-from minecraft_data_api import get_server_player_list
+from lazybing_thb.async_loop import PluginEventLoop
+from lazybing_thb.mda_gateway import MDAUnavailableError
+from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
 from lazybing_thb.storage.config import config
-from lazybing_thb.utils import named_thread, psi
+from lazybing_thb.transport import get_transport, PlayerList
+from lazybing_thb.utils import named_thread, psi, logger
 
 
 class PlayerOnlineList:
@@ -15,6 +20,12 @@ class PlayerOnlineList:
         self.__list = list()
         self.__lock = threading.RLock()
         self.__limit: Optional[int] = None
+        # Bumped on every membership change, so reconciling skips lists queried before a join/leave event
+        self.__revision = 0
+        self.__query_lock = threading.Lock()
+        self.__pending_query: Optional[Future] = None
+        self.__stop_event = threading.Event()
+        self.__reconciler_running = False
 
     @contextlib.contextmanager
     def lock(self, blocking: bool = True, timeout: Union[float, int] = -1):
@@ -46,12 +57,14 @@ class PlayerOnlineList:
             for item in player:
                 if item not in self.__list:
                     self.__list.append(item)
+            self.__revision += 1
 
     def remove(self, *player: str):
         with self.lock():
             for item in player:
                 if item in self.__list:
                     self.__list.remove(item)
+            self.__revision += 1
 
     @classmethod
     def get_instance(cls):
@@ -59,29 +72,134 @@ class PlayerOnlineList:
             cls.__inst = cls()
         return cls.__inst
 
-    def register_event_listeners(self):
-        psi.register_event_listener(MCDRPluginEvents.PLUGIN_LOADED, lambda server, previous_module: self.init_player_list())
-        psi.register_event_listener(MCDRPluginEvents.SERVER_STARTUP, lambda server: self.on_server_startup())
-        psi.register_event_listener(MCDRPluginEvents.SERVER_STOP, lambda server, return_code: self.on_server_stop())
-        psi.register_event_listener(MCDRPluginEvents.PLAYER_JOINED, lambda server, player, info: self.add(player))
-        psi.register_event_listener(MCDRPluginEvents.PLAYER_LEFT, lambda server, player: self.remove(player))
+    def query_player_list(self) -> PlayerList:
+        """
+        Query player list from server, concurrent callers share the result of a single query
+        :raise MDAUnavailableError: Server didn't respond
+        """
+        with self.__query_lock:
+            future = self.__pending_query
+            is_owner = future is None
+            if is_owner:
+                future = self.__pending_query = Future()
+        if not is_owner:
+            return future.result()
+        try:
+            future.set_result(get_transport().get_player_list())
+        except BaseException as exc:
+            future.set_exception(exc)
+        finally:
+            with self.__query_lock:
+                self.__pending_query = None
+        return future.result()
+
+    def reconcile(self) -> bool:
+        """
+        Apply the difference between server player list and local list
+        :raise MDAUnavailableError: Server didn't respond
+        :return: If any difference was found
+        """
+        revision = self.__revision
+        amount, limit, player_list = self.query_player_list()
+        with self.lock():
+            if revision != self.__revision or not psi.is_server_startup():
+                # Membership changed by events during the query, result may be out-dated
+                return True
+            self.__limit = limit
+            joined = [player for player in player_list if player not in self.__list]
+            left = [player for player in self.__list if player not in player_list]
+            if len(joined) == 0 and len(left) == 0:
+                return False
+            self.add(*joined)
+            self.remove(*left)
+        logger.info('Player list reconciled, missed joins: %s, missed leaves: %s', joined, left)
+        self.preload_storage(*joined)
+        self.release_storage(*left)
+        return True
+
+    @named_thread('PlayerListReconciler')
+    def __reconcile_loop(self):
+        options = config.player_list_reconcile
+        interval = options.min_interval
+        while not self.__stop_event.wait(interval):
+            if not psi.is_server_startup():
+                interval = options.min_interval
+                continue
+            try:
+                changed = self.reconcile()
+            except MDAUnavailableError as exc:
+                logger.debug('Player list reconciling skipped: %s', exc)
+                changed = False
+            except Exception as exc:
+                logger.exception('Error occurred while reconciling player list', exc_info=exc)
+                changed = False
+            # Back off while nothing changes, check again soon after a difference was found
+            interval = options.min_interval if changed else min(interval * 2, options.max_interval)
+
+    def start_reconciler(self):
+        with self.lock():
+            if self.__reconciler_running or config.player_list_reconcile.min_interval <= 0:
+                return
+            self.__reconciler_running = True
+            self.__stop_event.clear()
+            self.__reconcile_loop()
+
+    def stop_reconciler(self):
+        with self.lock():
+            self.__reconciler_running = False
+            self.__stop_event.set()
+
+    def register_event_listeners(self, server: PluginServerInterface):
+        server.register_event_listener(MCDRPluginEvents.SERVER_STARTUP, lambda server: self.on_server_startup())
+        server.register_event_listener(MCDRPluginEvents.SERVER_STOP, lambda server, return_code: self.on_server_stop())
+        server.register_event_listener(MCDRPluginEvents.PLAYER_JOINED, lambda server, player, info: self.on_player_joined(player))
+        server.register_event_listener(MCDRPluginEvents.PLAYER_LEFT, lambda server, player: self.on_player_left(player))
+
+    def on_player_joined(self, player: str):
+        self.add(player)
+        self.preload_storage(player)
+
+    def on_player_left(self, player: str):
+        self.remove(player)
+        PluginEventLoop.get_instance().cancel(player)
+        self.release_storage(player)
+
+    @named_thread
+    def preload_storage(self, *player: str):
+        for item in player:
+            AbstractPlayerStorage.preload_player(item)
+
+    @named_thread
+    def release_storage(self, *player: str):
+        for item in player:
+            if not self.is_online(item):
+                AbstractPlayerStorage.release_player(item)
 
     @named_thread
     def init_player_list(self):
         with self.lock():
             if psi.is_server_startup():
-                amount, limit, player_list = get_server_player_list(timeout=config.mda_timeout)
+                try:
+                    amount, limit, player_list = self.query_player_list()
+                except MDAUnavailableError as exc:
+                    return logger.warning('Failed to initialize online player list: %s', exc)
                 self.add(*player_list)
                 self.__limit = limit
+                self.preload_storage(*player_list)
 
     @named_thread
     def on_server_startup(self):
         with self.lock():
             if psi.is_server_startup():
-                limit = get_server_player_list(timeout=config.mda_timeout)[1]
+                try:
+                    limit = self.query_player_list()[1]
+                except MDAUnavailableError as exc:
+                    return logger.warning('Failed to query player limit: %s', exc)
                 self.__limit = limit
 
     def on_server_stop(self):
         with self.lock():
+            players = self.__list
             self.__limit = None
             self.__list = []
+        self.release_storage(*players)
@@ -0,0 +1,127 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Optional, List, Tuple
+
+from lazybing_thb.storage.config import config
+from lazybing_thb.utils import psi, logger, named_thread, get_thread_prefix, ensure_dir
+
+
+class StackSampler:
+    """
+    On-demand sampling profiler of plugin threads
+    Nothing runs while it is stopped, sampling costs one sys._current_frames() call per interval while running
+    Results are written as collapsed stacks, which can be rendered by flamegraph.pl or speedscope
+    """
+    __inst: Optional["StackSampler"] = None
+    PROFILE_FOLDER = 'profile'
+    # Command callbacks of MCDR run on its task executor thread
+    EXTRA_THREAD_NAMES = ('TaskExecutor',)
+    MEMORY_TOP_STATS = 50
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__stop_event = threading.Event()
+        self.__stacks: Counter = Counter()
+        self.__sample_count = 0
+        self.__started_at: Optional[float] = None
+        self.__trace_memory = False
+        self.__thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def get_instance(cls) -> "StackSampler":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    @property
+    def is_running(self) -> bool:
+        return self.__started_at is not None
+
+    def __is_target(self, thread_name: str, prefix: str) -> bool:
+        return thread_name.startswith(prefix) or thread_name in self.EXTRA_THREAD_NAMES
+
+    @staticmethod
+    def __collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        names.reverse()
+        return ';'.join(names)
+
+    def __sample(self, prefix: str):
+        sampler_ident = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            name = names.get(ident)
+            if ident == sampler_ident or name is None or not self.__is_target(name, prefix):
+                continue
+            self.__stacks[f'{name};{self.__collapse(frame)}'] += 1
+        self.__sample_count += 1
+
+    @named_thread('StackSampler')
+    def __run(self):
+        prefix = get_thread_prefix()
+        interval = max(config.profiler.sample_interval, 0.001)
+        while not self.__stop_event.wait(interval):
+            self.__sample(prefix)
+
+    def start(self, trace_memory: bool = False) -> bool:
+        """
+        :return: False if the profiler is already running
+        """
+        with self.__lock:
+            if self.is_running:
+                return False
+            self.__stacks.clear()
+            self.__sample_count = 0
+            self.__stop_event.clear()
+            self.__started_at = time.time()
+            self.__trace_memory = trace_memory and not tracemalloc.is_tracing()
+            if self.__trace_memory:
+                tracemalloc.start(config.profiler.memory_frames)
+            self.__thread = self.__run()
+            return True
+
+    def stop(self) -> Optional[Tuple[int, List[str]]]:
+        """
+        Stop profiling and write results into the profile folder of plugin data folder
+        :return: Amount of samples and written file names, None if the profiler is not running
+        """
+        with self.__lock:
+            if not self.is_running:
+                return None
+            self.__stop_event.set()
+            self.__thread.join()
+            self.__thread = None
+            snapshot = None
+            if self.__trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                self.__trace_memory = False
+            file_prefix = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.__started_at))
+            self.__started_at = None
+
+            folder = os.path.join(psi.get_data_folder(), self.PROFILE_FOLDER)
+            ensure_dir(folder)
+            written = [f'cpu-{file_prefix}.collapsed']
+            with open(os.path.join(folder, written[0]), 'w', encoding='utf8') as f:
+                for stack, count in self.__stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+            if snapshot is not None:
+                written.append(f'memory-{file_prefix}.txt')
+                with open(os.path.join(folder, written[1]), 'w', encoding='utf8') as f:
+                    for stat in snapshot.statistics('traceback')[:self.MEMORY_TOP_STATS]:
+                        f.write(f'{stat}\n')
+                        for line in stat.traceback.format():
+                            f.write(f'{line}\n')
+                        f.write('\n')
+            sample_count = self.__sample_count
+            self.__stacks.clear()
+        logger.info('Profiling finished with %d samples, results written to %s', sample_count, ', '.join(written))
+        return sample_count, written
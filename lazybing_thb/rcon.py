@@ -0,0 +1,167 @@
+import itertools
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Optional, Dict, Union
+
+from lazybing_thb.mda_gateway import MDAUnavailableError
+from lazybing_thb.utils import logger, named_thread
+
+
+class RconError(MDAUnavailableError):
+    pass
+
+
+class RconClient:
+    """
+    Persistent RCON client supporting request pipelining
+    Multiple requests can be in flight at once, responses are matched to requests by their request id
+    """
+    TYPE_RESPONSE = 0
+    TYPE_COMMAND = 2
+    TYPE_LOGIN = 3
+
+    def __init__(self, address: str, port: int, password: str, reconnect_interval: Union[int, float] = 5.0):
+        self.address = address
+        self.port = port
+        self.password = password
+        self.reconnect_interval = reconnect_interval
+        self.__socket: Optional[socket.socket] = None
+        self.__connect_lock = threading.RLock()
+        self.__send_lock = threading.Lock()
+        self.__pending: Dict[int, Future] = {}
+        self.__pending_lock = threading.Lock()
+        self.__request_ids = itertools.count(1)
+        self.__last_attempt: Optional[float] = None
+        self.__receiver: Optional[threading.Thread] = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self.__socket is not None
+
+    @staticmethod
+    def __pack(request_id: int, packet_type: int, payload: str) -> bytes:
+        body = struct.pack('<ii', request_id, packet_type) + payload.encode('utf8') + b'\x00\x00'
+        return struct.pack('<i', len(body)) + body
+
+    @staticmethod
+    def __receive_exact(sock: socket.socket, length: int) -> bytes:
+        data = b''
+        while len(data) < length:
+            chunk = sock.recv(length - len(data))
+            if len(chunk) == 0:
+                raise ConnectionError('Connection closed by remote')
+            data += chunk
+        return data
+
+    def __receive_packet(self, sock: socket.socket):
+        length = struct.unpack('<i', self.__receive_exact(sock, 4))[0]
+        data = self.__receive_exact(sock, length)
+        request_id, packet_type = struct.unpack('<ii', data[:8])
+        return request_id, packet_type, data[8:-2].decode('utf8', errors='replace')
+
+    def connect(self, timeout: Union[int, float] = 5.0) -> None:
+        with self.__connect_lock:
+            if self.__socket is not None:
+                return
+            now = time.monotonic()
+            if self.__last_attempt is not None and now - self.__last_attempt < self.reconnect_interval:
+                raise RconError('Waiting to reconnect RCON')
+            self.__last_attempt = now
+            try:
+                sock = socket.create_connection((self.address, self.port), timeout=timeout)
+                sock.sendall(self.__pack(0, self.TYPE_LOGIN, self.password))
+                request_id, _, _ = self.__receive_packet(sock)
+            except (OSError, struct.error) as exc:
+                raise RconError(f'Failed to connect RCON at {self.address}:{self.port}') from exc
+            if request_id == -1:
+                sock.close()
+                raise RconError('RCON authentication failed')
+            sock.settimeout(None)
+            self.__socket = sock
+            self.__last_attempt = None
+            self.__receiver = self.__receive_loop(sock)
+            logger.info('RCON connected to %s:%d', self.address, self.port)
+
+    @named_thread('RconReceiver')
+    def __receive_loop(self, sock: socket.socket):
+        try:
+            while True:
+                request_id, _, payload = self.__receive_packet(sock)
+                with self.__pending_lock:
+                    future = self.__pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(payload)
+        except (OSError, struct.error) as exc:
+            self.__on_disconnect(sock, exc)
+
+    def __on_disconnect(self, sock: socket.socket, exc: Optional[Exception] = None) -> None:
+        with self.__connect_lock:
+            if self.__socket is sock:
+                self.__socket = None
+                if exc is not None:
+                    logger.warning('RCON connection lost: %s', exc)
+        # Closing alone does not wake up the receiver thread blocked in recv
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            sock.close()
+        except OSError:
+            pass
+        with self.__pending_lock:
+            pending, self.__pending = self.__pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(RconError('RCON connection lost'))
+
+    def submit(self, command: str) -> Future:
+        """
+        Send a command without waiting for its response, connecting first if needed
+        """
+        self.connect()
+        sock = self.__socket
+        if sock is None:
+            raise RconError('RCON not connected')
+        future = Future()
+        request_id = next(self.__request_ids) & 0x7fffffff
+        with self.__pending_lock:
+            self.__pending[request_id] = future
+        try:
+            with self.__send_lock:
+                sock.sendall(self.__pack(request_id, self.TYPE_COMMAND, command))
+        except OSError as exc:
+            self.__on_disconnect(sock, exc)
+            raise RconError('Failed to send RCON command') from exc
+        return future
+
+    def discard(self, *futures: Future) -> None:
+        """
+        Stop waiting for responses of submitted commands, e.g. after they timed out
+        Responses arriving later are dropped instead of being kept in the pending table forever
+        """
+        targets = set(futures)
+        with self.__pending_lock:
+            for request_id, pending in list(self.__pending.items()):
+                if pending in targets:
+                    del self.__pending[request_id]
+
+    def query(self, command: str, timeout: Optional[Union[int, float]] = None) -> str:
+        future = self.submit(command)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError as exc:
+            self.discard(future)
+            raise RconError(f'RCON query timed out: {command}') from exc
+
+    def close(self, timeout: Union[int, float] = 5.0) -> None:
+        with self.__connect_lock:
+            sock, receiver = self.__socket, self.__receiver
+            self.__receiver = None
+        if sock is not None:
+            self.__on_disconnect(sock)
+        if receiver is not None and receiver is not threading.current_thread():
+            receiver.join(timeout)
@@ -1,25 +1,150 @@
 import abc
 import contextlib
+import hashlib
+import json
 import os
 import shutil
+import time
 
-from threading import RLock
+from collections import Counter
+from threading import RLock, Lock
 
 from typing_extensions import Self
-from typing import Union, Type
+from typing import Union, Type, List, Dict, Optional, Tuple, Any, IO, Iterator, Callable
+from lazybing_thb.storage import codec
+from lazybing_thb.storage.atomic import atomic_open, clean_temp_files, remove_silently, after_commit, get_current_group
+from lazybing_thb.storage.config import config
+from lazybing_thb.storage.file_lock import InterProcessLock
+from lazybing_thb.storage.schema import Schema
 from lazybing_thb.utils import psi, logger
 
+FileVersion = Tuple[int, int, int]
+
 
 class AbstractPlayerStorage(abc.ABC):
     __instances = {}
+    __instances_lock = RLock()
+    __process_locks: Dict[str, InterProcessLock] = {}
+    __io_counter: Counter = Counter()
+    __io_lock = Lock()
+    __shard_folders_present: Dict[str, bool] = {}
+    # Load data into memory when player joined and release it when player left
+    cache_on_join: bool = False
+    # Data can be placed in shared storage folder and accessed by multiple MCDR instances
+    shareable: bool = False
+    # Version header of data files, files without schema are read and written as is
+    schema: Optional[Schema] = None
+    # Files can be placed in two-level hash prefix sub folders when sharded layout is enabled
+    shardable: bool = False
+    file_suffix: str = '.json'
 
     @classmethod
     def get_folder_name(cls):
         raise NotImplementedError
 
+    @classmethod
+    def is_shared(cls) -> bool:
+        return cls.shareable and config.shared_storage.enabled
+
+    @classmethod
+    def get_storage_root(cls):
+        if cls.is_shared() and config.shared_storage.folder is not None:
+            return config.shared_storage.folder
+        return psi.get_data_folder()
+
     @classmethod
     def get_folder_path(cls):
-        return os.path.join(psi.get_data_folder(), cls.get_folder_name())
+        return os.path.join(cls.get_storage_root(), cls.get_folder_name())
+
+    @classmethod
+    def is_sharded(cls) -> bool:
+        return cls.shardable and config.sharded_layout.enabled
+
+    @classmethod
+    def get_flat_file_path(cls, player: str) -> str:
+        return os.path.join(cls.get_folder_path(), player + cls.file_suffix)
+
+    @classmethod
+    def get_sharded_file_path(cls, player: str) -> str:
+        digest = hashlib.md5(player.encode('utf8')).hexdigest()
+        return os.path.join(cls.get_folder_path(), digest[:2], digest[2:4], player + cls.file_suffix)
+
+    @classmethod
+    def get_preferred_file_path(cls, player: str) -> str:
+        """
+        Path new data of the player is written to in current layout
+        """
+        return cls.get_sharded_file_path(player) if cls.is_sharded() else cls.get_flat_file_path(player)
+
+    @classmethod
+    def get_other_file_path(cls, player: str) -> Optional[str]:
+        """
+        Path the player file may still have in the other layout, until layout migration has finished
+        """
+        if not cls.shardable:
+            return None
+        if cls.is_sharded():
+            return cls.get_flat_file_path(player)
+        # Sharded layout disabled and never used, or files have been moved back already
+        return cls.get_sharded_file_path(player) if cls.has_shard_folders() else None
+
+    @classmethod
+    def has_shard_folders(cls) -> bool:
+        """
+        If the storage folder contains shard sub folders, cached until refresh_shard_folders is called
+        """
+        present = cls.__shard_folders_present.get(cls.__name__)
+        if present is None:
+            present = cls.refresh_shard_folders()
+        return present
+
+    @classmethod
+    def refresh_shard_folders(cls) -> bool:
+        present = False
+        folder = cls.get_folder_path()
+        if cls.shardable and os.path.isdir(folder):
+            with os.scandir(folder) as entries:
+                present = any(entry.is_dir() and not entry.name.startswith('.') for entry in entries)
+        cls.__shard_folders_present[cls.__name__] = present
+        return present
+
+    @classmethod
+    def iter_player_files(cls, include_shards: bool = True) -> Iterator[os.DirEntry]:
+        """
+        Walk player files of both flat and sharded layouts, without loading the whole listing into memory
+        """
+        folder = cls.get_folder_path()
+        if not os.path.isdir(folder):
+            return
+        shard_folders = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_file() and entry.name.endswith(cls.file_suffix):
+                    yield entry
+                elif include_shards and cls.shardable and entry.is_dir():
+                    shard_folders.append(entry.path)
+        for first_level in shard_folders:
+            with os.scandir(first_level) as second_levels:
+                second_level_paths = [item.path for item in second_levels if item.is_dir()]
+            for second_level in second_level_paths:
+                with os.scandir(second_level) as entries:
+                    for entry in entries:
+                        if not entry.name.startswith('.') and entry.is_file() and entry.name.endswith(cls.file_suffix):
+                            yield entry
+
+    @classmethod
+    def get_player_name(cls, entry: os.DirEntry) -> str:
+        return entry.name[:-len(cls.file_suffix)]
+
+    @classmethod
+    def get_process_lock(cls) -> InterProcessLock:
+        lock_path = os.path.join(cls.get_folder_path(), '.lock')
+        with cls.__instances_lock:
+            if lock_path not in cls.__process_locks.keys():
+                cls.__process_locks[lock_path] = InterProcessLock(lock_path)
+            return cls.__process_locks[lock_path]
 
     @classmethod
     def __get_instances(cls):
@@ -29,9 +154,129 @@ class AbstractPlayerStorage(abc.ABC):
 
     @classmethod
     def get_instance(cls: Type[Self], player: str) -> Self:
-        if player not in cls.__instances.keys():
-            cls.__get_instances()[player] = cls(player)
-        return cls.__get_instances()[player]
+        with cls.__instances_lock:
+            instances = cls.__get_instances()
+            if player not in instances.keys():
+                instances[player] = cls(player)
+            inst = instances[player]
+            # Requested by the plugin, no longer released when a background job is done with it
+            inst.__borrowed = False
+            return inst
+
+    @classmethod
+    def borrow_instance(cls: Type[Self], player: str) -> Optional[Self]:
+        """
+        Instance for background jobs working on files of players not cached, None if the player is cached
+        A player joining meanwhile gets the same instance and waits for the job through its lock
+        Hand it back with release_borrowed
+        """
+        with cls.__instances_lock:
+            instances = cls.__get_instances()
+            if player in instances.keys():
+                return None
+            inst = instances[player] = cls(player)
+            inst.__borrowed = True
+            return inst
+
+    @classmethod
+    def release_borrowed(cls: Type[Self], inst: Self) -> bool:
+        """
+        Release an instance got from borrow_instance, kept if it was requested through get_instance meanwhile
+        :return: If the instance was released
+        """
+        return cls.evict_if(inst.player, lambda cached: cached is inst and cached.__borrowed)
+
+    @classmethod
+    def get_cached_players(cls) -> List[str]:
+        with cls.__instances_lock:
+            return list(cls.__get_instances().keys())
+
+    @classmethod
+    def count_cached_records(cls) -> int:
+        """
+        Amount of records held in memory by all instances of this storage type
+        """
+        with cls.__instances_lock:
+            instances = list(cls.__get_instances().values())
+        return sum(inst.get_cached_record_count() for inst in instances)
+
+    @classmethod
+    def evict(cls, player: str):
+        """
+        Flush and release the in-memory instance of a player
+        """
+        with cls.__instances_lock:
+            inst = cls.__get_instances().pop(player, None)
+        if inst is not None:
+            inst.flush()
+
+    @classmethod
+    def evict_if(cls: Type[Self], player: str, predicate: Callable[[Self], bool]) -> bool:
+        """
+        Same as evict, but only if predicate holds for the instance, checked with instances locked
+        :return: If the instance was released
+        """
+        with cls.__instances_lock:
+            instances = cls.__get_instances()
+            inst = instances.get(player)
+            if inst is None or not predicate(inst):
+                return False
+            del instances[player]
+        inst.flush()
+        return True
+
+    @classmethod
+    def get_storage_classes(cls) -> List[Type["AbstractPlayerStorage"]]:
+        result = []
+        for sub_cls in cls.__subclasses__():
+            result.append(sub_cls)
+            result += sub_cls.get_storage_classes()
+        return result
+
+    @classmethod
+    def __count_io(cls, kind: str, path: str):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        with cls.__io_lock:
+            cls.__io_counter[f'{kind}_files'] += 1
+            cls.__io_counter[f'{kind}_bytes'] += size
+
+    @classmethod
+    def get_io_statistics(cls) -> Dict[str, int]:
+        """
+        Amount of files and bytes read and written by all storages since plugin loaded
+        """
+        with cls.__io_lock:
+            return {
+                key: cls.__io_counter[key] for key in ('read_files', 'read_bytes', 'written_files', 'written_bytes')
+            }
+
+    @classmethod
+    def get_cached_storage_classes(cls) -> List[Type["AbstractPlayerStorage"]]:
+        result = []
+        for sub_cls in cls.__subclasses__():
+            if sub_cls.cache_on_join:
+                result.append(sub_cls)
+            result += sub_cls.get_cached_storage_classes()
+        return result
+
+    @classmethod
+    def preload_player(cls, player: str):
+        for storage_cls in AbstractPlayerStorage.get_cached_storage_classes():
+            try:
+                storage_cls.get_instance(player).preload()
+            except Exception as exc:
+                logger.exception(f"Failed to preload {storage_cls.__name__} for {player}", exc_info=exc)
+
+    @classmethod
+    def release_player(cls, player: str):
+        for storage_cls in AbstractPlayerStorage.get_cached_storage_classes():
+            try:
+                storage_cls.evict(player)
+            except Exception as exc:
+                logger.exception(f"Failed to release {storage_cls.__name__} for {player}", exc_info=exc)
 
     @classmethod
     def resolve_dir(cls):
@@ -39,17 +284,65 @@ class AbstractPlayerStorage(abc.ABC):
             os.remove(cls.get_folder_path())
         if not os.path.isdir(cls.get_folder_path()):
             os.makedirs(cls.get_folder_path())
+        clean_temp_files(cls.get_folder_path(), recursive=cls.shardable)
+        cls.refresh_shard_folders()
 
     def __init__(self, player: str):
         self.__player: str = player
         self.__lock = RLock()
+        self.__file_version: Optional[FileVersion] = None
+        self.__schema_outdated = False
+        self.__borrowed = False
 
     @property
     def player(self):
         return self.__player
 
-    def get_file_path(self):
-        raise NotImplementedError
+    def get_file_path(self) -> str:
+        """
+        Existing file of the player, both layouts are checked while layout migration is in progress
+        """
+        path = self.get_preferred_file_path(self.player)
+        other_path = self.get_other_file_path(self.player)
+        if other_path is not None and not os.path.exists(path) and os.path.exists(other_path):
+            return other_path
+        return path
+
+    def relocate_file(self) -> bool:
+        """
+        Move player file into the folder of current layout
+        :return: If the file was moved
+        """
+        other_path = self.get_other_file_path(self.player)
+        with self.transaction():
+            if other_path is None or not os.path.isfile(other_path):
+                return False
+            path = self.get_preferred_file_path(self.player)
+            if os.path.exists(path):
+                # Data in current layout is written later, the other one is out-dated
+                remove_silently(other_path)
+                return False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(other_path, path)
+            return True
+
+    def preload(self):
+        """
+        Load player data into memory cache
+        """
+        pass
+
+    def flush(self):
+        """
+        Write pending in-memory changes to file before instance is released
+        """
+        pass
+
+    def get_cached_record_count(self) -> int:
+        """
+        Amount of records held in memory cache, see count_cached_records
+        """
+        return 0
 
     @contextlib.contextmanager
     def lock(self, blocking: bool = True, timeout: Union[float, int] = -1):
@@ -60,6 +353,88 @@ class AbstractPlayerStorage(abc.ABC):
             if acq:
                 self.__lock.release()
 
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Lock for read-modify-write operations
+        In shared storage mode other MCDR instances are excluded as well, and data changed by them is reloaded
+        """
+        with self.lock():
+            if not self.is_shared():
+                yield
+                return
+            with self.get_process_lock():
+                if self.is_stale():
+                    self.invalidate()
+                yield
+                group = get_current_group()
+                if group is not None:
+                    # Writes deferred by a write group have to land before other MCDR instances are let in
+                    group.commit()
+
+    def get_file_version(self) -> Optional[FileVersion]:
+        try:
+            stat = os.stat(self.get_file_path())
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def mark_synced(self):
+        """
+        Remember current file version as the one in memory cache
+        """
+        if not self.is_shared():
+            return
+        group = get_current_group()
+        path = self.get_preferred_file_path(self.player)
+        if group is not None and group.is_pending(path):
+            # The file is not renamed into place yet
+            group.after_commit(self.mark_synced, path)
+            return
+        self.__file_version = self.get_file_version()
+
+    def is_stale(self) -> bool:
+        """
+        If file was changed by another MCDR instance since last load or save, always False when storage is not shared
+        """
+        return self.is_shared() and self.get_file_version() != self.__file_version
+
+    def invalidate(self):
+        """
+        Drop memory cache so that data is reloaded from file on next access
+        """
+        pass
+
+    def load_json(self, f: IO[str]) -> Any:
+        """
+        Read file content, upgrading it to current schema version
+        :raise ValueError: Invalid json, or data can't be upgraded
+        """
+        raw = json.load(f)
+        if self.schema is None:
+            return raw
+        data, self.__schema_outdated = self.schema.unwrap(raw)
+        return data
+
+    def dump_json(self, f: IO[str], data: Any):
+        if self.schema is not None:
+            data = self.schema.wrap(data)
+        f.write(codec.dumps(data, indent=config.storage_indent))
+        self.__schema_outdated = False
+
+    def is_schema_outdated(self) -> bool:
+        """
+        If data in memory was upgraded from an older schema version and hasn't been saved yet
+        """
+        return self.__schema_outdated
+
+    def migrate(self) -> bool:
+        """
+        Write data of older schema version back in current version
+        :return: If data was written back
+        """
+        return False
+
     def exists(self):
         with self.lock():
             return os.path.isfile(self.get_file_path())
@@ -73,9 +448,37 @@ class AbstractPlayerStorage(abc.ABC):
             if os.path.isdir(self.get_file_path()):
                 shutil.rmtree(self.get_file_path())
 
+    def quarantine_file(self):
+        """
+        Move an unreadable file aside instead of overwriting it, so that it can be recovered manually
+        """
+        with self.lock():
+            broken_path = f"{self.get_file_path()}.broken-{int(time.time())}"
+            os.replace(self.get_file_path(), broken_path)
+            logger.warning(f"Unreadable file of {self.player} moved to {os.path.basename(broken_path)}")
+
+    def __on_written(self, path: str):
+        self.__count_io('written', path)
+        other_path = self.get_other_file_path(self.player)
+        if other_path is not None:
+            # File is now written in current layout, drop the copy left in the other one
+            remove_silently(other_path)
+
     @contextlib.contextmanager
     def open(self, mode: str = 'r', encoding: str = 'utf8'):
+        """
+        Files opened with mode "w" are written atomically through a temp file
+        """
         with self.lock():
             self.ensure_file()
-            with open(self.get_file_path(), mode=mode, encoding=encoding) as f:
-                yield f
+            if mode == 'w':
+                path = self.get_preferred_file_path(self.player)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with atomic_open(path, encoding=encoding) as f:
+                    yield f
+                after_commit(lambda: self.__on_written(path), path)
+            else:
+                path = self.get_file_path()
+                self.__count_io('read', path)
+                with open(path, mode=mode, encoding=encoding) as f:
+                    yield f
@@ -0,0 +1,228 @@
+import contextlib
+import ctypes
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Set, Callable, List, Tuple
+
+from lazybing_thb.storage.config import config
+from lazybing_thb.utils import logger
+
+TEMP_SUFFIX = '.tmp'
+__local = threading.local()
+
+
+def fsync_dir(folder: str) -> None:
+    # Persist the rename itself, directories can't be opened for fsync on Windows
+    if os.name != 'posix':
+        return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def __load_syncfs() -> Optional[Callable[[int], int]]:
+    # syncfs(2) is Linux only and not wrapped by the os module
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        func = ctypes.CDLL(None, use_errno=True).syncfs
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int]
+    func.restype = ctypes.c_int
+    return func
+
+
+__syncfs = __load_syncfs()
+
+
+def can_sync_filesystem() -> bool:
+    return __syncfs is not None
+
+
+def use_sync_filesystem() -> bool:
+    """
+    If grouped writes are flushed with syncfs, only when explicitly enabled since it flushes the whole file system
+    """
+    return config.atomic_write.sync_file_system and can_sync_filesystem()
+
+
+def sync_filesystem(folder: str) -> None:
+    """
+    Flush all dirty data and metadata of the file system containing folder with a single syncfs call
+    """
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        if __syncfs(fd) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), folder)
+    finally:
+        os.close(fd)
+
+
+def remove_silently(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class AtomicWriteGroup:
+    """
+    Atomic writes deferred until the group is committed, so a write burst shares its directory syncs
+    Every temp file is synced before it is closed, and each folder once after all renames.
+    With sync_file_system enabled, the group syncs each file system once before renaming and once after instead
+    """
+    def __init__(self):
+        self.__pending: Dict[str, str] = {}  # final path -> temp path
+        self.__callbacks: List[Tuple[Optional[str], Callable[[], None]]] = []
+
+    def add(self, temp_path: str, final_path: str) -> None:
+        previous = self.__pending.get(final_path)
+        if previous is not None:
+            remove_silently(previous)
+        self.__pending[final_path] = temp_path
+
+    def is_pending(self, final_path: str) -> bool:
+        return final_path in self.__pending
+
+    def after_commit(self, callback: Callable[[], None], path: Optional[str] = None) -> None:
+        """
+        Run callback once pending writes are renamed into place, dropped if the group is aborted
+        :param path: The file callback belongs to, callback still runs if the file was renamed before the commit failed
+        """
+        self.__callbacks.append((path, callback))
+
+    def commit(self) -> None:
+        """
+        Rename pending writes into place, if it fails halfway the files not renamed yet are dropped
+        """
+        renamed: Set[str] = set()
+        try:
+            self.__sync_and_rename(renamed)
+        except BaseException:
+            callbacks = [callback for path, callback in self.__callbacks if path in renamed]
+            self.abort()
+            for callback in callbacks:
+                callback()
+            raise
+        callbacks, self.__callbacks = self.__callbacks, []
+        for _, callback in callbacks:
+            callback()
+
+    def __sync_and_rename(self, renamed: Set[str]) -> None:
+        folders: Set[str] = {os.path.dirname(final_path) for final_path in self.__pending.keys()}
+        fsync = config.atomic_write.fsync
+        # One folder for each file system written, shared storage folder may sit on another one than plugin data
+        file_systems = list({os.stat(folder).st_dev: folder for folder in folders}.values()) \
+            if fsync and use_sync_filesystem() else []
+        for folder in file_systems:
+            sync_filesystem(folder)
+        for final_path, temp_path in list(self.__pending.items()):
+            os.replace(temp_path, final_path)
+            del self.__pending[final_path]
+            renamed.add(final_path)
+        if fsync and use_sync_filesystem():
+            for folder in file_systems:
+                sync_filesystem(folder)
+        elif fsync:
+            for folder in folders:
+                fsync_dir(folder)
+
+    def abort(self) -> None:
+        for temp_path in self.__pending.values():
+            remove_silently(temp_path)
+        self.__pending.clear()
+        self.__callbacks.clear()
+
+
+def get_current_group() -> Optional[AtomicWriteGroup]:
+    return getattr(__local, 'group', None)
+
+
+def after_commit(callback: Callable[[], None], path: Optional[str] = None) -> None:
+    """
+    Run callback after writes of current write group are renamed into place, or at once if there is no group
+    :param path: The file callback belongs to, see AtomicWriteGroup.after_commit
+    """
+    group = get_current_group()
+    if group is not None:
+        group.after_commit(callback, path)
+    else:
+        callback()
+
+
+@contextlib.contextmanager
+def write_group():
+    """
+    Group atomic writes issued in current thread, nested groups join the outer one
+    """
+    outer = get_current_group()
+    if outer is not None or not config.atomic_write.group_fsync:
+        yield outer
+        return
+    group = AtomicWriteGroup()
+    __local.group = group
+    try:
+        yield group
+    except BaseException:
+        group.abort()
+        raise
+    else:
+        group.commit()
+    finally:
+        __local.group = None
+
+
+@contextlib.contextmanager
+def atomic_open(path: str, encoding: str = 'utf8'):
+    """
+    Open a file for writing, content replaces the target file only after it is completely written
+    A crash during writing leaves the original file untouched
+    """
+    folder, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix=TEMP_SUFFIX, dir=folder)
+    try:
+        group = get_current_group()
+        with os.fdopen(fd, 'w', encoding=encoding) as f:
+            yield f
+            f.flush()
+            # Files of a group are synced together on commit if it syncs the file system
+            if config.atomic_write.fsync and (group is None or not use_sync_filesystem()):
+                os.fsync(f.fileno())
+        if group is not None:
+            group.add(temp_path, path)
+        else:
+            os.replace(temp_path, path)
+            if config.atomic_write.fsync:
+                fsync_dir(folder)
+    except BaseException:
+        remove_silently(temp_path)
+        raise
+
+
+def clean_temp_files(folder: str, min_age: float = 600, recursive: bool = False) -> None:
+    """
+    Remove temp files left behind by writes interrupted by a crash
+    Recent ones are kept since they may belong to writes in progress of other MCDR instances
+    :param recursive: Clean sub folders as well, e.g. shard folders of sharded layout
+    """
+    if not os.path.isdir(folder):
+        return
+    deadline = time.time() - min_age
+    sub_folders = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') and entry.name.endswith(TEMP_SUFFIX) and entry.is_file() \
+                    and entry.stat().st_mtime < deadline:
+                logger.debug('Removing unfinished write %s', entry.name)
+                remove_silently(entry.path)
+            elif recursive and not entry.name.startswith('.') and entry.is_dir(follow_symlinks=False):
+                sub_folders.append(entry.path)
+    for sub_folder in sub_folders:
+        clean_temp_files(sub_folder, min_age, recursive)
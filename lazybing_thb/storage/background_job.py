@@ -0,0 +1,66 @@
+import threading
+from typing import Iterable, Iterator, TypeVar, Union
+
+from lazybing_thb.utils import named_thread
+
+T = TypeVar('T')
+
+
+class BackgroundJob:
+    """
+    Skeleton of low priority background jobs, started once at a time on a named thread and stopped by an event
+    Subclasses implement run, long scans are paced with throttled so that they never compete with commands
+    """
+    thread_name: str = 'BackgroundJob'
+
+    def __init__(self):
+        self.__stop_event = threading.Event()
+        self.__lock = threading.Lock()
+        self.__running = False
+
+    def is_enabled(self) -> bool:
+        return True
+
+    def run(self) -> None:
+        raise NotImplementedError
+
+    def is_stopped(self) -> bool:
+        return self.__stop_event.is_set()
+
+    def wait(self, timeout: Union[int, float]) -> bool:
+        """
+        Sleep until timeout or until the job is stopped
+        :return: If the job is stopped
+        """
+        return self.__stop_event.wait(timeout)
+
+    def throttled(self, items: Iterable[T], batch_size: int, batches_per_second: Union[int, float]) -> Iterator[T]:
+        """
+        Yield items until the job is stopped, pausing after every batch_size items
+        """
+        batch_interval = 1 / batches_per_second if batches_per_second > 0 else 0
+        for count, item in enumerate(items, start=1):
+            if self.__stop_event.is_set():
+                return
+            yield item
+            if count % max(batch_size, 1) == 0:
+                self.__stop_event.wait(batch_interval)
+
+    def __run(self):
+        try:
+            self.run()
+        finally:
+            with self.__lock:
+                self.__running = False
+
+    def start(self) -> None:
+        with self.__lock:
+            if self.__running or not self.is_enabled():
+                return
+            self.__running = True
+            self.__stop_event.clear()
+            named_thread(self.thread_name)(self.__run)()
+
+    def stop(self) -> None:
+        with self.__lock:
+            self.__stop_event.set()
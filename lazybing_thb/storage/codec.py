@@ -0,0 +1,76 @@
+import json
+from typing import Dict, Any, Optional
+
+from lazybing_thb.storage.record import LocationRecord, HistoryRecord, DimensionTable
+
+VALID_INT_DIMENSIONS = (-1, 0, 1)
+
+
+def __check_number(data: dict, key: str):
+    value = data[key]
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(f'Invalid value type found for {key}: {type(value).__name__}')
+    return value
+
+
+def __check_dimension(data: dict):
+    value = data['dim']
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise TypeError(f'Invalid value type found for dim: {type(value).__name__}')
+    if isinstance(value, int) and value not in VALID_INT_DIMENSIONS:
+        raise ValueError("Invalid integer value found for dimensions")
+    return value
+
+
+def encode_location_record(record: LocationRecord) -> Dict[str, Any]:
+    return {'x': record.x, 'y': record.y, 'z': record.z, 'dim': record.dim}
+
+
+def decode_location_record(data: Any) -> LocationRecord:
+    if not isinstance(data, dict):
+        raise TypeError(f'Location should be an object, not {type(data).__name__}')
+    try:
+        return LocationRecord(
+            __check_number(data, 'x'), __check_number(data, 'y'), __check_number(data, 'z'),
+            DimensionTable.get_code(__check_dimension(data))
+        )
+    except KeyError as exc:
+        raise ValueError(f'Missing key {exc} in location data') from exc
+
+
+def encode_history_record(record: HistoryRecord) -> Dict[str, Any]:
+    data = encode_location_record(record)
+    data['timestamp'] = record.timestamp
+    data['warned'] = record.warned
+    return data
+
+
+def decode_history_record(data: Any) -> HistoryRecord:
+    location = decode_location_record(data)
+    try:
+        timestamp = __check_number(data, 'timestamp')
+    except KeyError as exc:
+        raise ValueError('Missing key timestamp in history data') from exc
+    warned = data.get('warned', False)
+    if not isinstance(warned, bool):
+        raise TypeError(f'Invalid value type found for warned: {type(warned).__name__}')
+    return HistoryRecord(location.x, location.y, location.z, location.dim_code, timestamp, warned)
+
+
+def encode_home_records(homes: Dict[str, LocationRecord]) -> Dict[str, Dict[str, Any]]:
+    return {name: encode_location_record(record) for name, record in homes.items()}
+
+
+def decode_home_records(data: Any) -> Dict[str, LocationRecord]:
+    if not isinstance(data, dict):
+        raise TypeError(f'Home data should be an object, not {type(data).__name__}')
+    return {str(name): decode_location_record(record) for name, record in data.items()}
+
+
+def dumps(data: Any, indent: Optional[int] = None) -> str:
+    """
+    Compact JSON output by default, pass indent for human-readable files
+    """
+    if indent is None:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return json.dumps(data, ensure_ascii=False, indent=indent)
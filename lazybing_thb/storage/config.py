@@ -15,8 +15,13 @@ class PermissionRequirements(Serializable):
     reload: int = 3
 
     tpa: int = 0
+    group_tpa: int = 2
     home: int = 0
+    home_admin: int = 3
+    profile: int = 3
     back: int = 0
+    warp: int = 0
+    warp_manage: int = 2
 
 
 class CommandPrefix(Serializable):
@@ -24,6 +29,7 @@ class CommandPrefix(Serializable):
     tpa: PrefixType = "!!tpa"
     tpc: PrefixType = "!!tpc"
     back: PrefixType = "!!back"
+    warp: PrefixType = "!!warp"
 
     @property
     def home_(self) -> List[str]:
@@ -41,11 +47,119 @@ class CommandPrefix(Serializable):
     def back_(self) -> List[str]:
         return [self.back] if isinstance(self.back, str) else self.back
 
+    @property
+    def warp_(self) -> List[str]:
+        return [self.warp] if isinstance(self.warp, str) else self.warp
+
     @property
     def help_message_prefix(self):
         return self.home_[0]
 
 
+class PlayerListReconcileOptions(Serializable):
+    min_interval: Union[int, float] = 30  # seconds, 0 to disable reconciling
+    max_interval: Union[int, float] = 600  # seconds
+
+
+class LogFileOptions(Serializable):
+    max_size: int = 1024  # KiB, 0 to disable size rotation
+    rotate_interval: Union[int, float] = 24  # hrs, 0 to disable time rotation
+    backup_count: int = 5
+    compress: bool = True
+
+
+class MDAGatewayOptions(Serializable):
+    max_in_flight: int = 4
+    max_waiting: int = 32
+    queue_timeout: Union[int, float] = 5.0  # seconds
+    min_timeout: Union[int, float] = 0.5  # seconds
+    failure_threshold: int = 3
+    breaker_cooldown: Union[int, float] = 15.0  # seconds
+
+
+class CommandBatchOptions(Serializable):
+    window: Union[int, float] = 0.05  # seconds, 0 to disable batching
+    max_size: int = 64
+
+
+class HistoryWriterOptions(Serializable):
+    window: Union[int, float] = 0.5  # seconds, 0 to write every history immediately
+    max_size: int = 256
+
+
+class RconOptions(Serializable):
+    # Leave as null to use the rcon settings of MCDR
+    address: Optional[str] = None
+    port: Optional[int] = None
+    password: Optional[str] = None
+    reconnect_interval: Union[int, float] = 5.0  # seconds
+
+
+class HistorySweeperOptions(Serializable):
+    retention: Union[int, float] = 30  # days, 0 to disable sweeping
+    interval: Union[int, float] = 6  # hrs
+    batch_size: int = 50
+    batches_per_second: Union[int, float] = 2
+    archive: bool = False
+
+
+class SchemaMigrationOptions(Serializable):
+    enabled: bool = True
+    batch_size: int = 50
+    batches_per_second: Union[int, float] = 2
+
+
+class ShardedLayoutOptions(Serializable):
+    enabled: bool = False
+    # Files moved between layouts per batch, and batches per second
+    batch_size: int = 100
+    batches_per_second: Union[int, float] = 2
+
+
+class SharedStorageOptions(Serializable):
+    enabled: bool = False
+    # Folder containing home and history data shared by MCDR instances, leave as null to use plugin data folder
+    folder: Optional[str] = None
+
+
+class AtomicWriteOptions(Serializable):
+    fsync: bool = True
+    # Bulk writes are renamed together, each file is synced and every folder is synced once after the renames
+    group_fsync: bool = True
+    # Sync grouped writes with one syncfs per file system instead, Linux only
+    # It also flushes every other dirty file on that file system, e.g. the world
+    sync_file_system: bool = False
+
+
+class ProfilerOptions(Serializable):
+    sample_interval: Union[int, float] = 0.01  # seconds
+    # Frames kept for each allocation traceback when memory tracing is enabled
+    memory_frames: int = 10
+
+
+class TraceOptions(Serializable):
+    # Record player commands into a trace file since plugin loaded
+    enabled: bool = False
+    max_records: int = 100000  # per trace file, 0 for unlimited
+
+
+class CensusOptions(Serializable):
+    interval: Union[int, float] = 10  # minutes, 0 to disable periodical census
+    # Warning thresholds, 0 to disable warning of the resource
+    storage_instances: int = 1000  # per storage type
+    records: int = 20000  # per storage type
+    interned_dimensions: int = 64
+    request_queues: int = 200
+    pending_requests: int = 500
+    queued_histories: int = 1024
+    queued_commands: int = 1024
+    message_templates: int = 2000
+    message_template_bytes: int = 4 * 1024 * 1024
+    threads: int = 64
+    log_handlers: int = 8
+    open_files: int = 512
+
+
 class Configuration(Serializable):
     __TEMPLATE_PATH = os.path.join("resources", "default_cfg.yml")
     __CONFIG_FILE = 'config.yml'
@@ -57,8 +171,27 @@ class Configuration(Serializable):
 
     teleport_delay: int = 5
     request_expire_time: Union[int, float] = 60.0
+    max_pending_requests: int = 5
     max_home_count: int = 10
     undo_history_expire_time: int = 24  # hrs
+    storage_indent: Optional[int] = None
+    dispatch_mcdr_events: bool = False
+    message_cache: bool = True
+    atomic_write: AtomicWriteOptions = AtomicWriteOptions.get_default()
+    shared_storage: SharedStorageOptions = SharedStorageOptions.get_default()
+    sharded_layout: ShardedLayoutOptions = ShardedLayoutOptions.get_default()
+    history_sweeper: HistorySweeperOptions = HistorySweeperOptions.get_default()
+    history_writer: HistoryWriterOptions = HistoryWriterOptions.get_default()
+    schema_migration: SchemaMigrationOptions = SchemaMigrationOptions.get_default()
+    log_file: LogFileOptions = LogFileOptions.get_default()
+    mda_gateway: MDAGatewayOptions = MDAGatewayOptions.get_default()
+    command_batch: CommandBatchOptions = CommandBatchOptions.get_default()
+    profiler: ProfilerOptions = ProfilerOptions.get_default()
+    census: CensusOptions = CensusOptions.get_default()
+    trace: TraceOptions = TraceOptions.get_default()
+    player_list_reconcile: PlayerListReconcileOptions = PlayerListReconcileOptions.get_default()
+    transport: str = 'console'
+    rcon: RconOptions = RconOptions.get_default()
 
     minecraft_data_api_timeout: int
     debug: bool
@@ -159,6 +292,13 @@ class Configuration(Serializable):
             result_config.save()
 
         logger.set_verbose(result_config.is_verbose)
+        log_file = result_config.log_file
+        logger.set_file_rotation(
+            max_bytes=log_file.max_size * 1024,
+            rotate_interval=log_file.rotate_interval * 60 * 60,
+            backup_count=log_file.backup_count,
+            compress=log_file.compress
+        )
         return result_config
 
     def save(self):
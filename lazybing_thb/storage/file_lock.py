@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class InterProcessLock:
+    """
+    Exclusive lock on a lock file, shared by every process using the same path
+    Reentrant within a thread: the file is locked by the outermost acquire and unlocked by the outermost release
+    """
+    def __init__(self, path: str, poll_interval: float = 0.05):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.__fd: Optional[int] = None
+        self.__thread_lock = threading.RLock()
+        self.__depth = 0
+
+    def acquire(self) -> None:
+        self.__thread_lock.acquire()
+        if self.__depth > 0:
+            # Already held by current thread
+            self.__depth += 1
+            return
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    while True:
+                        try:
+                            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                            break
+                        except OSError:
+                            time.sleep(self.poll_interval)
+            except BaseException:
+                os.close(fd)
+                raise
+            self.__fd = fd
+            self.__depth = 1
+        except BaseException:
+            self.__thread_lock.release()
+            raise
+
+    def release(self) -> None:
+        if self.__depth > 1:
+            self.__depth -= 1
+            self.__thread_lock.release()
+            return
+        fd, self.__fd, self.__depth = self.__fd, None, 0
+        try:
+            if fd is not None:
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+                    else:
+                        os.lseek(fd, 0, os.SEEK_SET)
+                        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+                finally:
+                    os.close(fd)
+        finally:
+            self.__thread_lock.release()
+
+    def __enter__(self) -> "InterProcessLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
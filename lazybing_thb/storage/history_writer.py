@@ -0,0 +1,48 @@
+from typing import Optional, List
+
+from lazybing_thb.command_batcher import BatchQueue
+from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
+from lazybing_thb.storage.atomic import write_group
+from lazybing_thb.storage.config import config
+from lazybing_thb.utils import logger
+
+
+class HistoryWriter(BatchQueue[AbstractPlayerStorage]):
+    """
+    Background writer flushing staged histories to files in bulk, each batch shares one atomic write group
+    Staged histories are served from memory at once, only the file writes are moved off the teleport path
+    A storage staged again before being written is only written once
+    """
+    __inst: Optional["HistoryWriter"] = None
+    thread_name = 'HistoryWriter'
+
+    @classmethod
+    def get_instance(cls) -> "HistoryWriter":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    def get_window(self) -> float:
+        return config.history_writer.window
+
+    def get_max_size(self) -> int:
+        return config.history_writer.max_size
+
+    def submit(self, storage: AbstractPlayerStorage) -> None:
+        """
+        Schedule pending in-memory changes of a storage to be flushed
+        """
+        self.put(storage)
+
+    def flush_batch(self, batch: List[AbstractPlayerStorage]) -> None:
+        try:
+            with write_group():
+                for storage in batch:
+                    try:
+                        storage.flush()
+                    except OSError as exc:
+                        # Changes are kept in memory, and flushed again when the storage is released
+                        logger.warning('Failed to write history of %s: %s', storage.player, exc)
+        except Exception as exc:
+            logger.exception('Error occurred while writing histories', exc_info=exc)
+        logger.debug('Wrote %d histories', len(batch))
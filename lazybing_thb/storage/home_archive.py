@@ -0,0 +1,95 @@
+import json
+import os
+import tarfile
+import time
+from typing import Tuple
+
+from lazybing_thb.storage import codec
+from lazybing_thb.storage.atomic import remove_silently
+from lazybing_thb.storage.impl.home import PlayerHomeStorage
+from lazybing_thb.storage.schema import HOME_SCHEMA
+from lazybing_thb.utils import psi, logger, ensure_dir
+
+ARCHIVE_FOLDER = 'export'
+ARCHIVE_SUFFIX = '.tar.gz'
+MEMBER_FOLDER = 'home'
+
+
+def get_archive_folder() -> str:
+    return os.path.join(psi.get_data_folder(), ARCHIVE_FOLDER)
+
+
+def get_archive_path(file_name: str) -> str:
+    """
+    :raise ValueError: File name points outside the archive folder
+    """
+    if os.path.basename(file_name) != file_name or file_name in ('', '.', '..'):
+        raise ValueError(f'Invalid archive name: {file_name}')
+    if not file_name.endswith(ARCHIVE_SUFFIX):
+        file_name += ARCHIVE_SUFFIX
+    return os.path.join(get_archive_folder(), file_name)
+
+
+def export_homes() -> Tuple[str, int]:
+    """
+    Write every player home file into one compressed archive
+    Files are streamed into the archive one by one, so memory usage doesn't grow with the amount of players
+    :return: Archive file name, amount of exported players
+    """
+    ensure_dir(get_archive_folder())
+    file_name = time.strftime('homes-%Y%m%d-%H%M%S') + ARCHIVE_SUFFIX
+    archive_path = get_archive_path(file_name)
+    temp_path = archive_path + '.tmp'
+    exported = 0
+    try:
+        with tarfile.open(temp_path, 'w|gz') as tar:
+            for entry in PlayerHomeStorage.iter_player_files():
+                # Files are replaced atomically on save, so reading them without locks is consistent
+                # Archive members are always in flat layout
+                try:
+                    tar.add(entry.path, arcname=f'{MEMBER_FOLDER}/{entry.name}', recursive=False)
+                except FileNotFoundError:
+                    continue
+                exported += 1
+        os.replace(temp_path, archive_path)
+    except BaseException:
+        remove_silently(temp_path)
+        raise
+    logger.info('Exported homes of %d players to %s', exported, file_name)
+    return file_name, exported
+
+
+def import_homes(file_name: str) -> Tuple[int, int]:
+    """
+    Restore player homes from an archive made by export_homes, homes in the archive replace existing ones
+    Members are read sequentially from the compressed stream, one player at a time
+    :raise ValueError: Invalid archive name
+    :raise FileNotFoundError: Archive doesn't exist
+    :return: Amount of imported players, amount of skipped invalid members
+    """
+    imported, skipped = 0, 0
+    with tarfile.open(get_archive_path(file_name), 'r|gz') as tar:
+        for member in tar:
+            name = os.path.basename(member.name)
+            if not member.isfile() or not name.endswith('.json'):
+                continue
+            player = name[:-len('.json')]
+            try:
+                data = codec.decode_home_records(HOME_SCHEMA.unwrap(json.load(tar.extractfile(member)))[0])
+            except (TypeError, ValueError) as exc:
+                logger.warning('Skipped invalid home data of %s in archive: %s', player, exc)
+                skipped += 1
+                continue
+            borrowed = PlayerHomeStorage.borrow_instance(player)
+            home = borrowed or PlayerHomeStorage.get_instance(player)
+            try:
+                with home.transaction():
+                    home.save(data)
+                    # Drop the old cache, data is reloaded from the imported file on next access
+                    home.invalidate()
+            finally:
+                if borrowed is not None:
+                    PlayerHomeStorage.release_borrowed(borrowed)
+            imported += 1
+    logger.info('Imported homes of %d players from %s, %d skipped', imported, file_name, skipped)
+    return imported, skipped
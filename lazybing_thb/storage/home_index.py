@@ -0,0 +1,105 @@
+import json
+import threading
+from collections import Counter
+from typing import Dict, Optional, List, Set, Tuple, Type
+
+from lazybing_thb.location import dim_convert
+from lazybing_thb.storage import codec
+from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
+from lazybing_thb.storage.record import LocationRecord, DimensionTable
+from lazybing_thb.storage.schema import HOME_SCHEMA
+from lazybing_thb.utils import logger, named_thread
+
+
+class HomeIndex:
+    """
+    Global index of all player homes, player -> home name -> dimension code
+    Built once by a streaming scan over the home folder, then kept updated by each home storage mutation
+    """
+    __inst: Optional["HomeIndex"] = None
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__homes: Dict[str, Dict[str, int]] = {}
+        self.__dimensions: Counter = Counter()
+        self.__building = False
+        self.__ready = False
+        # Players updated during the scan, their files read by the scan may be already out-dated
+        self.__updated_during_build: Set[str] = set()
+
+    @classmethod
+    def get_instance(cls) -> "HomeIndex":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    @property
+    def is_ready(self) -> bool:
+        return self.__ready
+
+    def __put(self, player: str, homes: Dict[str, int]):
+        for code in self.__homes.pop(player, {}).values():
+            self.__dimensions[code] -= 1
+            if self.__dimensions[code] <= 0:
+                del self.__dimensions[code]
+        if len(homes) > 0:
+            self.__homes[player] = homes
+            self.__dimensions.update(homes.values())
+
+    def update(self, player: str, data: Dict[str, LocationRecord]):
+        homes = {name: record.dim_code for name, record in data.items()}
+        with self.__lock:
+            self.__put(player, homes)
+            if self.__building:
+                self.__updated_during_build.add(player)
+
+    @named_thread('HomeIndexBuilder')
+    def build(self, storage_cls: Type[AbstractPlayerStorage]):
+        with self.__lock:
+            if self.__building:
+                return
+            self.__building = True
+            self.__updated_during_build.clear()
+        scanned = 0
+        try:
+            for entry in storage_cls.iter_player_files():
+                player = storage_cls.get_player_name(entry)
+                try:
+                    with open(entry.path, 'r', encoding='utf8') as f:
+                        data = codec.decode_home_records(HOME_SCHEMA.unwrap(json.load(f))[0])
+                except (OSError, TypeError, ValueError) as exc:
+                    logger.warning('Skipped home file %s while indexing: %s', entry.name, exc)
+                    continue
+                homes = {name: record.dim_code for name, record in data.items()}
+                with self.__lock:
+                    if player not in self.__updated_during_build:
+                        self.__put(player, homes)
+                scanned += 1
+        finally:
+            with self.__lock:
+                self.__building = False
+                self.__ready = True
+                self.__updated_during_build.clear()
+        logger.info('Home index built, %d home files scanned', scanned)
+
+    def get_player_homes(self, player: str) -> List[str]:
+        with self.__lock:
+            return list(self.__homes.get(player, {}).keys())
+
+    def get_dimension_counts(self) -> Dict[str, int]:
+        with self.__lock:
+            counts = list(self.__dimensions.items())
+        result: Dict[str, int] = {}
+        for code, count in counts:
+            # Legacy integer dimensions and their names are counted together
+            dim = DimensionTable.get_dimension(code)
+            name = dim_convert.get(dim, dim)
+            result[name] = result.get(name, 0) + count
+        return result
+
+    def get_summary(self) -> Tuple[int, int]:
+        """
+        :return: Amount of players owning homes, total amount of homes
+        """
+        with self.__lock:
+            return len(self.__homes), sum(self.__dimensions.values())
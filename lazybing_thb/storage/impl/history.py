@@ -1,49 +1,121 @@
-import json
-import os.path
 import time
+from typing import Dict, Optional
 
-from lazybing_thb.location import Location
+from lazybing_thb.location import Location, History
+from lazybing_thb.storage import codec
+from lazybing_thb.storage.history_writer import HistoryWriter
+from lazybing_thb.utils import logger
+from lazybing_thb.storage.record import HistoryRecord, DimensionTable
 from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
+from lazybing_thb.storage.schema import HISTORY_SCHEMA
 
 
-class History(Location):
-    timestamp: float
-    warned = False
-
-    @classmethod
-    def from_coordinates(cls, coordinates: Location):
-        data = coordinates.serialize()
-        data = data.copy()
-        if 'timestamp' not in data.keys():
-            data['timestamp'] = time.time()
-        return cls.deserialize(data)
+class TeleportHistory(AbstractPlayerStorage):
+    cache_on_join = True
+    shareable = True
+    shardable = True
+    schema = HISTORY_SCHEMA
 
+    def __init__(self, player: str):
+        super().__init__(player)
+        self.__cached_history: Optional[HistoryRecord] = None
+        self.__cache_loaded = False
+        # Staged record not written to file yet, see stage_record
+        self.__pending_record: Optional[HistoryRecord] = None
 
-class TeleportHistory(AbstractPlayerStorage):
     @classmethod
     def get_folder_name(cls):
         return "history"
 
-    def get_file_path(self):
-        return os.path.join(self.get_folder_path(), f"{self.player}.json")
-
     def save(self, data: History):
-        with self.open('w') as f:
-            return json.dump(data.serialize(), f, ensure_ascii=False, indent=4)
+        self.save_record(HistoryRecord.from_history(data))
+
+    def save_record(self, record: HistoryRecord):
+        with self.transaction():
+            with self.open('w') as f:
+                self.dump_json(f, codec.encode_history_record(record))
+            self.__cached_history, self.__cache_loaded = record, True
+            self.__pending_record = None
+            self.mark_synced()
+
+    def stage_record(self, record: HistoryRecord):
+        """
+        Replace the history in memory at once, the file is written later by HistoryWriter
+        """
+        with self.lock():
+            self.__cached_history, self.__cache_loaded = record, True
+            self.__pending_record = record
+        HistoryWriter.get_instance().submit(self)
+
+    def flush(self):
+        with self.transaction():
+            if self.__pending_record is not None:
+                self.save_record(self.__pending_record)
 
     def set_location(self, coordinates: Location):
         self.save(History.from_coordinates(coordinates))
 
-    def get_history(self):
+    @classmethod
+    def bulk_set_locations(cls, locations: Dict[str, Location]):
+        """
+        Record pre-teleport locations of several players, visible at once and written to files in bulk
+        """
+        timestamp = time.time()
+        for player, coordinates in locations.items():
+            record = HistoryRecord(
+                coordinates.x, coordinates.y, coordinates.z, DimensionTable.get_code(coordinates.dim), timestamp
+            )
+            cls.get_instance(player).stage_record(record)
+
+    def preload(self):
+        self.get_record()
+
+    def get_cached_record_count(self) -> int:
+        # Staged record replaces the cached one, both refer to the same object until it is written
+        return 0 if self.__cached_history is None else 1
+
+    def get_history(self) -> Optional[History]:
+        with self.lock():
+            record = self.get_record()
+            return None if record is None else record.to_history()
+
+    def get_record(self) -> Optional[HistoryRecord]:
+        with self.lock():
+            if self.__pending_record is not None:
+                # Newer than anything in the file
+                return self.__pending_record
+            if not self.__cache_loaded or self.is_stale():
+                self.__cached_history, self.__cache_loaded = self._get_record(), True
+                self.mark_synced()
+            return self.__cached_history
+
+    def migrate(self) -> bool:
+        with self.transaction():
+            record = self.get_record()
+            if record is None or not self.is_schema_outdated():
+                return False
+            self.save_record(record)
+            return True
+
+    def invalidate(self):
+        with self.lock():
+            self.__cached_history, self.__cache_loaded = None, False
+
+    def _get_record(self) -> Optional[HistoryRecord]:
         with self.lock():
             self.ensure_file()
             if not self.exists():
                 return None
             with self.open() as f:
-                return History.deserialize(json.load(f))
+                try:
+                    return codec.decode_history_record(self.load_json(f))
+                except (TypeError, ValueError) as exc:
+                    logger.exception(f"Invalid data found in player history file: {self.player}.json", exc_info=exc)
+            self.quarantine_file()
+            return None
 
     def set_warned(self):
-        with self.lock():
-            history = self.get_history()
-            history.warned = False
-            self.save(history)
+        with self.transaction():
+            record = self.get_record()
+            record.warned = True
+            self.save_record(record)
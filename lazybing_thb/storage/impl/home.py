@@ -1,16 +1,20 @@
-import json
-import os.path
 from typing import Dict, Optional
 
-from mcdreforged.api.utils import serialize, deserialize
-
 from lazybing_thb.location import Location
+from lazybing_thb.storage import codec
+from lazybing_thb.storage.home_index import HomeIndex
+from lazybing_thb.storage.schema import HOME_SCHEMA
+from lazybing_thb.storage.record import LocationRecord
 from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
 from lazybing_thb.utils import logger
 
 
 class PlayerHomeStorage(AbstractPlayerStorage):
-    expected_type = Dict[str, Location]
+    expected_type = Dict[str, LocationRecord]
+    cache_on_join = True
+    shareable = True
+    shardable = True
+    schema = HOME_SCHEMA
 
     def __init__(self, player: str):
         super().__init__(player)
@@ -20,55 +24,78 @@ class PlayerHomeStorage(AbstractPlayerStorage):
     def get_folder_name(cls):
         return "home"
 
-    def get_file_path(self):
-        return os.path.join(self.get_folder_path(), f"{self.player}.json")
-
     def save(self, data: Optional[expected_type] = None):
         with self.lock():
             if data is None:
                 data = self.__cached_data
             with self.open('w') as f:
-                json.dump(serialize(data), f, ensure_ascii=False, indent=4)
+                self.dump_json(f, codec.encode_home_records(data))
+            self.mark_synced()
+            HomeIndex.get_instance().update(self.player, data)
 
-    def __initialize_data(self):
-        # No lock acquire is needed
-        self.save({})
+    def preload(self):
+        self.get_data()
 
-    def get_data(self):
+    def get_cached_record_count(self) -> int:
+        data = self.__cached_data
+        return 0 if data is None else len(data)
+
+    def get_data(self) -> expected_type:
+        """
+        Cached compact home records, use get_home/get_homes to get Location instances
+        """
         with self.lock():
-            if self.__cached_data is None:
+            if self.__cached_data is None or self.is_stale():
                 self.__cached_data = self._get_data()
+                self.mark_synced()
+                HomeIndex.get_instance().update(self.player, self.__cached_data)
             return self.__cached_data
 
+    def migrate(self) -> bool:
+        with self.transaction():
+            self.get_data()
+            if not self.is_schema_outdated():
+                return False
+            self.save()
+            return True
+
+    def invalidate(self):
+        with self.lock():
+            self.__cached_data = None
+
     def _get_data(self) -> expected_type:
         with self.lock():
             self.ensure_file()
             if not self.exists():
-                self.__initialize_data()
+                return {}
             with self.open() as f:
                 try:
-                    return deserialize(json.load(f), cls=self.expected_type)
+                    return codec.decode_home_records(self.load_json(f))
                 except (TypeError, ValueError) as exc:
                     logger.exception(f"Invalid data found in player home file: {self.player}.json", exc_info=exc)
-                    self.__initialize_data()
-                    return {}
+            self.quarantine_file()
+            return {}
 
     def get_home(self, home_name: str, default: Optional[Location] = None) -> Location:
         with self.lock():
-            data = self.get_data()
-            return data.get(home_name, default)
+            record = self.get_data().get(home_name)
+            return default if record is None else record.to_location()
 
-    def set_home(self, home_name: str, home_coordinates: Location) -> bool:
+    def get_homes(self) -> Dict[str, Location]:
         with self.lock():
+            return {name: record.to_location() for name, record in self.get_data().items()}
+
+    def set_home(self, home_name: str, home_coordinates: Location) -> bool:
+        with self.transaction():
             data = self.get_data()
             if home_name in data.keys():
                 return False
-            data[home_name] = home_coordinates
+            data[home_name] = LocationRecord.from_location(home_coordinates)
             self.save()
             return True
 
     def remove_home(self, home_name: str) -> bool:
-        with self.lock():
+        with self.transaction():
             data = self.get_data()
             if home_name not in data.keys():
                 return False
@@ -1,28 +1,20 @@
 import os.path
 import shutil
-from typing import Optional
+from typing import List
 
 from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
 
 
 class TeleportRequest(AbstractPlayerStorage):
+    file_suffix = '.tpa'
+
     @classmethod
     def get_folder_name(cls):
         return "tpa"
 
-    def get_file_path(self):
-        return os.path.join(self.get_folder_path(), f"{self.player}.tpa")
-
-    def set_requester(self, requester: str):
+    def set_requesters(self, requesters: List[str]):
         with self.open('w') as f:
-            f.write(requester)
-
-    def get_requester(self) -> Optional[str]:
-        with self.lock():
-            if not self.exists():
-                return None
-            with self.open() as f:
-                return f.read()
+            f.write('\n'.join(requesters))
 
     @classmethod
     def remove_all_files(cls):
@@ -0,0 +1,108 @@
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional
+
+from lazybing_thb.location import Location
+from lazybing_thb.storage import codec
+from lazybing_thb.storage.record import LocationRecord
+from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
+from lazybing_thb.storage.schema import WARP_SCHEMA
+from lazybing_thb.utils import logger
+
+
+class WarpStorage(AbstractPlayerStorage):
+    """
+    Server-wide warps stored under a fixed storage key
+    Reads use an immutable snapshot without locking, writes replace the snapshot after the file is saved
+    """
+    expected_type = Dict[str, LocationRecord]
+    shareable = True
+    schema = WARP_SCHEMA
+    STORAGE_KEY = 'warps'
+
+    def __init__(self, player: str):
+        super().__init__(player)
+        self.__snapshot: Optional[Mapping[str, LocationRecord]] = None
+
+    @classmethod
+    def get_folder_name(cls):
+        return "warp"
+
+    @classmethod
+    def get_storage(cls) -> "WarpStorage":
+        return cls.get_instance(cls.STORAGE_KEY)
+
+    def preload(self):
+        self.get_snapshot()
+
+    def get_cached_record_count(self) -> int:
+        snapshot = self.__snapshot
+        return 0 if snapshot is None else len(snapshot)
+
+    def migrate(self) -> bool:
+        with self.transaction():
+            data = dict(self.get_snapshot())
+            if not self.is_schema_outdated():
+                return False
+            self.__publish(data)
+            return True
+
+    def invalidate(self):
+        with self.lock():
+            self.__snapshot = None
+
+    def get_snapshot(self) -> Mapping[str, LocationRecord]:
+        snapshot = self.__snapshot
+        if snapshot is not None and not self.is_stale():
+            return snapshot
+        with self.lock():
+            if self.__snapshot is None or self.is_stale():
+                self.__snapshot = MappingProxyType(self._get_data())
+                self.mark_synced()
+            return self.__snapshot
+
+    def _get_data(self) -> expected_type:
+        with self.lock():
+            self.ensure_file()
+            if not self.exists():
+                return {}
+            with self.open() as f:
+                try:
+                    return codec.decode_home_records(self.load_json(f))
+                except (TypeError, ValueError) as exc:
+                    logger.exception("Invalid data found in warp file", exc_info=exc)
+            self.quarantine_file()
+            return {}
+
+    def __publish(self, data: expected_type):
+        with self.open('w') as f:
+            self.dump_json(f, codec.encode_home_records(data))
+        self.mark_synced()
+        self.__snapshot = MappingProxyType(data)
+
+    def get_warp(self, warp_name: str) -> Optional[Location]:
+        record = self.get_snapshot().get(warp_name)
+        return None if record is None else record.to_location()
+
+    def get_warp_names(self) -> List[str]:
+        return list(self.get_snapshot().keys())
+
+    def get_warps(self) -> Dict[str, Location]:
+        return {name: record.to_location() for name, record in self.get_snapshot().items()}
+
+    def set_warp(self, warp_name: str, location: Location, overwrite: bool = False) -> bool:
+        with self.transaction():
+            data = dict(self.get_snapshot())
+            if warp_name in data.keys() and not overwrite:
+                return False
+            data[warp_name] = LocationRecord.from_location(location)
+            self.__publish(data)
+            return True
+
+    def remove_warp(self, warp_name: str) -> bool:
+        with self.transaction():
+            data = dict(self.get_snapshot())
+            if warp_name not in data.keys():
+                return False
+            del data[warp_name]
+            self.__publish(data)
+            return True
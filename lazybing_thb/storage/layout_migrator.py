@@ -0,0 +1,81 @@
+import os
+from typing import Optional, Type
+
+from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
+from lazybing_thb.storage.atomic import clean_temp_files
+from lazybing_thb.storage.background_job import BackgroundJob
+from lazybing_thb.storage.config import config
+from lazybing_thb.utils import logger
+
+
+class LayoutMigrator(BackgroundJob):
+    """
+    Low priority background job moving player files into the folder layout currently configured (flat or sharded)
+    Storage lookups check both layouts, so players are served normally while files are being moved
+    """
+    __inst: Optional["LayoutMigrator"] = None
+    thread_name = 'LayoutMigrator'
+
+    @classmethod
+    def get_instance(cls) -> "LayoutMigrator":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    @staticmethod
+    def __clean_shard_folders(storage_cls: Type[AbstractPlayerStorage]):
+        folder = storage_cls.get_folder_path()
+        with os.scandir(folder) as entries:
+            first_levels = [entry.path for entry in entries if entry.is_dir() and not entry.name.startswith('.')]
+        for first_level in first_levels:
+            with os.scandir(first_level) as entries:
+                second_levels = [entry.path for entry in entries if entry.is_dir()]
+            for second_level in second_levels:
+                clean_temp_files(second_level)
+                if not storage_cls.is_sharded():
+                    try:
+                        os.rmdir(second_level)
+                    except OSError:
+                        pass
+            if not storage_cls.is_sharded():
+                try:
+                    os.rmdir(first_level)
+                except OSError:
+                    pass
+
+    def migrate_storage(self, storage_cls: Type[AbstractPlayerStorage]) -> int:
+        options = config.sharded_layout
+        moved = 0
+        for entry in self.throttled(storage_cls.iter_player_files(), options.batch_size, options.batches_per_second):
+            player = storage_cls.get_player_name(entry)
+            if entry.path == storage_cls.get_preferred_file_path(player):
+                continue
+            # Cached instances move their file in place, others are only borrowed for the file
+            storage = storage_cls.borrow_instance(player)
+            try:
+                if (storage or storage_cls.get_instance(player)).relocate_file():
+                    moved += 1
+            except OSError as exc:
+                logger.warning('Failed to move %s file %s: %s', storage_cls.__name__, entry.name, exc)
+            finally:
+                if storage is not None:
+                    storage_cls.release_borrowed(storage)
+        if not self.is_stopped():
+            self.__clean_shard_folders(storage_cls)
+            storage_cls.refresh_shard_folders()
+        return moved
+
+    def run(self):
+        for storage_cls in AbstractPlayerStorage.get_storage_classes():
+            if not storage_cls.shardable or self.is_stopped():
+                continue
+            try:
+                moved = self.migrate_storage(storage_cls)
+            except Exception as exc:
+                logger.exception(f'Error occurred while moving {storage_cls.__name__} files', exc_info=exc)
+                continue
+            if moved > 0:
+                logger.info(
+                    'Moved %d %s files into %s layout',
+                    moved, storage_cls.__name__, 'sharded' if storage_cls.is_sharded() else 'flat'
+                )
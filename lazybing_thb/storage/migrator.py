@@ -0,0 +1,66 @@
+import json
+from typing import Optional, Type
+
+from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
+from lazybing_thb.storage.background_job import BackgroundJob
+from lazybing_thb.storage.config import config
+from lazybing_thb.utils import logger
+
+
+class SchemaMigrator(BackgroundJob):
+    """
+    Low priority background job writing data files of older schema versions back in current version
+    Players loaded by the plugin are upgraded lazily on read anyway, so this job only makes sure idle ones catch up
+    """
+    __inst: Optional["SchemaMigrator"] = None
+    thread_name = 'SchemaMigrator'
+
+    @classmethod
+    def get_instance(cls) -> "SchemaMigrator":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    @staticmethod
+    def __is_current(storage_cls: Type[AbstractPlayerStorage], file_path: str) -> bool:
+        try:
+            with open(file_path, 'r', encoding='utf8') as f:
+                return storage_cls.schema.is_current(json.load(f))
+        except ValueError:
+            # Left to the storage, which quarantines unreadable files on read
+            return False
+
+    def migrate_storage(self, storage_cls: Type[AbstractPlayerStorage]) -> int:
+        options = config.schema_migration
+        migrated = 0
+        for entry in self.throttled(storage_cls.iter_player_files(), options.batch_size, options.batches_per_second):
+            player = storage_cls.get_player_name(entry)
+            # Cached instances are migrated in place, others are only borrowed for the file
+            storage = storage_cls.borrow_instance(player)
+            try:
+                if not self.__is_current(storage_cls, entry.path):
+                    if (storage or storage_cls.get_instance(player)).migrate():
+                        migrated += 1
+            except OSError as exc:
+                logger.warning('Failed to migrate %s file %s: %s', storage_cls.__name__, entry.name, exc)
+            finally:
+                if storage is not None:
+                    storage_cls.release_borrowed(storage)
+        return migrated
+
+    def is_enabled(self) -> bool:
+        return config.schema_migration.enabled
+
+    def run(self):
+        for storage_cls in AbstractPlayerStorage.get_storage_classes():
+            if storage_cls.schema is None or self.is_stopped():
+                continue
+            try:
+                migrated = self.migrate_storage(storage_cls)
+            except Exception as exc:
+                logger.exception(f'Error occurred while migrating {storage_cls.__name__} files', exc_info=exc)
+                continue
+            if migrated > 0:
+                logger.info(
+                    'Migrated %d %s files to schema version %d', migrated, storage_cls.__name__, storage_cls.schema.version
+                )
@@ -0,0 +1,100 @@
+import threading
+from typing import Union, List, Dict
+
+from lazybing_thb.location import Location, History, dim_convert
+
+Number = Union[int, float]
+Dimension = Union[int, str]
+
+
+class DimensionTable:
+    """
+    Interns dimension values to small integer codes, so cached records only keep an int per dimension
+    Both legacy integer dimensions and dimension names from dim_convert are pre-registered
+    """
+    __dimensions: List[Dimension] = []
+    __codes: Dict[Dimension, int] = {}
+    __lock = threading.Lock()
+
+    @classmethod
+    def get_code(cls, dim: Dimension) -> int:
+        code = cls.__codes.get(dim)
+        if code is None:
+            with cls.__lock:
+                code = cls.__codes.get(dim)
+                if code is None:
+                    code = len(cls.__dimensions)
+                    cls.__dimensions.append(dim)
+                    cls.__codes[dim] = code
+        return code
+
+    @classmethod
+    def get_dimension(cls, code: int) -> Dimension:
+        return cls.__dimensions[code]
+
+    @classmethod
+    def get_size(cls) -> int:
+        return len(cls.__dimensions)
+
+
+for __dim_id, __dim_name in dim_convert.items():
+    DimensionTable.get_code(__dim_id)
+    DimensionTable.get_code(__dim_name)
+
+
+class LocationRecord:
+    """
+    Compact in-memory representation of a Location
+    Only converted to and from Location at storage boundaries
+    """
+    __slots__ = ('x', 'y', 'z', 'dim_code')
+
+    def __init__(self, x: Number, y: Number, z: Number, dim_code: int):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.dim_code = dim_code
+
+    @property
+    def dim(self) -> Dimension:
+        return DimensionTable.get_dimension(self.dim_code)
+
+    def get_dim_name(self) -> str:
+        dim = self.dim
+        return dim_convert.get(dim, dim)
+
+    @classmethod
+    def from_location(cls, location: Location) -> "LocationRecord":
+        return cls(location.x, location.y, location.z, DimensionTable.get_code(location.dim))
+
+    def to_location(self) -> Location:
+        location = Location.__new__(Location)
+        location.x, location.y, location.z, location.dim = self.x, self.y, self.z, self.dim
+        return location
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(x={self.x}, y={self.y}, z={self.z}, dim={self.dim})'
+
+
+class HistoryRecord(LocationRecord):
+    """
+    Compact in-memory representation of a History
+    """
+    __slots__ = ('timestamp', 'warned')
+
+    def __init__(self, x: Number, y: Number, z: Number, dim_code: int, timestamp: float, warned: bool = False):
+        super().__init__(x, y, z, dim_code)
+        self.timestamp = timestamp
+        self.warned = warned
+
+    @classmethod
+    def from_history(cls, history: History) -> "HistoryRecord":
+        return cls(
+            history.x, history.y, history.z, DimensionTable.get_code(history.dim), history.timestamp, history.warned
+        )
+
+    def to_history(self) -> History:
+        history = History.__new__(History)
+        history.x, history.y, history.z, history.dim = self.x, self.y, self.z, self.dim
+        history.timestamp, history.warned = self.timestamp, self.warned
+        return history
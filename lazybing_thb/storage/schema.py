@@ -0,0 +1,76 @@
+from typing import Any, Callable, Dict, Tuple
+
+VERSION_KEY = 'version'
+DATA_KEY = 'data'
+# Files written before schema versioning have no header
+LEGACY_VERSION = 0
+
+Upgrade = Callable[[Any], Any]
+
+
+class Schema:
+    """
+    Versioned file format, files are stored as {"version": N, "data": ...}
+    Upgrade functions registered for each version are chained when older data is read,
+    upgraded data reaches the file on next save
+    """
+    def __init__(self, name: str, version: int):
+        self.name = name
+        self.version = version
+        self.__upgrades: Dict[int, Upgrade] = {}
+
+    def register_upgrade(self, from_version: int) -> Callable[[Upgrade], Upgrade]:
+        """
+        Decorator registering the function converting data of from_version to from_version + 1
+        """
+        def wrapper(func: Upgrade) -> Upgrade:
+            if from_version in self.__upgrades.keys():
+                raise KeyError(f'Upgrade of {self.name} schema from version {from_version} already registered')
+            self.__upgrades[from_version] = func
+            return func
+        return wrapper
+
+    @staticmethod
+    def get_version(raw: Any) -> int:
+        if isinstance(raw, dict) and len(raw) == 2 and DATA_KEY in raw.keys():
+            version = raw.get(VERSION_KEY)
+            if isinstance(version, int) and not isinstance(version, bool):
+                return version
+        return LEGACY_VERSION
+
+    def is_current(self, raw: Any) -> bool:
+        return self.get_version(raw) == self.version
+
+    def wrap(self, data: Any) -> Dict[str, Any]:
+        return {VERSION_KEY: self.version, DATA_KEY: data}
+
+    def unwrap(self, raw: Any) -> Tuple[Any, bool]:
+        """
+        :raise ValueError: Data is written by a newer schema version, or an upgrade is missing
+        :return: Data in current schema version, and if any upgrade was applied
+        """
+        version = self.get_version(raw)
+        data = raw if version == LEGACY_VERSION else raw[DATA_KEY]
+        if version > self.version:
+            raise ValueError(f'{self.name} data version {version} is newer than supported version {self.version}')
+        upgraded = version < self.version
+        while version < self.version:
+            upgrade = self.__upgrades.get(version)
+            if upgrade is None:
+                raise ValueError(f'No upgrade registered for {self.name} data version {version}')
+            data = upgrade(data)
+            version += 1
+        return data, upgraded
+
+
+def __keep(data: Any) -> Any:
+    return data
+
+
+HOME_SCHEMA = Schema('home', 1)
+HISTORY_SCHEMA = Schema('history', 1)
+WARP_SCHEMA = Schema('warp', 1)
+
+# Version 1 only adds the version header around the legacy payload
+for __schema in (HOME_SCHEMA, HISTORY_SCHEMA, WARP_SCHEMA):
+    __schema.register_upgrade(LEGACY_VERSION)(__keep)
@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+import time
+from typing import Optional
+
+from lazybing_thb.storage import codec
+from lazybing_thb.storage.background_job import BackgroundJob
+from lazybing_thb.storage.config import config
+from lazybing_thb.storage.impl.history import TeleportHistory
+from lazybing_thb.storage.schema import HISTORY_SCHEMA
+from lazybing_thb.utils import logger, ensure_dir
+
+
+class HistorySweeper(BackgroundJob):
+    """
+    Low priority background job removing or archiving back-history older than configured retention
+    Storage is walked incrementally in small batches with a pause between batches, so it never competes with commands
+    """
+    __inst: Optional["HistorySweeper"] = None
+    ARCHIVE_FOLDER = 'history_archive'
+    # First sweep runs shortly after loading, so plugin reloads more frequent than the interval never postpone it
+    START_DELAY = 60  # seconds
+    thread_name = 'HistorySweeper'
+
+    def __init__(self):
+        super().__init__()
+        # Result of the last finished sweep, shown in census
+        self.last_swept_at: Optional[float] = None
+        self.last_reclaimed_files = 0
+        self.last_reclaimed_bytes = 0
+
+    @classmethod
+    def get_instance(cls) -> "HistorySweeper":
+        if cls.__inst is None:
+            cls.__inst = cls()
+        return cls.__inst
+
+    @staticmethod
+    def __is_expired(file_path: str, deadline: float) -> bool:
+        # Check modification time first to avoid parsing files written recently
+        if os.path.getmtime(file_path) > deadline:
+            return False
+        try:
+            with open(file_path, 'r', encoding='utf8') as f:
+                data, _ = HISTORY_SCHEMA.unwrap(json.load(f))
+                return codec.decode_history_record(data).timestamp <= deadline
+        except (TypeError, ValueError):
+            # Broken history file is useless for !!back anyway
+            return True
+
+    def __reclaim(self, file_path: str) -> int:
+        size = os.path.getsize(file_path)
+        if config.history_sweeper.archive:
+            archive_folder = os.path.join(os.path.dirname(TeleportHistory.get_folder_path()), self.ARCHIVE_FOLDER)
+            ensure_dir(archive_folder)
+            shutil.move(file_path, os.path.join(archive_folder, os.path.basename(file_path)))
+        else:
+            os.remove(file_path)
+        return size
+
+    def sweep_once(self) -> None:
+        options = config.history_sweeper
+        deadline = time.time() - options.retention * 24 * 60 * 60
+        reclaimed_files, reclaimed_bytes, scanned = 0, 0, 0
+        for entry in self.throttled(TeleportHistory.iter_player_files(), options.batch_size, options.batches_per_second):
+            player = TeleportHistory.get_player_name(entry)
+            # Files are handled with only this player locked
+            storage = TeleportHistory.borrow_instance(player)
+            if storage is None:
+                continue
+            try:
+                with storage.transaction():
+                    if self.__is_expired(entry.path, deadline):
+                        reclaimed_bytes += self.__reclaim(entry.path)
+                        reclaimed_files += 1
+            except OSError as exc:
+                logger.warning('Failed to sweep history file %s: %s', entry.name, exc)
+            finally:
+                TeleportHistory.release_borrowed(storage)
+            scanned += 1
+        self.last_reclaimed_files, self.last_reclaimed_bytes = reclaimed_files, reclaimed_bytes
+        self.last_swept_at = time.time()
+        if reclaimed_files > 0:
+            logger.info(
+                '%s %d expired history files (%.1f KiB) out of %d scanned',
+                'Archived' if options.archive else 'Removed', reclaimed_files, reclaimed_bytes / 1024, scanned
+            )
+
+    def is_enabled(self) -> bool:
+        return config.history_sweeper.retention > 0
+
+    def run(self):
+        delay = min(self.START_DELAY, config.history_sweeper.interval * 60 * 60)
+        while not self.wait(delay):
+            try:
+                self.sweep_once()
+            except Exception as exc:
+                logger.exception('Error occurred while sweeping history files', exc_info=exc)
+            delay = config.history_sweeper.interval * 60 * 60
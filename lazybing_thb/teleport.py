@@ -1,27 +1,39 @@
-import json
+import asyncio
+from concurrent.futures import Future
 
-from minecraft_data_api import get_player_dimension
-from typing import Callable
+from typing import List, Union
 from mcdreforged.api.rtext import *
 
+from lazybing_thb.async_loop import PluginEventLoop, run_blocking
+from lazybing_thb.event_bus import ThbEvents, dispatch, dispatch_off_loop
 from lazybing_thb.utils import named_thread, psi, logger, rtr
 from lazybing_thb.location import Location, dim_convert
+from lazybing_thb.history_capture import capture_history
+from lazybing_thb.message_cache import tell_cached
+from lazybing_thb.mda_gateway import MDAUnavailableError
+from lazybing_thb.transport import get_transport
 from lazybing_thb.storage.config import config
 from lazybing_thb.storage.impl.history import TeleportHistory
 
 
-@named_thread
-def _execute_teleport(requester: str, func: Callable, *args, record_history: bool = True, **kwargs):
-    if record_history:
-        requester_location = Location.get_location(requester)
-        logger.debug(f'Requester_location: {requester_location}')
-        TeleportHistory.get_instance(requester).set_location(requester_location)
+def get_location_command(selector: str, loc: Location) -> str:
+    return f'execute in {loc.get_dim_name()} as {selector} run tp {loc.x} {loc.y} {loc.z}'
+
+
+def get_player_command(selector: str, target: str, target_dim: str) -> str:
+    return f'execute in {target_dim} as {selector} run tp {target}'
+
+
+def get_player_dim_name(player: str) -> str:
+    dim_id = get_transport().get_dimension(player)
+    return dim_convert.get(dim_id, dim_id)
 
-    func(*args, **kwargs)
 
-    psi.tell(
-        requester,
-        rtr(
+def tell_after_teleport(player: str):
+    tell_cached(
+        player,
+        'teleport.after_teleport',
+        lambda: rtr(
             'teleport.after_teleport.text'
         ).h(
             rtr('teleport.after_teleport.hover')
@@ -32,19 +44,108 @@ def _execute_teleport(requester: str, func: Callable, *args, record_history: boo
     )
 
 
-def teleport_to_location(requester: str, loc: Location, record_history: bool = True):
-    def __execute():
-        psi.execute(f'execute in {loc.get_dim_name()} as {requester} run tp {loc.x} {loc.y} {loc.z}')
-        logger.info(f"Teleported {requester} to ({loc.x}, {loc.y}, {loc.z}) in {loc.dim}")
+async def _skip():
+    return None
+
+
+async def execute_teleport(requester: str, destination: Union[str, Location], record_history: bool = True) -> bool:
+    """
+    Teleport coroutine, requester history and target dimension are captured concurrently
+    Histories of concurrent teleports are captured in batched lookups and written to files in background
+    Teleport events are dispatched in the worker pool, listeners never run on the event loop thread
+    :return: If the teleport was executed
+    """
+    await dispatch_off_loop(ThbEvents.PRE_TELEPORT, requester, destination)
+    try:
+        requester_location, target_dim = await asyncio.gather(
+            capture_history(requester) if record_history else _skip(),
+            run_blocking(get_player_dim_name, destination) if isinstance(destination, str) else _skip()
+        )
+        if record_history:
+            if requester_location is None:
+                raise MDAUnavailableError(f'Location of {requester} not available')
+            logger.debug('Requester_location: %s', requester_location)
+        if isinstance(destination, str):
+            command = get_player_command(requester, destination, target_dim)
+        else:
+            command = get_location_command(requester, destination)
+        await run_blocking(get_transport().execute, command)
+    except MDAUnavailableError as exc:
+        logger.warning('Teleport of %s cancelled: %s', requester, exc)
+        psi.tell(requester, rtr('teleport.server_busy').set_color(RColor.red))
+        return False
+
+    if isinstance(destination, str):
+        logger.info(f"Teleported {requester} to {destination}")
+    else:
+        logger.info(f"Teleported {requester} to ({destination.x}, {destination.y}, {destination.z}) in {destination.dim}")
+    tell_after_teleport(requester)
+    await dispatch_off_loop(ThbEvents.POST_TELEPORT, requester, destination)
+    return True
+
+
+def teleport_to_location(requester: str, loc: Location, record_history: bool = True) -> Future:
+    """
+    :return: Future resolved with whether the teleport was executed
+    """
+    return PluginEventLoop.get_instance().submit(execute_teleport(requester, loc, record_history), requester)
+
+
+def teleport_to_player(requester: str, target: str, record_history: bool = True) -> Future:
+    """
+    :return: Future resolved with whether the teleport was executed
+    """
+    return PluginEventLoop.get_instance().submit(execute_teleport(requester, target, record_history), requester, target)
+
+
+@named_thread
+def group_teleport(host: str, players: List[str], destination: Union[str, Location], use_selector: bool = False):
+    """
+    Teleport a group of players to a player or a location
+    Player locations are queried in one batch, histories are written in one bulk operation
+    and teleport commands are sent as one selector-based command or one command batch
+    :param host: Player who issued the group teleport, results are told to this player
+    :param players: Players to be teleported
+    :param destination: Target player name or location
+    :param use_selector: Players are all online players (except the destination player),
+    so a single selector-based command can be used
+    """
+    if isinstance(destination, str):
+        players = [player for player in players if player != destination]
+    if len(players) == 0:
+        return psi.tell(host, rtr('tpa.group.no_player').set_color(RColor.red))
+
+    try:
+        locations = Location.get_locations(players)
+        moved = [player for player in players if player in locations.keys()]
+        failed = [player for player in players if player not in locations.keys()]
+        if len(moved) == 0:
+            raise MDAUnavailableError('No player location available')
 
-    _execute_teleport(requester, __execute, record_history=record_history)
+        if isinstance(destination, str):
+            target_dim = get_player_dim_name(destination)
 
+            def build_command(selector: str):
+                return get_player_command(selector, destination, target_dim)
+        else:
+            def build_command(selector: str):
+                return get_location_command(selector, destination)
 
-def teleport_to_player(requester: str, target: str, record_history: bool = True):
-    def __execute():
-        dim_id = get_player_dimension(target, timeout=config.mda_timeout)
-        target_dim = dim_convert.get(dim_id, dim_id)
-        psi.execute(f'execute in {target_dim} as {requester} run tp {target}')
-        logger.info(f"Teleported {requester} to {target}")
+        for player in moved:
+            dispatch(ThbEvents.PRE_TELEPORT, player, destination)
+        TeleportHistory.bulk_set_locations(locations)
+        if use_selector and len(failed) == 0:
+            get_transport().execute(build_command(f'@a[name=!{destination}]' if isinstance(destination, str) else '@a'))
+        else:
+            get_transport().execute_many([build_command(player) for player in moved])
+    except MDAUnavailableError as exc:
+        logger.warning('Group teleport issued by %s cancelled: %s', host, exc)
+        return psi.tell(host, rtr('teleport.server_busy').set_color(RColor.red))
 
-    _execute_teleport(requester, __execute, record_history=record_history)
+    logger.info(f"Teleported {', '.join(moved)} to {destination}")
+    for player in moved:
+        tell_after_teleport(player)
+        dispatch(ThbEvents.POST_TELEPORT, player, destination)
+    if len(failed) > 0:
+        psi.tell(host, rtr('tpa.group.failed', ', '.join(failed)).set_color(RColor.yellow))
+    psi.tell(host, rtr('tpa.group.finished', len(moved)))
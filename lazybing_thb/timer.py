@@ -1,12 +1,12 @@
-import contextlib
+import collections
 import threading
-import time
 import uuid
 
-from typing import Dict, Union
+from typing import Dict, Optional, List
 
 from mcdreforged.api.decorator import FunctionThread
 from mcdreforged.api.rtext import *
+from lazybing_thb.event_bus import ThbEvents, dispatch
 from lazybing_thb.utils import named_thread
 from lazybing_thb.storage.config import config
 from lazybing_thb.storage.impl.request import TeleportRequest
@@ -14,13 +14,14 @@ from lazybing_thb.utils import psi, rtr, logger
 
 
 class RequestTimer:
-    __running_timer: Dict[str, "RequestTimer"] = {}
-
-    def __init__(self, target: str):
-        self.__lock = threading.RLock()
-        self.__target = target
+    """
+    A single pending teleport request in a target's queue, expires independently
+    """
+    def __init__(self, queue: "RequestQueue", requester: str):
+        self.__queue = queue
+        self.__requester = requester
         self.__uuid = uuid.uuid4()
-        self.__request = None
+        self.__cancelled = threading.Event()
 
     @property
     def uuid_prefix(self) -> str:
@@ -30,71 +31,175 @@ class RequestTimer:
     def uuid(self) -> uuid.UUID:
         return self.__uuid
 
+    @property
+    def requester(self) -> str:
+        return self.__requester
+
     @property
     def target(self) -> str:
-        return self.__target
+        return self.__queue.target
 
-    @contextlib.contextmanager
-    def lock(self, blocking: bool = True, timeout: Union[float, int] = -1):
-        acq = self.__lock.acquire(blocking=blocking, timeout=timeout)
-        try:
-            yield acq
-        finally:
-            if acq:
-                self.__lock.release()
+    @property
+    def queue(self) -> "RequestQueue":
+        return self.__queue
 
-    def get_requester(self) -> str:
-        with self.__lock:
-            return self.get_request().get_requester()
+    def cancel(self) -> None:
+        self.__cancelled.set()
 
-    def get_request(self) -> TeleportRequest:
-        with self.__lock:
-            if self.__request is None:
-                self.__request = TeleportRequest.get_instance(self.target)
-            return self.__request
+    def start(self) -> FunctionThread:
+        @named_thread(f"Request_{self.target}_{self.uuid_prefix}")
+        def daemon():
+            if self.__cancelled.wait(config.request_expire_time):
+                return
+            logger.debug('Timer stopped')
+            if self.__queue.expire(self):
+                logger.debug('Request is valid, removing...')
+                requester, target = self.requester, self.target
+                dispatch(ThbEvents.REQUEST_EXPIRED, requester, target)
+                psi.tell(target, rtr("tpa.request_expired_target", requester))
+                psi.tell(
+                    requester,
+                    rtr("tpa.request_expired_requester.text", target).h(
+                        rtr('tpa.request_expired_requester.hover', target)
+                    ).c(
+                        RAction.run_command, f"{config.command_prefix.tpa_[0]} {target}"
+                    )
+                )
+
+        return daemon()
+
+
+class RequestQueue:
+    """
+    Bounded FIFO queue of pending teleport requests to a target player
+    Enqueue, dequeue and cancel are O(1) with an ordered dict keyed by requester
+    Lock order is registry lock before queue lock, request files are written after both are released
+    """
+    __running_queues: Dict[str, "RequestQueue"] = {}
+    __registry_lock = threading.RLock()
 
-    def is_valid(self) -> bool:
-        with self.__lock:
-            return self in self.__running_timer.values()
+    def __init__(self, target: str):
+        self.__lock = threading.RLock()
+        self.__target = target
+        self.__requests: "collections.OrderedDict[str, RequestTimer]" = collections.OrderedDict()
+        self.__storage: Optional[TeleportRequest] = None
 
-    def remove(self) -> None:
+    @property
+    def target(self) -> str:
+        return self.__target
+
+    @property
+    def requesters(self) -> List[str]:
         with self.__lock:
-            if self in self.__running_timer.values():
-                del self.__running_timer[self.target]
-                self.get_request().remove_file()
+            return list(self.__requests.keys())
 
-    def start(self) -> FunctionThread:
+    def get_storage(self) -> TeleportRequest:
+        with self.__lock:
+            if self.__storage is None:
+                self.__storage = TeleportRequest.get_instance(self.target)
+            return self.__storage
+
+    def __sync_storage(self) -> None:
+        # Neither registry lock nor queue lock may be held, the file follows the queue registered for the target
+        storage = self.get_storage()
+        with storage.lock():
+            requesters = self.get_queue(self.target).requesters
+            if len(requesters) == 0:
+                if storage.exists():
+                    storage.remove_file()
+            else:
+                storage.set_requesters(requesters)
+
+    def __len__(self) -> int:
+        return len(self.__requests)
+
+    def is_full(self) -> bool:
+        return len(self.__requests) >= config.max_pending_requests
+
+    def contains(self, requester: str) -> bool:
         with self.__lock:
-            @named_thread(f"Request_{self.target}_{self.uuid_prefix}")
-            def daemon():
-                time.sleep(config.request_expire_time)
-                logger.debug('Timer stopped')
+            return requester in self.__requests
+
+    def enqueue(self, requester: str) -> Optional[RequestTimer]:
+        """
+        Add a request to the tail of the queue
+        :return: The started request timer, None if queue is full or requester already queued
+        """
+        with self.__registry_lock:
+            registered = self.__running_queues.setdefault(self.target, self)
+            if registered is self:
                 with self.__lock:
-                    if self.is_valid():
-                        logger.debug('Request is valid, removing...')
-                        requester = self.get_requester()
-                        target = self.target
-                        psi.tell(target, rtr("tpa.request_expired_target", requester))
-                        psi.tell(
-                            requester,
-                            rtr("tpa.request_expired_requester.text", target).h(
-                                rtr('tpa.request_expired_requester.hover', target)
-                            ).c(
-                                RAction.run_command, f"{config.command_prefix.tpa_[0]} {target}"
-                            )
-                        )
-                        self.remove()
-
-            self.__running_timer[self.target] = self
-            return daemon()
+                    if requester in self.__requests or self.is_full():
+                        if len(self.__requests) == 0:
+                            del self.__running_queues[self.target]
+                        return None
+                    request = RequestTimer(self, requester)
+                    self.__requests[requester] = request
+                    request.start()
+        if registered is not self:
+            return registered.enqueue(requester)
+        self.__sync_storage()
+        return request
+
+    def pop(self, requester: Optional[str] = None) -> Optional[str]:
+        """
+        Remove a request from the queue
+        :param requester: Requester to remove, the head of the queue if not specified
+        :return: Requester of removed request, None if not found
+        """
+        with self.__registry_lock, self.__lock:
+            if len(self.__requests) == 0:
+                return None
+            if requester is None:
+                requester, request = self.__requests.popitem(last=False)
+            else:
+                request = self.__requests.pop(requester, None)
+                if request is None:
+                    return None
+            request.cancel()
+            self.__on_removed()
+        self.__sync_storage()
+        return requester
+
+    def expire(self, request: RequestTimer) -> bool:
+        """
+        Remove an expired request
+        :return: If the request was still pending
+        """
+        with self.__registry_lock, self.__lock:
+            if self.__requests.get(request.requester) is not request:
+                return False
+            del self.__requests[request.requester]
+            self.__on_removed()
+        self.__sync_storage()
+        return True
+
+    def __on_removed(self) -> None:
+        # Registry lock and lock required
+        if len(self.__requests) == 0 and self.__running_queues.get(self.target) is self:
+            del self.__running_queues[self.target]
+
+    def remove(self) -> None:
+        with self.__registry_lock, self.__lock:
+            for request in self.__requests.values():
+                request.cancel()
+            self.__requests.clear()
+            self.__on_removed()
+        self.__sync_storage()
+
+    @classmethod
+    def get_queue(cls, target: str) -> "RequestQueue":
+        with cls.__registry_lock:
+            if target in cls.__running_queues:
+                return cls.__running_queues[target]
+            return cls(target)
 
     @classmethod
-    def get_timer(cls, target: str):
-        if target in cls.__running_timer:
-            return cls.__running_timer[target]
-        return cls(target)
+    def get_queues(cls) -> List["RequestQueue"]:
+        with cls.__registry_lock:
+            return list(cls.__running_queues.values())
 
     @classmethod
     def remove_all(cls):
-        for item in cls.__running_timer.values():
+        for item in cls.get_queues():
             item.remove()
@@ -0,0 +1,275 @@
+import abc
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Union, List, Dict, Iterable
+
+from minecraft_data_api import get_player_coordinate, get_player_dimension, get_server_player_list
+
+from lazybing_thb.command_batcher import CommandBatcher
+from lazybing_thb.mda_gateway import MDAGateway, MDAUnavailableError
+from lazybing_thb.rcon import RconClient, RconError
+from lazybing_thb.storage.config import config
+from lazybing_thb.utils import psi, logger, get_thread_prefix
+
+Coordinate = Tuple[float, float, float]
+Dimension = Union[int, str]
+PlayerList = Tuple[int, int, List[str]]
+
+
+class Transport(abc.ABC):
+    """
+    Channel used by the plugin to query player data from and send commands to the server
+    """
+    @abc.abstractmethod
+    def get_coordinate(self, player: str) -> Coordinate:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_dimension(self, player: str) -> Dimension:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_player_list(self) -> PlayerList:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def execute(self, command: str) -> None:
+        raise NotImplementedError
+
+    def get_position(self, player: str) -> Tuple[Coordinate, Dimension]:
+        return self.get_coordinate(player), self.get_dimension(player)
+
+    def get_positions(self, players: Iterable[str]) -> Dict[str, Tuple[Coordinate, Dimension]]:
+        """
+        Query positions of several players at once, players failed to query are left out of the result
+        """
+        result = {}
+        for player in players:
+            try:
+                result[player] = self.get_position(player)
+            except MDAUnavailableError as exc:
+                logger.warning('Failed to query position of %s: %s', player, exc)
+        return result
+
+    def execute_many(self, commands: Iterable[str]) -> None:
+        for command in commands:
+            self.execute(command)
+
+    def close(self) -> None:
+        pass
+
+
+class ConsoleTransport(Transport):
+    """
+    Queries with minecraft data api and sends commands to server stdin
+    Positions of several players are queried concurrently, the MDA gateway limits how many are in flight
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__executor: Optional[ThreadPoolExecutor] = None
+
+    def __get_executor(self) -> ThreadPoolExecutor:
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    max_workers=max(config.mda_gateway.max_in_flight, 1),
+                    thread_name_prefix=get_thread_prefix() + 'PositionQuery'
+                )
+            return self.__executor
+
+    def get_coordinate(self, player: str) -> Coordinate:
+        coordinate = MDAGateway.get_instance().query(get_player_coordinate, player)
+        return coordinate.x, coordinate.y, coordinate.z
+
+    def get_dimension(self, player: str) -> Dimension:
+        return MDAGateway.get_instance().query(get_player_dimension, player)
+
+    def get_player_list(self) -> PlayerList:
+        amount, limit, player_list = MDAGateway.get_instance().query(get_server_player_list)
+        return amount, limit, player_list
+
+    def get_positions(self, players: Iterable[str]) -> Dict[str, Tuple[Coordinate, Dimension]]:
+        players = list(players)
+        if len(players) <= 1:
+            return super().get_positions(players)
+        executor = self.__get_executor()
+        # Coordinate and dimension are separate queries, all of them are sent together
+        futures = {
+            player: (executor.submit(self.get_coordinate, player), executor.submit(self.get_dimension, player))
+            for player in players
+        }
+        result = {}
+        for player, (coordinate_future, dimension_future) in futures.items():
+            try:
+                result[player] = coordinate_future.result(), dimension_future.result()
+            except MDAUnavailableError as exc:
+                logger.warning('Failed to query position of %s: %s', player, exc)
+        return result
+
+    def execute(self, command: str) -> None:
+        CommandBatcher.get_instance().execute(command)
+
+    def execute_many(self, commands: Iterable[str]) -> None:
+        batcher = CommandBatcher.get_instance()
+        for future in [batcher.submit(command) for command in commands]:
+            future.result()
+
+    def close(self) -> None:
+        with self.__lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+class RconTransport(Transport):
+    """
+    Queries and sends commands through RCON, responses are returned directly instead of parsed from server output
+    Coordinate and dimension queries of the same player are pipelined
+    """
+    __NUMBER = r'(-?[\d.]+(?:E-?\d+)?)d'
+    __POS_PATTERN = re.compile(r'\[{0}, {0}, {0}]'.format(__NUMBER))
+    __DIM_PATTERN = re.compile(r'has the following entity data: (?:"(?P<str>[^"]+)"|(?P<int>-?\d+))')
+    __LIST_PATTERN = re.compile(r'There are (\d+)(?: of a max(?: of)? |/)(\d+) players online:(.*)')
+
+    def __init__(self, client: RconClient):
+        self.__client = client
+
+    @property
+    def client(self) -> RconClient:
+        return self.__client
+
+    def __query(self, command: str, *, timeout: Optional[float] = None) -> str:
+        return self.__client.query(command, timeout=timeout)
+
+    @classmethod
+    def parse_coordinate(cls, player: str, response: str) -> Coordinate:
+        result = cls.__POS_PATTERN.search(response)
+        if result is None:
+            raise RconError(f'Fail to query the coordinate of player {player}: {response}')
+        x, y, z = result.groups()
+        return float(x), float(y), float(z)
+
+    @classmethod
+    def parse_dimension(cls, player: str, response: str) -> Dimension:
+        result = cls.__DIM_PATTERN.search(response)
+        if result is None:
+            raise RconError(f'Fail to query the dimension of player {player}: {response}')
+        if result.group('str') is not None:
+            return result.group('str')
+        return int(result.group('int'))
+
+    @classmethod
+    def parse_player_list(cls, response: str) -> PlayerList:
+        result = cls.__LIST_PATTERN.search(response)
+        if result is None:
+            raise RconError(f'Fail to query the player list: {response}')
+        players = [item.strip() for item in result.group(3).split(',') if item.strip() != '']
+        return int(result.group(1)), int(result.group(2)), players
+
+    def get_coordinate(self, player: str) -> Coordinate:
+        response = MDAGateway.get_instance().query(self.__query, f'data get entity {player} Pos')
+        return self.parse_coordinate(player, response)
+
+    def get_dimension(self, player: str) -> Dimension:
+        response = MDAGateway.get_instance().query(self.__query, f'data get entity {player} Dimension')
+        return self.parse_dimension(player, response)
+
+    def get_player_list(self) -> PlayerList:
+        return self.parse_player_list(MDAGateway.get_instance().query(self.__query, 'list'))
+
+    def get_position(self, player: str) -> Tuple[Coordinate, Dimension]:
+        def pipelined(*, timeout: Optional[float] = None) -> Tuple[str, str]:
+            pos_future = self.__client.submit(f'data get entity {player} Pos')
+            dim_future = self.__client.submit(f'data get entity {player} Dimension')
+            try:
+                return pos_future.result(timeout=timeout), dim_future.result(timeout=timeout)
+            except Exception as exc:
+                self.__client.discard(pos_future, dim_future)
+                raise RconError(f'RCON query failed for player {player}') from exc
+
+        pos_response, dim_response = MDAGateway.get_instance().query(pipelined)
+        return self.parse_coordinate(player, pos_response), self.parse_dimension(player, dim_response)
+
+    def get_positions(self, players: Iterable[str]) -> Dict[str, Tuple[Coordinate, Dimension]]:
+        players = list(players)
+
+        def pipelined(*, timeout: Optional[float] = None) -> Dict[str, Tuple[str, str]]:
+            futures = {
+                player: (
+                    self.__client.submit(f'data get entity {player} Pos'),
+                    self.__client.submit(f'data get entity {player} Dimension')
+                ) for player in players
+            }
+            responses = {}
+            for player, (pos_future, dim_future) in futures.items():
+                try:
+                    responses[player] = pos_future.result(timeout=timeout), dim_future.result(timeout=timeout)
+                except Exception as exc:
+                    self.__client.discard(pos_future, dim_future)
+                    logger.warning('Failed to query position of %s: %s', player, exc)
+            return responses
+
+        result = {}
+        for player, (pos_response, dim_response) in MDAGateway.get_instance().query(pipelined).items():
+            try:
+                result[player] = self.parse_coordinate(player, pos_response), self.parse_dimension(player, dim_response)
+            except RconError as exc:
+                logger.warning('%s', exc)
+        return result
+
+    def execute(self, command: str) -> None:
+        self.__client.query(command, timeout=config.mda_timeout)
+
+    def execute_many(self, commands: Iterable[str]) -> None:
+        futures = [self.__client.submit(command) for command in commands]
+        for future in futures:
+            try:
+                future.result(timeout=config.mda_timeout)
+            except Exception as exc:
+                self.__client.discard(*futures)
+                raise RconError('RCON command failed') from exc
+
+    def close(self) -> None:
+        self.__client.close()
+
+
+__transport: Optional[Transport] = None
+__override: Optional[Transport] = None
+
+
+def __create_rcon_client() -> Optional[RconClient]:
+    options = config.rcon
+    mcdr_rcon = psi.get_mcdr_config().get('rcon', {})
+    address = options.address if options.address is not None else mcdr_rcon.get('address')
+    port = options.port if options.port is not None else mcdr_rcon.get('port')
+    password = options.password if options.password is not None else mcdr_rcon.get('password')
+    if None in (address, port, password):
+        logger.warning('RCON transport configured but RCON connection settings are missing, using console instead')
+        return None
+    return RconClient(address, port, password, reconnect_interval=options.reconnect_interval)
+
+
+def get_transport() -> Transport:
+    global __transport
+    if __override is not None:
+        return __override
+    if __transport is None:
+        client = __create_rcon_client() if config.transport == 'rcon' else None
+        __transport = ConsoleTransport() if client is None else RconTransport(client)
+    return __transport
+
+
+def close_transport() -> None:
+    global __transport
+    if __transport is not None:
+        __transport.close()
+        __transport = None
+
+
+def set_transport_override(transport: Optional[Transport]) -> None:
+    """
+    Route all queries and commands to the given transport instead of the configured one, None to restore
+    """
+    global __override
+    __override = transport
@@ -1,9 +1,14 @@
 import functools
+import gzip
 import inspect
 import logging
+import logging.handlers
 import os
+import queue
 import re
+import shutil
 import threading
+import time
 from typing import Optional, Dict, Callable, List, Union
 
 from mcdreforged.api.decorator import FunctionThread
@@ -18,6 +23,78 @@ if __si is not None:
 MessageText: type = Union[str, RTextBase]
 
 
+class CompressedRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    File handler rotating on both file size and time interval, rotated files can be gzip compressed
+    Designed to run on the background log writer thread, so rotation and compression never block command threads
+    """
+    def __init__(
+            self,
+            filename: str,
+            max_bytes: int = 0,
+            rotate_interval: Union[int, float] = 0,
+            backup_count: int = 5,
+            compress: bool = True,
+            encoding: str = 'UTF-8'
+    ):
+        super().__init__(filename, 'a', encoding=encoding)
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval  # seconds
+        self.backup_count = backup_count
+        self.compress = compress
+        self.__rollover_at = self.__compute_rollover_at()
+
+    def __compute_rollover_at(self) -> Optional[float]:
+        if self.rotate_interval <= 0:
+            return None
+        return time.time() + self.rotate_interval
+
+    def get_backup_name(self, index: int) -> str:
+        name = f"{self.baseFilename}.{index}"
+        return name + '.gz' if self.compress else name
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.__rollover_at is not None and time.time() >= self.__rollover_at:
+            return True
+        if self.max_bytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            if self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes:
+                return True
+        return False
+
+    def doRollover(self) -> None:
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                src, dst = self.get_backup_name(index), self.get_backup_name(index + 1)
+                if os.path.exists(src):
+                    os.replace(src, dst)
+            if os.path.exists(self.baseFilename):
+                self.__archive(self.baseFilename, self.get_backup_name(1))
+        elif os.path.exists(self.baseFilename):
+            os.remove(self.baseFilename)
+        self.stream = self._open()
+        self.__rollover_at = self.__compute_rollover_at()
+
+    def __archive(self, source: str, dest: str) -> None:
+        if not self.compress:
+            os.replace(source, dest)
+            return
+        with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+
+class NamedQueueListener(logging.handlers.QueueListener):
+    def start(self) -> None:
+        self._thread = thread = threading.Thread(target=self._monitor, name=get_thread_prefix() + 'LogWriter')
+        thread.daemon = True
+        thread.start()
+
+
 class BlossomLogger(MCDReforgedLogger):
     class NoColorFormatter(logging.Formatter):
         def formatMessage(self, record) -> str:
@@ -29,6 +106,9 @@ class BlossomLogger(MCDReforgedLogger):
 
     __inst: Optional["BlossomLogger"] = None
     __verbosity: bool = False
+    __rotation: Dict[str, Union[int, float, bool]] = dict(
+        max_bytes=1024 * 1024, rotate_interval=24 * 60 * 60, backup_count=5, compress=True
+    )
 
     __SINGLE_FILE_LOG_PATH: Optional[str] = None
     if psi is not None:
@@ -53,10 +133,27 @@ class BlossomLogger(MCDReforgedLogger):
     def get_verbose(cls) -> bool:
         return cls.__verbosity
 
+    @classmethod
+    def set_file_rotation(
+            cls,
+            max_bytes: int,
+            rotate_interval: Union[int, float],
+            backup_count: int,
+            compress: bool
+    ) -> None:
+        cls.__rotation = dict(
+            max_bytes=max_bytes, rotate_interval=rotate_interval, backup_count=backup_count, compress=compress
+        )
+        inst = cls.get_instance()
+        if inst.file_handler is not None:
+            inst.bind_single_file(inst.__bound_file)
+
     def __init__(self):
+        self.__queue_listener: Optional[logging.handlers.QueueListener] = None
+        self.__bound_file: Optional[str] = None
         if psi is not None:
             super().__init__(psi.get_self_metadata().id)
-            psi.register_event_listener(MCDRPluginEvents.PLUGIN_LOADED, lambda *args, **kwargs: self.unbind_file())
+            psi.register_event_listener(MCDRPluginEvents.PLUGIN_UNLOADED, lambda *args, **kwargs: self.unbind_file())
         else:
             super().__init__()
 
@@ -68,6 +165,13 @@ class BlossomLogger(MCDReforgedLogger):
             self.removeHandler(self.file_handler)
             self.file_handler.close()
             self.file_handler = None
+        if self.__queue_listener is not None:
+            # Stopping the listener flushes all queued records before the writer thread exits
+            self.__queue_listener.stop()
+            for handler in self.__queue_listener.handlers:
+                handler.close()
+            self.__queue_listener = None
+        self.__bound_file = None
 
     def bind_single_file(self, file_name: Optional[str] = None) -> "BlossomLogger":
         if file_name is None:
@@ -76,9 +180,14 @@ class BlossomLogger(MCDReforgedLogger):
             file_name = os.path.join(psi.get_data_folder(), self.__SINGLE_FILE_LOG_PATH)
         self.unbind_file()
         ensure_dir(os.path.dirname(file_name))
-        self.file_handler = logging.FileHandler(file_name, encoding='UTF-8')
-        self.file_handler.setFormatter(self.FILE_FMT)
+        writer = CompressedRotatingFileHandler(file_name, **self.__rotation)
+        writer.setFormatter(self.FILE_FMT)
+        log_queue = queue.SimpleQueue()
+        self.__queue_listener = NamedQueueListener(log_queue, writer)
+        self.__queue_listener.start()
+        self.file_handler = logging.handlers.QueueHandler(log_queue)
         self.addHandler(self.file_handler)
+        self.__bound_file = file_name
         return self
 
 
@@ -0,0 +1,92 @@
+import logging
+import sys
+import types
+
+import pytest
+
+
+def stub_minecraft_data_api():
+    """
+    Stand-in of the minecraft data api plugin, so plugin modules can be imported outside MCDR
+    Every query behaves as if the server did not answer
+    """
+    try:
+        import minecraft_data_api
+        return
+    except ImportError:
+        pass
+
+    def no_answer(*args, **kwargs):
+        return None
+
+    module = types.ModuleType('minecraft_data_api')
+    module.get_player_coordinate = no_answer
+    module.get_player_dimension = no_answer
+    module.get_server_player_list = no_answer
+    module.get_player_info = no_answer
+    sys.modules['minecraft_data_api'] = module
+
+
+stub_minecraft_data_api()
+
+
+@pytest.fixture
+def default_config(monkeypatch):
+    """
+    Configuration with default values, installed into every loaded plugin module
+    Outside MCDR the plugin leaves its configuration unloaded, since there is no data folder to read it from
+    """
+    from lazybing_thb.storage.config import Configuration
+    cfg = Configuration.get_default()
+    for name, module in list(sys.modules.items()):
+        if (name == 'lazybing_thb' or name.startswith('lazybing_thb.')) and hasattr(module, 'config'):
+            monkeypatch.setattr(module, 'config', cfg)
+    return cfg
+
+
+class FakeMetadata:
+    id = 'lazybing_thb'
+    name = 'LazyBing THB'
+
+
+class FakeServer:
+    """
+    Minimal stand-in of the plugin server interface, for code paths that need one outside MCDR
+    """
+    def __init__(self, data_folder: str):
+        self.data_folder = data_folder
+        self.logger = logging.getLogger('lazybing_thb.tests')
+        self.told = []
+
+    def get_data_folder(self) -> str:
+        return self.data_folder
+
+    def get_self_metadata(self) -> FakeMetadata:
+        return FakeMetadata()
+
+    def is_server_startup(self) -> bool:
+        return True
+
+    def get_mcdr_language(self) -> str:
+        return 'en_us'
+
+    def get_server_information(self):
+        from mcdreforged.info_reactor.server_information import ServerInformation
+        info = ServerInformation()
+        info.version = '1.21.5'
+        return info
+
+    def tell(self, player, message) -> None:
+        self.told.append((player, message))
+
+
+@pytest.fixture
+def fake_server(tmp_path, monkeypatch):
+    """
+    FakeServer installed as the server interface of every loaded plugin module
+    """
+    server = FakeServer(str(tmp_path / 'data'))
+    for name, module in list(sys.modules.items()):
+        if (name == 'lazybing_thb' or name.startswith('lazybing_thb.')) and hasattr(module, 'psi'):
+            monkeypatch.setattr(module, 'psi', server)
+    return server
@@ -0,0 +1,19 @@
+from lazybing_thb import api
+from lazybing_thb.location import Location
+from lazybing_thb.storage.impl.home import PlayerHomeStorage
+
+
+def test_set_home_respects_max_home_count(fake_server, default_config):
+    default_config.max_home_count = 2
+    PlayerHomeStorage.resolve_dir()
+    location = Location(x=0, y=64, z=0, dim=0)
+    try:
+        assert api.set_home('Steve', 'home', location)
+        assert not api.set_home('Steve', 'home', location)
+        assert api.set_home('Steve', 'base', location)
+        assert not api.set_home('Steve', 'farm', location)
+        assert sorted(api.get_homes('Steve').keys()) == ['base', 'home']
+        assert api.remove_home('Steve', 'base')
+        assert api.set_home('Steve', 'farm', location)
+    finally:
+        PlayerHomeStorage.evict('Steve')
@@ -0,0 +1,127 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from lazybing_thb.storage import atomic
+from lazybing_thb.storage.atomic import atomic_open, write_group, TEMP_SUFFIX
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Writes half of the new content, reports it and waits to be killed before the rename
+WRITER = textwrap.dedent('''
+    import sys, time
+    sys.path.insert(0, 'tests')
+    import conftest  # stubs plugin dependencies
+    from lazybing_thb.storage import atomic
+    from lazybing_thb.storage.config import Configuration
+
+    atomic.config = Configuration.get_default()
+    with atomic.atomic_open(sys.argv[1]) as f:
+        f.write('{"half": ')
+        f.flush()
+        print('written', flush=True)
+        time.sleep(60)
+''')
+
+
+def test_killed_between_write_and_rename(tmp_path):
+    path = tmp_path / 'Steve.json'
+    path.write_text('{"old": true}', encoding='utf8')
+    proc = subprocess.Popen(
+        [sys.executable, '-c', WRITER, str(path)], cwd=PROJECT_ROOT, stdout=subprocess.PIPE, text=True
+    )
+    try:
+        assert proc.stdout.readline().strip() == 'written'
+        temp_files = [name for name in os.listdir(tmp_path) if name.endswith(TEMP_SUFFIX)]
+        assert len(temp_files) == 1
+    finally:
+        proc.kill()
+        proc.wait(10)
+        proc.stdout.close()
+    assert path.read_text(encoding='utf8') == '{"old": true}'
+
+
+def test_group_renames_on_commit(tmp_path, default_config):
+    path = tmp_path / 'Steve.json'
+    path.write_text('old', encoding='utf8')
+    with write_group() as group:
+        with atomic_open(str(path)) as f:
+            f.write('new')
+        committed = []
+        group.after_commit(lambda: committed.append(path.read_text(encoding='utf8')))
+        assert group.is_pending(str(path))
+        assert path.read_text(encoding='utf8') == 'old'
+    assert committed == ['new']
+    assert path.read_text(encoding='utf8') == 'new'
+
+
+def test_group_abort_keeps_old_file(tmp_path, default_config):
+    path = tmp_path / 'Steve.json'
+    path.write_text('old', encoding='utf8')
+    with pytest.raises(RuntimeError):
+        with write_group():
+            with atomic_open(str(path)) as f:
+                f.write('new')
+            raise RuntimeError()
+    assert path.read_text(encoding='utf8') == 'old'
+    assert os.listdir(tmp_path) == ['Steve.json']
+
+
+def test_group_failing_rename_drops_rest(tmp_path, default_config, monkeypatch):
+    real_replace, replaced = os.replace, []
+
+    def failing_replace(src, dst):
+        if len(replaced) == 1:
+            raise OSError('Disk full')
+        real_replace(src, dst)
+        replaced.append(dst)
+
+    monkeypatch.setattr(atomic.os, 'replace', failing_replace)
+    committed = []
+    with pytest.raises(OSError, match='Disk full'):
+        with write_group():
+            for name in ('Alex', 'Steve'):
+                path = str(tmp_path / f'{name}.json')
+                with atomic_open(path) as f:
+                    f.write(name)
+                atomic.after_commit(lambda p=path: committed.append(p), path)
+    # First file is in place and its callback ran, the second one is dropped with its temp file
+    assert committed == replaced == [str(tmp_path / 'Alex.json')]
+    assert os.listdir(tmp_path) == ['Alex.json']
+
+
+def test_group_syncs_each_folder_once(tmp_path, default_config, monkeypatch):
+    synced_files, synced_folders, synced_file_systems = [], [], []
+    monkeypatch.setattr(atomic.os, 'fsync', synced_files.append)
+    monkeypatch.setattr(atomic, 'fsync_dir', synced_folders.append)
+    monkeypatch.setattr(atomic, 'sync_filesystem', synced_file_systems.append)
+    with write_group():
+        for index in range(20):
+            with atomic_open(str(tmp_path / f'Player{index}.json')) as f:
+                f.write('{}')
+    assert len(synced_files) == 20
+    assert synced_folders == [str(tmp_path)]
+    assert synced_file_systems == []
+    assert len(os.listdir(tmp_path)) == 20
+
+
+@pytest.mark.skipif(not atomic.can_sync_filesystem(), reason='syncfs is not available')
+def test_group_syncs_file_system_once(tmp_path, default_config, monkeypatch):
+    default_config.atomic_write.sync_file_system = True
+    synced_files, synced_file_systems = [], []
+    monkeypatch.setattr(atomic.os, 'fsync', synced_files.append)
+    real_sync_filesystem = atomic.sync_filesystem
+    monkeypatch.setattr(atomic, 'sync_filesystem', lambda folder: (
+        synced_file_systems.append(folder), real_sync_filesystem(folder)
+    ))
+    with write_group():
+        for index in range(20):
+            with atomic_open(str(tmp_path / f'Player{index}.json')) as f:
+                f.write('{}')
+    assert synced_files == []
+    # Once for the temp files before renaming, once for the renames
+    assert synced_file_systems == [str(tmp_path), str(tmp_path)]
+    assert len(os.listdir(tmp_path)) == 20
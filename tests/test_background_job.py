@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from lazybing_thb.command_batcher import BatchQueue
+from lazybing_thb.storage.background_job import BackgroundJob
+
+
+class CountingJob(BackgroundJob):
+    thread_name = 'CountingJob'
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.seen = []
+
+    def run(self):
+        self.started.set()
+        for item in self.throttled(range(1000), batch_size=10, batches_per_second=100):
+            self.seen.append(item)
+
+
+class RecordingQueue(BatchQueue[str]):
+    thread_name = 'RecordingQueue'
+
+    def __init__(self, window: float):
+        super().__init__()
+        self.window = window
+        self.batches = []
+
+    def get_window(self) -> float:
+        return self.window
+
+    def get_max_size(self) -> int:
+        return 2
+
+    def flush_batch(self, batch):
+        self.batches.append(batch)
+
+
+def test_job_stops_between_items(fake_server):
+    job = CountingJob()
+    job.start()
+    assert job.started.wait(5)
+    job.stop()
+    assert job.wait(0)
+    assert len(job.seen) < 1000
+    assert job.seen == list(range(len(job.seen)))
+
+
+def test_job_started_once(fake_server):
+    job = CountingJob()
+    job.start()
+    job.start()
+    job.stop()
+    assert job.started.wait(5)
+
+
+def test_batch_queue_flushes_in_order_once(fake_server):
+    queue = RecordingQueue(window=60)
+    for item in ('a', 'b', 'a', 'c'):
+        queue.put(item)
+    queue.stop()
+    assert [item for batch in queue.batches for item in batch] == ['a', 'b', 'c']
+    assert all(len(batch) <= 2 for batch in queue.batches)
+
+
+def test_batch_queue_without_window(fake_server):
+    queue = RecordingQueue(window=0)
+    queue.put('a')
+    assert queue.batches == [['a']]
@@ -0,0 +1,18 @@
+from lazybing_thb.storage.impl.home import PlayerHomeStorage
+
+
+def test_borrowed_instance_released(fake_server, default_config):
+    storage = PlayerHomeStorage.borrow_instance('Steve')
+    assert storage is not None
+    assert PlayerHomeStorage.borrow_instance('Steve') is None
+    assert PlayerHomeStorage.release_borrowed(storage)
+    assert 'Steve' not in PlayerHomeStorage.get_cached_players()
+
+
+def test_borrowed_instance_kept_for_joined_player(fake_server, default_config):
+    storage = PlayerHomeStorage.borrow_instance('Alex')
+    # Player joins while a background job works on the file
+    assert PlayerHomeStorage.get_instance('Alex') is storage
+    assert not PlayerHomeStorage.release_borrowed(storage)
+    assert PlayerHomeStorage.get_instance('Alex') is storage
+    PlayerHomeStorage.evict('Alex')
@@ -0,0 +1,150 @@
+import random
+import threading
+import time
+
+from lazybing_thb.census import ResourceCensus
+from lazybing_thb.location import Location
+from lazybing_thb.player_list import PlayerOnlineList
+from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
+from lazybing_thb.storage.impl.history import TeleportHistory
+from lazybing_thb.storage.impl.home import PlayerHomeStorage
+from lazybing_thb.storage.impl.request import TeleportRequest
+from lazybing_thb.storage.sweeper import HistorySweeper
+from lazybing_thb.timer import RequestQueue
+from lazybing_thb.transport import Transport, set_transport_override
+from lazybing_thb.utils import get_thread_prefix
+
+PLAYERS = [f'Player{index}' for index in range(40)]
+SESSIONS = 1200
+# Request expiry, history retention and the census, sweeper and reconciler intervals are shortened
+# from minutes and hours to a few ticks, so that each of them passes many times during the run
+TICK = 0.02  # seconds
+
+
+class OnlineListTransport(Transport):
+    """
+    Server reporting the players marked online by the test, join and leave events are never sent
+    """
+    def __init__(self):
+        self.online = []
+
+    def get_player_list(self):
+        online = list(self.online)
+        return len(online), len(PLAYERS), online
+
+    def get_coordinate(self, player: str):
+        raise NotImplementedError
+
+    def get_dimension(self, player: str):
+        raise NotImplementedError
+
+    def execute(self, command: str) -> None:
+        raise NotImplementedError
+
+
+def wait_for(condition, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def play_session(rnd: random.Random, player: str, online: list) -> None:
+    AbstractPlayerStorage.preload_player(player)
+    homes = PlayerHomeStorage.get_instance(player)
+    home_name = f'home{rnd.randrange(3)}'
+    if not homes.set_home(home_name, Location(x=rnd.randrange(1000), y=64, z=rnd.randrange(1000), dim=0)):
+        homes.remove_home(home_name)
+    TeleportHistory.bulk_set_locations({player: Location(x=0, y=64, z=0, dim=0)})
+    if len(online) > 0:
+        target = rnd.choice(online)
+        if RequestQueue.get_queue(target).enqueue(player) is not None and rnd.random() < 0.5:
+            RequestQueue.get_queue(target).pop(player)
+    AbstractPlayerStorage.release_player(player)
+
+
+def test_resources_bounded(tmp_path, fake_server, default_config, monkeypatch):
+    default_config.shared_storage.enabled = True
+    default_config.shared_storage.folder = str(tmp_path / 'shared')
+    default_config.history_writer.window = 0
+    # Requests left in the queue expire, the rest are answered
+    default_config.request_expire_time = 2 * TICK
+    default_config.history_sweeper.retention = 5 * TICK / (24 * 60 * 60)
+    default_config.history_sweeper.interval = TICK / (60 * 60)
+    default_config.history_sweeper.batches_per_second = 0
+    default_config.census.interval = TICK / 60
+    default_config.census.storage_instances = len(PLAYERS)
+    default_config.census.records = len(PLAYERS) * default_config.max_home_count
+    default_config.player_list_reconcile.min_interval = TICK
+    default_config.player_list_reconcile.max_interval = 4 * TICK
+    for storage_cls in (TeleportHistory, PlayerHomeStorage, TeleportRequest):
+        storage_cls.resolve_dir()
+
+    census, sweeper = ResourceCensus.get_instance(), HistorySweeper.get_instance()
+    player_list = PlayerOnlineList.get_instance()
+    census_runs = []
+    real_check = census.check
+    monkeypatch.setattr(census, 'check', lambda counts: (census_runs.append(counts), real_check(counts)))
+    transport = OnlineListTransport()
+    baseline = ResourceCensus.take()
+    set_transport_override(transport)
+    census.start()
+    sweeper.start()
+    player_list.start_reconciler()
+    try:
+        rnd = random.Random(0)
+        for session in range(SESSIONS):
+            player = PLAYERS[session % len(PLAYERS)]
+            online = [item for item in PLAYERS[:session % len(PLAYERS)] if item != player]
+            transport.online = online
+            play_session(rnd, player, online)
+
+        # Joins and leaves are never sent as events, the reconciler picks them up from the server
+        transport.online = PLAYERS[:10]
+        assert wait_for(lambda: sorted(player_list.players) == sorted(PLAYERS[:10]))
+        transport.online = []
+        assert wait_for(lambda: player_list.amount == 0)
+        # Request timers end once their requests expire
+        assert wait_for(lambda: len(RequestQueue.get_queues()) == 0)
+        assert wait_for(lambda: ResourceCensus.take()['storage.TeleportHistory'] == 0)
+        # Histories of players gone are swept once the retention has passed
+        assert wait_for(lambda: next(TeleportHistory.iter_player_files(), None) is None)
+    finally:
+        player_list.stop_reconciler()
+        sweeper.stop()
+        census.stop()
+        set_transport_override(None)
+
+    assert wait_for(lambda: ResourceCensus.take()['threads'] <= baseline['threads']), \
+        [thread.name for thread in threading.enumerate() if thread.name.startswith(get_thread_prefix())]
+    # The census ran through the whole soak and never saw storage instances pass their threshold
+    assert len(census_runs) > 10
+    assert not census.is_exceeded('storage.TeleportHistory')
+    assert not census.is_exceeded('storage.PlayerHomeStorage')
+    assert not census.is_exceeded('records.PlayerHomeStorage')
+    assert not census.is_exceeded('queued_histories')
+
+    counts = ResourceCensus.take()
+    assert counts['storage.TeleportHistory'] == baseline['storage.TeleportHistory']
+    assert counts['storage.PlayerHomeStorage'] == baseline['storage.PlayerHomeStorage']
+    assert counts['records.TeleportHistory'] == baseline['records.TeleportHistory']
+    assert counts['records.PlayerHomeStorage'] == baseline['records.PlayerHomeStorage']
+    # Request storages are kept per target, bounded by the amount of distinct players
+    assert counts['storage.TeleportRequest'] <= len(PLAYERS)
+    assert counts['pending_requests'] == 0
+    assert counts['queued_histories'] == 0
+    assert counts['log_handlers'] == baseline['log_handlers']
+    if 'open_files' in baseline:
+        assert counts['open_files'] <= baseline['open_files'] + 2
+
+
+def test_queue_growth_warned(default_config):
+    census = ResourceCensus()
+    threshold = default_config.census.queued_histories
+    census.check({'queued_histories': threshold})
+    assert not census.is_exceeded('queued_histories')
+    census.check({'queued_histories': threshold + 1, 'records.PlayerHomeStorage': default_config.census.records + 1})
+    assert census.is_exceeded('queued_histories')
+    assert census.is_exceeded('records.PlayerHomeStorage')
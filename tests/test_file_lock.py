@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from lazybing_thb.storage.abstract_player_storage import AbstractPlayerStorage
+from lazybing_thb.storage.file_lock import InterProcessLock
+
+
+class SharedStorage(AbstractPlayerStorage):
+    shareable = True
+    root = None
+
+    @classmethod
+    def get_folder_name(cls):
+        return 'shared'
+
+    @classmethod
+    def get_storage_root(cls):
+        return cls.root
+
+
+def run_with_timeout(func, timeout: float = 5) -> bool:
+    """
+    :return: If func finished within timeout
+    """
+    thread = threading.Thread(target=func, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+def test_nested_acquire(tmp_path):
+    lock = InterProcessLock(str(tmp_path / '.lock'))
+
+    def nested():
+        with lock:
+            with lock:
+                pass
+    assert run_with_timeout(nested)
+
+
+def test_released_by_outermost_release(tmp_path):
+    lock = InterProcessLock(str(tmp_path / '.lock'))
+    acquired = threading.Event()
+
+    def other():
+        with lock:
+            acquired.set()
+
+    with lock:
+        with lock:
+            pass
+        thread = threading.Thread(target=other, daemon=True)
+        thread.start()
+        # Still held by the outer acquire
+        assert not acquired.wait(0.2)
+    assert acquired.wait(5)
+    thread.join(5)
+
+
+def test_nested_transactions(tmp_path, default_config):
+    default_config.shared_storage.enabled = True
+    SharedStorage.root = str(tmp_path)
+    SharedStorage.resolve_dir()
+    storage = SharedStorage.get_instance('Steve')
+
+    def nested():
+        with storage.transaction():
+            with storage.transaction():
+                pass
+    try:
+        assert run_with_timeout(nested)
+    finally:
+        SharedStorage.evict('Steve')
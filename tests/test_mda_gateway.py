@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+from lazybing_thb.mda_gateway import MDAGateway, MDAUnavailableError
+
+
+def offline_player(*, timeout=None):
+    # Server refused the query at once, as for a player who left
+    return None
+
+
+def malformed_answer(*, timeout=None):
+    raise ValueError('Unexpected answer')
+
+
+def timed_out(*, timeout=None):
+    time.sleep(timeout)
+    return None
+
+
+def test_refused_queries_keep_breaker_closed(default_config):
+    gateway = MDAGateway()
+    for func in (offline_player, malformed_answer) * default_config.mda_gateway.failure_threshold:
+        with pytest.raises(MDAUnavailableError):
+            gateway.query(func)
+    assert not gateway.is_open
+
+
+def test_timed_out_queries_open_breaker(default_config, monkeypatch):
+    gateway = MDAGateway()
+    monkeypatch.setattr(gateway, 'get_timeout', lambda: 0.01)
+    for _ in range(default_config.mda_gateway.failure_threshold):
+        with pytest.raises(MDAUnavailableError):
+            gateway.query(timed_out)
+    assert gateway.is_open
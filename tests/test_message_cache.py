@@ -0,0 +1,65 @@
+from mcdreforged.api.rtext import RText, RTextList, RColor, RAction
+from mcdreforged.handler.impl.vanilla_handler import VanillaHandler
+
+from lazybing_thb.command_batcher import CommandBatcher
+from lazybing_thb.message_cache import MessageTemplateCache
+
+
+class StubHandler(VanillaHandler):
+    """
+    Vanilla handler counting the commands it builds
+    """
+    def __init__(self):
+        super().__init__()
+        self.built = 0
+
+    def get_send_message_command(self, target, message, server_information):
+        self.built += 1
+        return super().get_send_message_command(target, message, server_information)
+
+
+def build_home_message(name, count) -> RTextList:
+    return RTextList(
+        RText('Home '),
+        RText(name, RColor.gold).h('Click to teleport').c(RAction.run_command, '!!home'),
+        RText(f' ({count} in total)')
+    )
+
+
+def build_length_message(name) -> RText:
+    # Argument is not used as plain text, so the message can't be cached
+    return RText(f'Name has {len(name)} characters')
+
+
+def install(monkeypatch, handler):
+    sent = []
+    monkeypatch.setattr(MessageTemplateCache, 'find_server_handler', staticmethod(lambda: handler))
+    monkeypatch.setattr(CommandBatcher.get_instance(), 'submit', sent.append)
+    return sent
+
+
+def test_filled_command_matches_handler(fake_server, default_config, monkeypatch):
+    handler = StubHandler()
+    sent = install(monkeypatch, handler)
+    cache = MessageTemplateCache()
+    sends = [('Steve', 'base', 1), ('Alex', 'say "hi" \\ éè', 2), ('Notch', '主城', 3)]
+    for player, name, count in sends:
+        cache.tell(player, 'home', build_home_message, name, count)
+    info = fake_server.get_server_information()
+    assert sent == [
+        handler.get_send_message_command(player, build_home_message(name, count), info) for player, name, count in sends
+    ]
+    assert cache.get_size()[0] == 1
+
+
+def test_uncacheable_message_built_once(fake_server, default_config, monkeypatch):
+    handler = StubHandler()
+    sent = install(monkeypatch, handler)
+    cache = MessageTemplateCache()
+    for name in ('Steve', 'Alex', 'Notch'):
+        cache.tell(name, 'length', build_length_message, name)
+    assert sent == []
+    assert [player for player, _ in fake_server.told] == ['Steve', 'Alex', 'Notch']
+    # Tried once with sentinels, then remembered as not cacheable
+    assert handler.built == 1
+    assert cache.get_size() == (0, 0)
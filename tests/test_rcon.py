@@ -0,0 +1,147 @@
+import socket
+import struct
+import threading
+from concurrent.futures import wait
+
+import pytest
+
+from lazybing_thb.rcon import RconClient, RconError
+
+PASSWORD = 'secret'
+
+
+class FakeRconServer:
+    """
+    RCON server answering "echo <text>" with the text, holding "hold" commands until two are queued
+    and answering those in reverse order, and never answering "ignore"
+    """
+    def __init__(self):
+        self.__server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__server.bind(('127.0.0.1', 0))
+        self.__server.listen()
+        self.port = self.__server.getsockname()[1]
+        self.connections = []
+        self.logins = 0
+        self.__thread = threading.Thread(target=self.__accept_loop, daemon=True)
+        self.__thread.start()
+
+    @staticmethod
+    def __receive_exact(conn: socket.socket, length: int) -> bytes:
+        data = b''
+        while len(data) < length:
+            chunk = conn.recv(length - len(data))
+            if len(chunk) == 0:
+                raise ConnectionError()
+            data += chunk
+        return data
+
+    @staticmethod
+    def __send(conn: socket.socket, request_id: int, payload: str):
+        body = struct.pack('<ii', request_id, RconClient.TYPE_RESPONSE) + payload.encode('utf8') + b'\x00\x00'
+        conn.sendall(struct.pack('<i', len(body)) + body)
+
+    def __accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.__server.accept()
+            except OSError:
+                return
+            self.connections.append(conn)
+            threading.Thread(target=self.__serve, args=(conn,), daemon=True).start()
+
+    def __serve(self, conn: socket.socket):
+        held = []
+        try:
+            while True:
+                length = struct.unpack('<i', self.__receive_exact(conn, 4))[0]
+                data = self.__receive_exact(conn, length)
+                request_id, packet_type = struct.unpack('<ii', data[:8])
+                payload = data[8:-2].decode('utf8')
+                if packet_type == RconClient.TYPE_LOGIN:
+                    self.logins += 1
+                    self.__send(conn, request_id if payload == PASSWORD else -1, '')
+                elif payload.startswith('echo '):
+                    self.__send(conn, request_id, payload[5:])
+                elif payload.startswith('hold '):
+                    held.append((request_id, payload[5:]))
+                    if len(held) == 2:
+                        for held_id, text in reversed(held):
+                            self.__send(conn, held_id, text)
+                        held.clear()
+        except (OSError, ConnectionError, struct.error):
+            conn.close()
+
+    def drop_connections(self):
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+        self.connections.clear()
+
+    def close(self):
+        self.drop_connections()
+        self.__server.close()
+
+
+@pytest.fixture
+def server():
+    server = FakeRconServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client(server, fake_server):
+    client = RconClient('127.0.0.1', server.port, PASSWORD, reconnect_interval=0)
+    yield client
+    client.close()
+
+
+def test_authentication(server, fake_server):
+    client = RconClient('127.0.0.1', server.port, 'wrong', reconnect_interval=0)
+    with pytest.raises(RconError, match='authentication failed'):
+        client.connect()
+    assert not client.is_connected
+
+
+def test_query(client):
+    assert client.query('echo hello', timeout=5) == 'hello'
+    assert client.is_connected
+
+
+def test_pipelined_responses_matched_by_id(client):
+    first = client.submit('hold first')
+    second = client.submit('hold second')
+    # Answered in reverse order
+    assert second.result(timeout=5) == 'second'
+    assert first.result(timeout=5) == 'first'
+
+
+def test_timeout_discards_pending(client):
+    with pytest.raises(RconError, match='timed out'):
+        client.query('ignore', timeout=0.2)
+    future = client.submit('ignore')
+    client.discard(future)
+    assert len(client._RconClient__pending) == 0
+
+
+def test_close_stops_receiver(server, fake_server):
+    client = RconClient('127.0.0.1', server.port, PASSWORD, reconnect_interval=0)
+    assert client.query('echo hello', timeout=5) == 'hello'
+    client.close()
+    assert not client.is_connected
+    assert not any(thread.name.endswith('RconReceiver') for thread in threading.enumerate())
+
+
+def test_reconnect(server, client):
+    assert client.query('echo before', timeout=5) == 'before'
+    pending = client.submit('ignore')
+    server.drop_connections()
+    wait([pending], timeout=5)
+    with pytest.raises(RconError, match='connection lost'):
+        pending.result()
+    assert not client.is_connected
+    assert client.query('echo after', timeout=5) == 'after'
+    assert server.logins == 2